@@ -0,0 +1,274 @@
+"""
+Vectorized analytics engine for transaction tables
+
+Turns a list of transaction records into columns once, then computes
+totals, date extents, monthly and weekday breakdowns, sender frequencies
+and the top-N transactions in a single pass. NumPy is used when it is
+installed; otherwise a pure-Python single-pass implementation is used.
+The output matches helpers.analyze_incoming_money_transactions. Whole
+tables are analyzed inside SQLite instead (sql_analytics.py).
+"""
+
+import heapq
+import logging
+from collections import Counter
+from datetime import date, datetime
+
+# NumPy is optional; without it the pure-Python single pass is used
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_TRANSACTIONS = 5
+TOP_SENDERS = 10
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DATE_LENGTH = len('YYYY-MM-DD HH:MM:SS')
+
+# Candidate sender columns, in order of preference
+SENDER_COLUMNS = ('sender', 'sender_name')
+
+
+class TransactionColumns:
+    """
+    Columnar view of a set of transactions.
+
+    ``dates``, ``amounts``, ``keyed_amounts``, ``senders`` and
+    ``balances`` are parallel lists. ``keyed_amounts`` holds the amount
+    used for breakdowns and ranking, which can differ from ``amounts``
+    for mixed record shapes. ``fetch_rows(indexes)`` returns the full
+    records at the given positions.
+    """
+
+    def __init__(self, dates, amounts, keyed_amounts, senders, balances, fetch_rows):
+        self.dates = dates
+        self.amounts = amounts
+        self.keyed_amounts = keyed_amounts
+        self.senders = senders
+        self.balances = balances
+        self.fetch_rows = fetch_rows
+
+    def __len__(self):
+        return len(self.dates)
+
+
+def columns_from_records(data):
+    """Build columns from a list of transaction dicts."""
+    amount_key = 'amount_received' if 'amount_received' in data[0] else 'amount'
+    dates = [item.get('date') or '' for item in data]
+    amounts = [item.get('amount_received', item.get('amount', 0)) for item in data]
+    keyed_amounts = [item.get(amount_key, 0) for item in data]
+    if keyed_amounts == amounts:
+        keyed_amounts = amounts
+    senders = [item.get('sender', item.get('sender_name', 'Unknown')) for item in data]
+    balances = [item.get('new_balance') for item in data]
+    return TransactionColumns(
+        dates, amounts, keyed_amounts, senders, balances,
+        lambda indexes: [data[i] for i in indexes])
+
+
+def _is_valid_time(date_str):
+    return (
+        len(date_str) == DATE_LENGTH
+        and date_str[10] in ' T'
+        and date_str[13] == ':' and date_str[16] == ':'
+        and date_str[11:13].isdigit() and date_str[14:16].isdigit() and date_str[17:19].isdigit()
+        and int(date_str[11:13]) < 24 and int(date_str[14:16]) < 60 and int(date_str[17:19]) < 62
+    )
+
+
+def _python_breakdowns(columns):
+    """Single-pass date extents and monthly/weekday breakdowns."""
+    weekday_cache = {}
+    monthly = {}
+    daily = {}
+    earliest = latest = None
+    invalid = 0
+
+    for date_str, amount in zip(columns.dates, columns.keyed_amounts):
+        day = date_str[:10]
+        weekday = weekday_cache.get(day)
+        if weekday is None:
+            try:
+                weekday = WEEKDAYS[date.fromisoformat(day).weekday()] if len(day) == 10 else ''
+            except ValueError:
+                weekday = ''
+            weekday_cache[day] = weekday
+        if not weekday or not _is_valid_time(date_str):
+            invalid += 1
+            continue
+
+        normalized = f"{day} {date_str[11:]}"
+        if earliest is None or normalized < earliest:
+            earliest = normalized
+        if latest is None or normalized > latest:
+            latest = normalized
+
+        month = monthly.setdefault(date_str[:7], {'count': 0, 'amount': 0})
+        month['count'] += 1
+        month['amount'] += amount
+        weekday_totals = daily.setdefault(weekday, {'count': 0, 'amount': 0})
+        weekday_totals['count'] += 1
+        weekday_totals['amount'] += amount
+
+    return earliest, latest, monthly, daily, invalid
+
+
+def _days_from_civil(year, month, day):
+    """Days since 1970-01-01 for proleptic Gregorian dates (vectorized)."""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def _parse_dates_numpy(dates):
+    """
+    Parse ``YYYY-MM-DD HH:MM:SS`` / ``YYYY-MM-DDTHH:MM:SS`` strings with
+    integer arithmetic on their bytes. Returns the validity mask and the
+    integer date parts.
+    """
+    count = len(dates)
+    lengths = np.fromiter(map(len, dates), dtype=np.int64, count=count)
+    # Non-ASCII strings are never valid dates; blank them before encoding
+    try:
+        raw = np.array(dates, dtype=f'S{DATE_LENGTH}')
+    except UnicodeEncodeError:
+        raw = np.array([d if d.isascii() else '' for d in dates], dtype=f'S{DATE_LENGTH}')
+    chars = raw.view(np.uint8).reshape(count, DATE_LENGTH)
+    digits = chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]] - ord('0')
+
+    valid = lengths == DATE_LENGTH
+    valid &= (digits <= 9).all(axis=1)
+    valid &= (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-'))
+    valid &= (chars[:, 10] == ord(' ')) | (chars[:, 10] == ord('T'))
+    valid &= (chars[:, 13] == ord(':')) & (chars[:, 16] == ord(':'))
+
+    digits = digits.astype(np.int32)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 8] * 10 + digits[:, 9]
+    minute = digits[:, 10] * 10 + digits[:, 11]
+    second = digits[:, 12] * 10 + digits[:, 13]
+
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)]
+    month_days = month_days + ((month == 2) & leap)
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    valid &= (hour < 24) & (minute < 60) & (second < 62)
+    return valid, year, month, day, hour, minute, second
+
+
+def _numpy_breakdowns(columns):
+    """Vectorized date extents and monthly/weekday breakdowns."""
+    valid, year, month, day, hour, minute, second = _parse_dates_numpy(columns.dates)
+    invalid = int(len(valid) - valid.sum())
+    if not valid.any():
+        return None, None, {}, {}, invalid
+
+    indexes = np.flatnonzero(valid)
+    year, month, day = year[indexes], month[indexes], day[indexes]
+    amounts = np.asarray(columns.keyed_amounts)[indexes]
+
+    days = _days_from_civil(year.astype(np.int64), month, day)
+    seconds = days * 86400 + hour[indexes] * 3600 + minute[indexes] * 60 + second[indexes]
+    earliest = columns.dates[indexes[seconds.argmin()]]
+    latest = columns.dates[indexes[seconds.argmax()]]
+
+    month_keys = year * 12 + (month - 1)
+    first_month = month_keys.min()
+    month_index = month_keys - first_month
+    month_counts = np.bincount(month_index)
+    month_amounts = np.bincount(month_index, weights=amounts)
+
+    # 1970-01-01 was a Thursday, so shift by 3 to make Monday == 0
+    weekday_index = (days + 3) % 7
+    weekday_counts = np.bincount(weekday_index, minlength=7)
+    weekday_amounts = np.bincount(weekday_index, weights=amounts, minlength=7)
+
+    as_number = int if np.issubdtype(amounts.dtype, np.integer) else float
+    monthly = {}
+    for offset in np.flatnonzero(month_counts):
+        key = int(first_month + offset)
+        monthly[f"{key // 12:04d}-{key % 12 + 1:02d}"] = {
+            'count': int(month_counts[offset]),
+            'amount': as_number(month_amounts[offset])
+        }
+    daily = {
+        WEEKDAYS[i]: {'count': int(weekday_counts[i]), 'amount': as_number(weekday_amounts[i])}
+        for i in range(7) if weekday_counts[i]
+    }
+    return earliest.replace('T', ' '), latest.replace('T', ' '), monthly, daily, invalid
+
+
+def _top_indexes(amounts, n):
+    """
+    Positions of the ``n`` largest amounts, largest first, ties in input
+    order (same result as a stable descending sort).
+    """
+    if np is not None and len(amounts) > n:
+        values = np.asarray(amounts)
+        if values.dtype != object:
+            threshold = np.partition(values, len(values) - n)[len(values) - n]
+            candidates = np.flatnonzero(values >= threshold)
+            ordered = candidates[np.argsort(-values[candidates], kind='stable')]
+            return [int(i) for i in ordered[:n]]
+    return heapq.nlargest(n, range(len(amounts)), key=lambda i: (amounts[i], -i))
+
+
+def _use_numpy(columns):
+    if np is None:
+        return False
+    return np.asarray(columns.keyed_amounts).dtype.kind in 'iuf'
+
+
+def analyze_columns(columns):
+    """
+    Analyze columnar transactions; see helpers.analyze_incoming_money_transactions
+    for the output schema.
+    """
+    if not columns:
+        return {'error': 'No data provided'}
+
+    total_transactions = len(columns)
+    if _use_numpy(columns) and np.asarray(columns.amounts).dtype.kind in 'iuf':
+        total_amount_received = np.asarray(columns.amounts).sum().item()
+    else:
+        total_amount_received = sum(columns.amounts)
+
+    if _use_numpy(columns):
+        earliest, latest, monthly, daily, invalid = _numpy_breakdowns(columns)
+    else:
+        earliest, latest, monthly, daily, invalid = _python_breakdowns(columns)
+    if invalid:
+        logging.warning(f"Skipped {invalid} transactions with an invalid date format")
+
+    senders = Counter(columns.senders)
+    largest_transactions = columns.fetch_rows(_top_indexes(columns.keyed_amounts, TOP_TRANSACTIONS))
+
+    results = {
+        'total_transactions': total_transactions,
+        'total_amount_received': total_amount_received,
+        'average_amount': round(total_amount_received / total_transactions, 2) if total_transactions > 0 else 0,
+        'final_balance': columns.balances[-1],
+        'earliest_transaction_date': earliest,
+        'latest_transaction_date': latest,
+        'unique_senders': len(senders),
+        'transactions_per_sender': dict(senders.most_common(TOP_SENDERS)),
+        'largest_transactions': largest_transactions,
+        'monthly_breakdown': monthly,
+        'daily_patterns': daily,
+        'analysis_timestamp': datetime.now().isoformat()
+    }
+    return results
+
+
+def analyze_transactions(data):
+    """Analyze a list of transaction dicts in one pass over columnar data."""
+    if not data:
+        return {'error': 'No data provided'}
+    return analyze_columns(columns_from_records(data))
+
@@ -0,0 +1,335 @@
+"""
+Streaming anomaly detection for ingested transactions
+
+Keeps running mean and variance (Welford's method) of amounts per
+category and per counterparty, of fee-to-amount ratios per category, and
+exponentially decaying transaction rates per counterparty (all stored,
+so scoring resumes where the last ingest stopped). Every new
+transaction is scored against those in O(1) before the statistics are
+updated; flagged transactions are buffered and written to
+``anomaly_alerts`` when the ingest observer is flushed.
+
+Re-score all existing rows from scratch with:
+
+    python anomaly.py
+"""
+
+import json
+import logging
+import math
+import sqlite3
+from datetime import datetime
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES
+from counterparties import AMOUNT_COLUMNS, COUNTERPARTY_COLUMNS, normalize_name
+
+Z_THRESHOLD = 4.0
+MIN_CATEGORY_SAMPLES = 30
+MIN_COUNTERPARTY_SAMPLES = 10
+# Decay constant (seconds) and threshold for the per-counterparty burst rate
+BURST_DECAY_SECONDS = 600
+BURST_THRESHOLD = 5.0
+DEFAULT_ALERTS = 50
+MAX_ALERTS = 500
+
+
+class RunningStats:
+    """Welford's online mean and variance."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def stddev(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def zscore(self, value):
+        deviation = self.stddev()
+        return (value - self.mean) / deviation if deviation > 0 else 0.0
+
+
+class DecayingRate:
+    """Event count with exponential decay, i.e. a smoothed recent burst size."""
+
+    __slots__ = ('value', 'last_time')
+
+    def __init__(self):
+        self.value = 0.0
+        self.last_time = None
+
+    def hit(self, timestamp):
+        if self.last_time is not None and timestamp > self.last_time:
+            self.value *= math.exp((self.last_time - timestamp) / BURST_DECAY_SECONDS)
+        if self.last_time is None or timestamp > self.last_time:
+            self.last_time = timestamp
+        self.value += 1
+        return self.value
+
+    def merge(self, other):
+        """Fold in a rate counted over other events, decayed to the later of the two times."""
+        if other.last_time is None:
+            return self
+        if self.last_time is None:
+            self.value, self.last_time = other.value, other.last_time
+            return self
+        latest = max(self.last_time, other.last_time)
+        self.value = (self.value * math.exp((self.last_time - latest) / BURST_DECAY_SECONDS)
+                      + other.value * math.exp((other.last_time - latest) / BURST_DECAY_SECONDS))
+        self.last_time = latest
+        return self
+
+
+def ensure_anomaly_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS anomaly_stats (
+            key TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS anomaly_rates (
+            table_name TEXT NOT NULL,
+            counterparty TEXT NOT NULL,
+            value REAL NOT NULL,
+            last_time REAL NOT NULL,
+            PRIMARY KEY (table_name, counterparty)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS anomaly_alerts (
+            id INTEGER PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_id INTEGER,
+            transaction_id TEXT,
+            date TEXT,
+            kind TEXT NOT NULL,
+            score REAL NOT NULL,
+            amount REAL,
+            detail TEXT,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_anomaly_alerts_date ON anomaly_alerts (date);
+    """)
+
+
+def _timestamp(date):
+    try:
+        return datetime.fromisoformat(str(date)[:19]).timestamp()
+    except ValueError:
+        return None
+
+
+class AnomalyDetector:
+    """
+    Ingest observer that scores each record against the running
+    statistics for its category and counterparty.
+    """
+
+    def __init__(self, z_threshold=Z_THRESHOLD):
+        self.z_threshold = z_threshold
+        self._stats = {}
+        self._primed = False
+        self._rates = {}
+        self._alerts = []
+        # Keys updated since the last flush; only these are written back
+        self._dirty_stats = set()
+        self._dirty_rates = set()
+
+    def prime(self, conn):
+        """Load the stored statistics so scoring continues where the last run stopped."""
+        ensure_anomaly_tables(conn)
+        stored = {
+            key: RunningStats(count, mean, m2)
+            for key, count, mean, m2 in conn.execute("SELECT key, count, mean, m2 FROM anomaly_stats")
+        }
+        # Fold in anything observed before priming (parallel Welford merge)
+        for key, stats in self._stats.items():
+            base = stored.get(key)
+            if base is None:
+                stored[key] = stats
+                continue
+            count = base.count + stats.count
+            delta = stats.mean - base.mean
+            base.m2 += stats.m2 + delta * delta * base.count * stats.count / count
+            base.mean += delta * stats.count / count
+            base.count = count
+        self._stats = stored
+
+        rates = {}
+        for table_name, counterparty, value, last_time in conn.execute(
+                "SELECT table_name, counterparty, value, last_time FROM anomaly_rates"):
+            rate = rates[(table_name, counterparty)] = DecayingRate()
+            rate.value, rate.last_time = value, last_time
+        for key, rate in self._rates.items():
+            rates[key] = rates[key].merge(rate) if key in rates else rate
+        self._rates = rates
+        self._primed = True
+
+    def _running(self, key):
+        # Every statistic looked up while observing is updated
+        self._dirty_stats.add(key)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = RunningStats()
+        return stats
+
+    def _flag(self, table_name, record, rowid, kind, score, amount, detail):
+        self._alerts.append((
+            table_name, rowid, record.get('transaction_id') or record.get('txid'),
+            record.get('date'), kind, round(score, 3), amount, json.dumps(detail),
+            datetime.now().isoformat()))
+
+    def observe(self, table_name, record, rowid=None):
+        amount = next((record.get(column) for column in AMOUNT_COLUMNS if record.get(column) is not None), None)
+        try:
+            amount = float(amount) if amount is not None else None
+        except (TypeError, ValueError):
+            amount = None
+        counterparty = next(
+            (normalize_name(record.get(column)) for column in COUNTERPARTY_COLUMNS if record.get(column)), None)
+
+        if amount is not None:
+            category = self._running(f"amount:{table_name}")
+            if category.count >= MIN_CATEGORY_SAMPLES:
+                score = category.zscore(amount)
+                if score > self.z_threshold:
+                    self._flag(table_name, record, rowid, 'large_amount', score, amount,
+                               {'mean': round(category.mean, 2), 'stddev': round(category.stddev(), 2)})
+            category.update(amount)
+
+            if counterparty:
+                personal = self._running(f"amount:{table_name}:{counterparty}")
+                if personal.count >= MIN_COUNTERPARTY_SAMPLES:
+                    score = personal.zscore(amount)
+                    if score > self.z_threshold:
+                        self._flag(table_name, record, rowid, 'unusual_for_counterparty', score, amount,
+                                   {'counterparty': counterparty, 'mean': round(personal.mean, 2),
+                                    'stddev': round(personal.stddev(), 2)})
+                personal.update(amount)
+
+            fee = record.get('fee')
+            if fee is not None and amount > 0:
+                try:
+                    ratio = float(fee) / amount
+                except (TypeError, ValueError):
+                    ratio = None
+                if ratio is not None:
+                    fees = self._running(f"fee_ratio:{table_name}")
+                    if fees.count >= MIN_CATEGORY_SAMPLES:
+                        score = fees.zscore(ratio)
+                        if score > self.z_threshold:
+                            self._flag(table_name, record, rowid, 'fee_spike', score, amount,
+                                       {'fee': fee, 'fee_ratio': round(ratio, 4),
+                                        'mean_ratio': round(fees.mean, 4)})
+                    fees.update(ratio)
+
+        if counterparty:
+            timestamp = _timestamp(record.get('date'))
+            if timestamp is not None:
+                key = (table_name, counterparty)
+                rate = self._rates.get(key)
+                if rate is None:
+                    rate = self._rates[key] = DecayingRate()
+                previous = rate.value
+                burst = rate.hit(timestamp)
+                self._dirty_rates.add(key)
+                # Flag only when the rate first crosses the threshold, not on every burst member
+                if burst >= BURST_THRESHOLD > previous:
+                    self._flag(table_name, record, rowid, 'burst', burst, amount,
+                               {'counterparty': counterparty, 'window_seconds': BURST_DECAY_SECONDS})
+
+    def flush(self, conn):
+        if not self._primed:
+            self.prime(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO anomaly_stats (key, count, mean, m2) VALUES (?, ?, ?, ?)",
+            [(key, self._stats[key].count, self._stats[key].mean, self._stats[key].m2)
+             for key in self._dirty_stats])
+        conn.executemany(
+            "INSERT OR REPLACE INTO anomaly_rates (table_name, counterparty, value, last_time) VALUES (?, ?, ?, ?)",
+            [(*key, self._rates[key].value, self._rates[key].last_time) for key in self._dirty_rates])
+        conn.executemany("""
+            INSERT INTO anomaly_alerts
+                (table_name, row_id, transaction_id, date, kind, score, amount, detail, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, self._alerts)
+        conn.commit()
+        if self._alerts:
+            logging.info(f"Recorded {len(self._alerts)} anomaly alerts")
+        self._alerts = []
+        self._dirty_stats = set()
+        self._dirty_rates = set()
+
+
+def rescan(conn, tables=None):
+    """Drop stored statistics and alerts and re-score every row in date order."""
+    tables = tables or TRANSACTION_TABLES
+    ensure_anomaly_tables(conn)
+    conn.execute("DELETE FROM anomaly_stats")
+    conn.execute("DELETE FROM anomaly_rates")
+    conn.execute("DELETE FROM anomaly_alerts")
+    conn.commit()
+
+    detector = AnomalyDetector()
+    detector.prime(conn)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    for table in tables:
+        try:
+            cursor.execute(f"SELECT rowid AS row_key, * FROM {table} ORDER BY date, rowid")
+        except sqlite3.Error as e:
+            logging.warning(f"Skipping anomaly scan for {table}: {e}")
+            continue
+        for row in cursor:
+            record = dict(row)
+            detector.observe(table, record, record.pop('row_key'))
+    detector.flush(conn)
+
+
+def get_anomalies(conn, table_name=None, kind=None, limit=DEFAULT_ALERTS):
+    """Most recent alerts, optionally for one category and/or kind."""
+    conditions, params = [], []
+    if table_name:
+        conditions.append('table_name = ?')
+        params.append(table_name)
+    if kind:
+        conditions.append('kind = ?')
+        params.append(kind)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = f"""
+    SELECT id, table_name, row_id, transaction_id, date, kind, score, amount, detail, created_at
+    FROM anomaly_alerts
+    {where}
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    """
+    return [
+        {
+            'id': row[0],
+            'table_name': row[1],
+            'rowid': row[2],
+            'transaction_id': row[3],
+            'date': row[4],
+            'kind': row[5],
+            'score': row[6],
+            'amount': row[7],
+            'detail': json.loads(row[8]) if row[8] else None,
+            'created_at': row[9]
+        }
+        for row in conn.execute(query, params + [min(limit, MAX_ALERTS)])
+    ]
+
+
+if __name__ == '__main__':
+    with sqlite3.connect(DATABASE_NAME) as conn:
+        rescan(conn)
+        total = conn.execute("SELECT COUNT(*) FROM anomaly_alerts").fetchone()[0]
+    print(f"Anomaly scan complete: {total} alerts")
@@ -1,209 +1,565 @@
+import os
 import sqlite3
-from flask import Flask, render_template, jsonify
-from helpers import get_table_summary, analyze_incoming_money_transactions
+import threading
+from pathlib import Path
+from flask import (Flask, render_template, jsonify, request, url_for, abort, has_request_context, g, send_file,
+                   make_response)
+from helpers import analyze_table_transactions
+from summaries import TRANSACTION_TABLES, summarize_tables, get_table_summary
+from pagination import fetch_rows_page, clamp_page_size, ensure_date_indexes
+from sql_analytics import ensure_analytics_indexes
+from cache import result_cache
+from shards import (router, current_shard, current_db_path, fan_out, ALL_SHARDS,
+                    merge_summary_maps, merge_table_summaries, merge_daily_totals, merge_date_spans,
+                    merge_row_pages, merge_fee_groups, merge_sketch_maps, merge_counterparty_rankings,
+                    merge_counterparty_lookups, merge_recent)
+from trends import trend_engine_for, GRANULARITIES, DEFAULT_WINDOW
+from responses import init_responses
+from metrics import init_metrics
+from memprofile import init_memprofile
+from profiler import ProfiledConnection, query_profiler
+from sketches import load_sketches, summarize_sketches, sync_sketches
+from counterparties import sync_counterparty_index, get_top_counterparties, get_counterparty_transactions, TOP_ORDERS, DEFAULT_TOP, MAX_LOOKUP_ROWS
+from anomaly import ensure_anomaly_tables, get_anomalies, DEFAULT_ALERTS, MAX_ALERTS
+from fees import analyze_fees, collect_fee_groups, rollup_fee_groups
+from ledger import build_balance_timeline, DEFAULT_POINTS, DEFAULT_TOLERANCE
+from charts import (RESOLUTIONS, DEFAULT_CHART_POINTS, clamp_points, get_date_span, choose_resolution,
+                    get_volume_buckets, volume_series, balance_series)
+from ingest_daemon import get_ingest_status as read_ingest_status
+from jobs import job_queue
 
 app = Flask(__name__)
+init_responses(app)
+init_metrics(app)
+init_memprofile(app)
+
+PAGE_SIZE = 50
+
+# Number of SQLite VM steps between checks for a disconnected client
+CANCEL_CHECK_INTERVAL = 10000
+
+_initialized_shards = set()
+_init_lock = threading.Lock()
 
 def get_db_connection():
-    conn = sqlite3.connect('momo_data.db')
+    if fan_out_requested():
+        # Never fall back to the default database when the data is sharded
+        abort(account_required())
+    db_path = current_db_path()
+    if db_path not in _initialized_shards:
+        init_db(db_path)
+    conn = sqlite3.connect(db_path, factory=ProfiledConnection)
     conn.row_factory = sqlite3.Row
+    # Under the async server (asgi.py), abort running statements once the client disconnects
+    cancel_event = request.environ.get('momo.cancel_event') if has_request_context() else None
+    if cancel_event is not None:
+        conn.set_progress_handler(cancel_event.is_set, CANCEL_CHECK_INTERVAL)
     return conn
 
+def init_db(db_path=None):
+    """Create the indexes and tables the app relies on, once per database (shard)."""
+    db_path = db_path or current_db_path()
+    with _init_lock:
+        if db_path in _initialized_shards:
+            return
+        conn = sqlite3.connect(db_path)
+        ensure_date_indexes(conn, TRANSACTION_TABLES)
+        ensure_analytics_indexes(conn, TRANSACTION_TABLES)
+        sync_counterparty_index(conn, TRANSACTION_TABLES)
+        sync_sketches(conn, TRANSACTION_TABLES)
+        # Created here so the read paths never run DDL
+        ensure_anomaly_tables(conn)
+        conn.close()
+        _initialized_shards.add(db_path)
+
+if not router.sharded:
+    init_db()
+
+@app.before_request
+def bind_account_shard():
+    """Route requests with ?account= to that account's shard."""
+    account = request.args.get('account')
+    if account is None:
+        return
+    db_path = router.shard_for(account)
+    if router.sharded and not os.path.exists(db_path):
+        abort(404)
+    g.shard_token = current_shard.set(db_path)
+
+@app.teardown_request
+def unbind_account_shard(exc=None):
+    token = g.pop('shard_token', None)
+    if token is not None:
+        current_shard.reset(token)
+
+def fan_out_requested():
+    """Sharded deployments aggregate over every shard unless an account was given."""
+    return router.sharded and current_shard.get() is None
+
+def account_required(reason='this endpoint reads a single account'):
+    """400 response for per-account endpoints called on a sharded deployment without ?account=."""
+    return make_response(jsonify({'error': f'account required: {reason}; pass ?account=<number>'}), 400)
+
+def query_current_shard(query):
+    """Run ``query(conn)`` on a connection to the current shard."""
+    conn = get_db_connection()
+    try:
+        return query(conn)
+    finally:
+        conn.close()
+
+def cached_aggregate(endpoint, params, query, merge):
+    """
+    Cache ``query(conn)`` for the current shard or, when fanning out, run
+    it on every shard in parallel and cache ``merge(partials)``.
+    """
+    if fan_out_requested():
+        return result_cache.get_or_compute(
+            endpoint, params,
+            lambda: merge(fan_out(lambda db_path: query_current_shard(query))),
+            db_path=ALL_SHARDS)
+    return result_cache.get_or_compute(endpoint, params, lambda: query_current_shard(query))
+
+def public_job(job):
+    """A job as returned by the API: URLs instead of the result file path."""
+    job = dict(job)
+    job.pop('result_path', None)
+    job['status_url'] = url_for('get_job', job_id=job['id'])
+    if job['status'] == 'done':
+        job['result_url'] = url_for('get_job_result', job_id=job['id'])
+    return job
+
+def submit_job(kind, params=None):
+    """Queue a background job on the current shard and answer 202 with its status URL."""
+    if fan_out_requested():
+        return account_required('jobs run on a single shard')
+    try:
+        job = job_queue.submit(kind, params, db_path=current_db_path())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job = public_job(job)
+    return jsonify(job), 202, {'Location': job['status_url']}
+
+def async_requested():
+    """Heavy routes run as a background job when called with ?async=1."""
+    return request.args.get('async') == '1'
+
+def fetch_all_rows(table_name):
+    """Every row of ``table_name``; concatenated over all shards when fanning out."""
+    def query(conn):
+        return [dict(row) for row in conn.execute(f'SELECT * FROM {table_name}')]
+
+    if fan_out_requested():
+        return [row for rows in fan_out(lambda db_path: query_current_shard(query)) for row in rows]
+    return query_current_shard(query)
+
 # API Routes for data fetching
 @app.route('/get-airtime-payments')
 def get_airtime_payments():
+    return jsonify(fetch_all_rows('airtime_payments'))
+
+def compute_table_stats(table_name):
     conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM airtime_payments').fetchall()
+    stats = analyze_table_transactions(table_name, conn)
     conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return stats
 
 @app.route('/get-airtime-payments-stats')
 def get_airtime_payments_stats():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM airtime_payments').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    stats = analyze_incoming_money_transactions(results)
+    if fan_out_requested():
+        # Unique senders and final balances do not add up across accounts
+        return account_required()
+    if async_requested():
+        return submit_job('table-stats', {'table': 'airtime_payments'})
+    stats = result_cache.get_or_compute(
+        'table-stats', ('airtime_payments',),
+        lambda: compute_table_stats('airtime_payments'))
     return jsonify(stats)
 
 @app.route('/get-incoming-money')
 def get_incoming_money():
-    conn = get_db_connection()
-    money = conn.execute('SELECT * FROM incoming_money').fetchall()
-    conn.close()
-    results = [dict(money) for money in money]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('incoming_money'))
 
 @app.route('/get-incoming-money-stats')
 def get_incoming_money_stats():
-    conn = get_db_connection()
-    incoming_money = conn.execute('SELECT * FROM incoming_money').fetchall()
-    conn.close()
-    results = [dict(money) for money in incoming_money]
-    stats = analyze_incoming_money_transactions(results)
+    if fan_out_requested():
+        # Unique senders and final balances do not add up across accounts
+        return account_required()
+    if async_requested():
+        return submit_job('table-stats', {'table': 'incoming_money'})
+    stats = result_cache.get_or_compute(
+        'table-stats', ('incoming_money',),
+        lambda: compute_table_stats('incoming_money'))
     return jsonify(stats)
 
+@app.route('/get-trends/<table_name>')
+def get_trends(table_name):
+    if table_name not in TRANSACTION_TABLES:
+        abort(404)
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f'Unknown granularity: {granularity}'}), 400
+    if fan_out_requested():
+        # Rolling baselines are kept per database
+        return account_required()
+    try:
+        periods = request.args.get('periods', type=int)
+        window = request.args.get('window', DEFAULT_WINDOW, type=int)
+        conn = get_db_connection()
+        series = trend_engine_for(current_db_path()).series(table_name, granularity, periods, window, conn=conn)
+        conn.close()
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(series)
+
+@app.route('/get-sketch-summary')
+@app.route('/get-sketch-summary/<table_name>')
+def get_sketch_summary_route(table_name=None):
+    if table_name is not None and table_name not in TRANSACTION_TABLES:
+        abort(404)
+    start_day = request.args.get('start')
+    end_day = request.args.get('end')
+
+    def query(conn):
+        return load_sketches(conn, table_name, start_day, end_day)
+
+    try:
+        if fan_out_requested():
+            sketches = merge_sketch_maps(fan_out(lambda db_path: query_current_shard(query)))
+        else:
+            sketches = query_current_shard(query)
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(summarize_sketches(sketches, start_day, end_day))
+
+@app.route('/get-balance-timeline')
+def get_balance_timeline():
+    points = request.args.get('points', DEFAULT_POINTS, type=int)
+    tolerance = request.args.get('tolerance', DEFAULT_TOLERANCE, type=float)
+    start = request.args.get('start')
+    end = request.args.get('end')
+    if fan_out_requested():
+        return account_required('balances are per account')
+    if async_requested():
+        return submit_job('balance-timeline', {'points': points, 'tolerance': tolerance, 'start': start, 'end': end})
+
+    def compute():
+        conn = get_db_connection()
+        try:
+            return build_balance_timeline(conn, points, start, end, tolerance)
+        finally:
+            conn.close()
+
+    timeline = result_cache.get_or_compute(
+        'balance-timeline', (points, tolerance, start, end), compute)
+    if 'error' in timeline:
+        return jsonify(timeline), 500
+    return jsonify(timeline)
+
+@app.route('/get-chart-series/<kind>')
+def get_chart_series(kind):
+    if kind not in ('volume', 'balance'):
+        abort(404)
+    table_name = request.args.get('table')
+    if table_name is not None and table_name not in TRANSACTION_TABLES:
+        abort(404)
+    points = clamp_points(request.args.get('points', DEFAULT_CHART_POINTS, type=int))
+    start = request.args.get('start')
+    end = request.args.get('end')
+
+    if kind == 'balance':
+        if fan_out_requested():
+            return account_required('balances are per account')
+
+        def compute():
+            conn = get_db_connection()
+            try:
+                return balance_series(conn, points, start, end)
+            finally:
+                conn.close()
+
+        series = result_cache.get_or_compute('chart-balance', (points, start, end), compute)
+        if 'error' in series:
+            return jsonify(series), 500
+        return jsonify(series)
+
+    tables = (table_name,) if table_name else tuple(TRANSACTION_TABLES)
+    resolution = request.args.get('resolution', 'auto')
+    if resolution == 'auto':
+        span = cached_aggregate(
+            'chart-span', (tables, start, end),
+            lambda conn: get_date_span(conn, tables, start, end),
+            merge_date_spans)
+        resolution = choose_resolution(span, points)
+    elif resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+    buckets = cached_aggregate(
+        'chart-volume', (tables, resolution, start, end),
+        lambda conn: get_volume_buckets(conn, tables, resolution, start, end),
+        merge_daily_totals)
+    return jsonify(volume_series(buckets, resolution, points))
+
+@app.route('/get-top-counterparties')
+def get_top_counterparties_route():
+    table_name = request.args.get('table')
+    if table_name is not None and table_name not in TRANSACTION_TABLES:
+        abort(404)
+    by = request.args.get('by', 'count')
+    if by not in TOP_ORDERS:
+        return jsonify({'error': f'Unknown ordering: {by}'}), 400
+    limit = max(1, min(request.args.get('limit', DEFAULT_TOP, type=int), 100))
+    # Shards rank only their own rows, so fanning out merges their complete rankings by name
+    shard_limit = -1 if fan_out_requested() else limit
+    ranking = cached_aggregate(
+        'top-counterparties', (table_name, by, limit),
+        lambda conn: get_top_counterparties(conn, table_name, by, shard_limit),
+        lambda partials: merge_counterparty_rankings(partials, TOP_ORDERS[by], limit))
+    return jsonify(ranking)
+
+@app.route('/get-counterparty/<path:name>')
+def get_counterparty(name):
+    def query(conn):
+        return get_counterparty_transactions(conn, name)
+
+    try:
+        if fan_out_requested():
+            counterparty = merge_counterparty_lookups(
+                fan_out(lambda db_path: query_current_shard(query)), MAX_LOOKUP_ROWS)
+        else:
+            counterparty = query_current_shard(query)
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    if counterparty is None:
+        abort(404)
+    return jsonify(counterparty)
+
+@app.route('/get-anomalies')
+def get_anomalies_route():
+    table_name = request.args.get('table')
+    if table_name is not None and table_name not in TRANSACTION_TABLES:
+        abort(404)
+    kind = request.args.get('kind')
+    limit = min(max(1, request.args.get('limit', DEFAULT_ALERTS, type=int)), MAX_ALERTS)
+
+    def query(conn):
+        return get_anomalies(conn, table_name, kind, limit)
+
+    try:
+        if fan_out_requested():
+            alerts = merge_recent(fan_out(lambda db_path: query_current_shard(query)), limit)
+        else:
+            alerts = query_current_shard(query)
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(alerts)
+
+@app.route('/get-fee-analytics')
+def get_fee_analytics():
+    table_name = request.args.get('table')
+    if table_name is not None and table_name not in TRANSACTION_TABLES:
+        abort(404)
+    tables = [table_name] if table_name else TRANSACTION_TABLES
+    if async_requested():
+        return submit_job('fee-analytics', {'table': table_name})
+
+    def shard_fee_groups(conn):
+        return collect_fee_groups(conn, tables)
+
+    try:
+        # Shards return their raw fee groups, which are concatenated before the rollup
+        fees = cached_aggregate(
+            'fee-analytics', tuple(tables),
+            shard_fee_groups if fan_out_requested() else (lambda conn: analyze_fees(conn, tables)),
+            lambda partials: rollup_fee_groups(merge_fee_groups(partials)))
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    if 'error' in fees:
+        return jsonify(fees), 500
+    return jsonify(fees)
+
+@app.route('/get-cache-stats')
+def get_cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/get-ingest-status')
+def get_ingest_status():
+    # The ingest daemon keeps file status in the main database, not per shard.
+    # Open it read-only and without init_db: a sharded deployment may not have one.
+    limit = request.args.get('limit', 50, type=int)
+    if not os.path.exists(router.default_path):
+        return jsonify([])
+    conn = sqlite3.connect(f"{Path(router.default_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        return jsonify(read_ingest_status(conn, limit))
+    finally:
+        conn.close()
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    payload = request.get_json(silent=True) or {}
+    return submit_job(payload.get('kind'), payload.get('params'))
+
+@app.route('/get-jobs')
+def get_jobs():
+    limit = request.args.get('limit', 50, type=int)
+    jobs = job_queue.list_jobs(limit, request.args.get('status'))
+    return jsonify([public_job(job) for job in jobs])
+
+@app.route('/get-job/<job_id>')
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(public_job(job))
+
+@app.route('/get-job-result/<job_id>')
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] != 'done':
+        return jsonify({'error': f"Job is {job['status']}", 'status_url': url_for('get_job', job_id=job_id)}), 409
+    if not job['result_path'] or not os.path.exists(job['result_path']):
+        abort(410)
+    extension = os.path.splitext(job['result_path'])[1]
+    return send_file(os.path.abspath(job['result_path']), as_attachment=True,
+                     download_name=f"{job['kind']}-{job_id[:8]}{extension}")
+
+@app.route('/get-query-profile')
+def get_query_profile():
+    order = request.args.get('order', 'total')
+    if order not in ('total', 'average', 'max', 'calls'):
+        return jsonify({'error': "order must be one of: total, average, max, calls"}), 400
+    limit = request.args.get('limit', 20, type=int)
+    if request.args.get('reset') == '1':
+        query_profiler.reset()
+    return jsonify({
+        'slow_query_ms': query_profiler.slow_query_seconds * 1000,
+        'statements': query_profiler.top_statements(limit, order)
+    })
+
 @app.route('/get-transfers-to-mobile-numbers')
 def get_transfers_to_mobile_numbers():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM transfers_to_mobile_numbers').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('transfers_to_mobile_numbers'))
 
 @app.route('/get-payments-to-code-holders')
 def get_payments_to_code_holders():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM payments_to_code_holders').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('payments_to_code_holders'))
 
 @app.route('/get-withdrawals-from-agents')
 def get_withdrawals_from_agents():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM withdrawals_from_agents').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('withdrawals_from_agents'))
 
 @app.route('/get-bank-transfers')
 def get_bank_transfers():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM bank_transfers').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('bank_transfers'))
 
 @app.route('/get-bundle-purchases')
 def get_bundle_purchases():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM bundle_purchases').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('bundle_purchases'))
 
 @app.route('/get-cashpower-payments')
 def get_cashpower_payments():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM cashpower_payments').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('cashpower_payments'))
 
 @app.route('/get-third-party-transactions')
 def get_third_party_transactions():
-    conn = get_db_connection()
-    payments = conn.execute('SELECT * FROM third_party_transactions').fetchall()
-    conn.close()
-    results = [dict(payment) for payment in payments]
-    return jsonify(results)
+    return jsonify(fetch_all_rows('third_party_transactions'))
 
 # Dashboard and Page Routes
 @app.route('/')
 def dashboard():
-    conn = get_db_connection()
-    tables = [
-        "airtime_payments",
-        "incoming_money", 
-        "transfers_to_mobile_numbers",
-        "payments_to_code_holders",
-        "bank_transfers",
-        "bundle_purchases",
-        "cashpower_payments",
-        "third_party_transactions",
-        "withdrawals_from_agents"
-    ]
-
-    db_summary = [get_table_summary(table) for table in tables]
-    for table in tables:
-        summary = get_table_summary(table)
-        if summary:
-            print(summary)
-
+    summaries = cached_aggregate(
+        'dashboard-summary', tuple(TRANSACTION_TABLES),
+        lambda conn: summarize_tables(TRANSACTION_TABLES, conn=conn),
+        merge_summary_maps)
+    db_summary = list(summaries.values())
     return render_template('index.html', db_summary=db_summary)
 
+def render_category_page(table_name, template, with_chart_series=False):
+    """
+    Render a category page with server-side aggregates and only the first
+    page of rows; the template fetches further rows from
+    /get-table-rows/<table_name> as the user scrolls.
+    """
+    def first_page(conn):
+        return fetch_rows_page(conn, table_name, limit=PAGE_SIZE)
+
+    if fan_out_requested():
+        page = merge_row_pages(fan_out(lambda db_path: query_current_shard(first_page)), PAGE_SIZE)
+    else:
+        page = query_current_shard(first_page)
+    summary = cached_aggregate(
+        'table-summary', (table_name,),
+        lambda conn: get_table_summary(table_name, conn=conn),
+        merge_table_summaries)
+    series_url = None
+    if with_chart_series:
+        series_url = url_for('get_chart_series', kind='volume', table=table_name,
+                             account=request.args.get('account'))
+    return render_template(
+        template,
+        transactions=page['rows'],
+        next_cursor=page['next_cursor'],
+        rows_url=url_for('get_table_rows', table_name=table_name, account=request.args.get('account')),
+        page_size=PAGE_SIZE,
+        summary=summary or {},
+        series_url=series_url)
+
+@app.route('/get-table-rows/<table_name>')
+def get_table_rows(table_name):
+    if table_name not in TRANSACTION_TABLES:
+        abort(404)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', PAGE_SIZE)
+
+    def query(conn):
+        return fetch_rows_page(conn, table_name, cursor=cursor, limit=limit)
+
+    if fan_out_requested():
+        if cursor:
+            # Cursors are rowids of a single shard
+            return account_required('row cursors belong to one shard')
+        pages = fan_out(lambda db_path: query_current_shard(query))
+        return jsonify(merge_row_pages(pages, clamp_page_size(limit)))
+    return jsonify(query_current_shard(query))
+
 @app.route('/airtime')
 def airtime():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM airtime_payments ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('airtime.html', transactions=transactions)
+    return render_category_page('airtime_payments', 'airtime.html', with_chart_series=True)
 
 @app.route('/incoming-money')
 def incoming_money():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM incoming_money ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('incoming-money.html', transactions=transactions)
+    return render_category_page('incoming_money', 'incoming-money.html')
 
 @app.route('/transfers-to-mobile')
 def mobile_transfers():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM transfers_to_mobile_numbers ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('transfers-to-mobile.html', transactions=transactions)
+    return render_category_page('transfers_to_mobile_numbers', 'transfers-to-mobile.html')
 
 @app.route('/code-holders')
 def code_holders():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM payments_to_code_holders ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('code-holders.html', transactions=transactions)
+    return render_category_page('payments_to_code_holders', 'code-holders.html')
 
 @app.route('/bank-transfers')
 def bank_transfers():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM bank_transfers ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('bank-transfers.html', transactions=transactions)
+    return render_category_page('bank_transfers', 'bank-transfers.html')
 
 @app.route('/cash-power')
 def cash_power():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM cashpower_payments ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('cash-power-bill.html', transactions=transactions)
+    return render_category_page('cashpower_payments', 'cash-power-bill.html')
 
 @app.route('/internet-voice')
 def internet_bundles():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM bundle_purchases ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('internet-voice-bundles.html', transactions=transactions)
+    return render_category_page('bundle_purchases', 'internet-voice-bundles.html')
 
 @app.route('/third-parties')
 def third_parties():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM third_party_transactions ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('third-party.html', transactions=transactions)
+    return render_category_page('third_party_transactions', 'third-party.html')
 
 @app.route('/agent-withdrawals')
 def agent_withdrawals():
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM withdrawals_from_agents ORDER BY date DESC').fetchall()
-    conn.close()
-    # Convert Row objects to dictionaries for JSON serialization
-    transactions = [dict(row) for row in transactions]
-    return render_template('agent-withdrawal.html', transactions=transactions)
+    return render_category_page('withdrawals_from_agents', 'agent-withdrawal.html')
 
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=5000, debug=True)
@@ -0,0 +1,289 @@
+"""
+Async (ASGI) serving mode for the MoMo Analytics app
+
+Exposes the same Flask routes through an ASGI callable. Each request runs
+on a bounded thread pool so the event loop never waits on SQLite, heavy
+analytics routes (``HEAVY_PATHS``) get their own pool so they cannot
+starve cheap reads, and a request is cancelled as soon as its client
+disconnects.
+
+Run with any ASGI server, e.g.:
+
+    uvicorn asgi:application --host 127.0.0.1 --port 5000
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+LIGHT_WORKERS = int(os.environ.get('MOMO_ASGI_WORKERS', '16'))
+HEAVY_WORKERS = int(os.environ.get('MOMO_ASGI_HEAVY_WORKERS', '4'))
+
+# Routes that scan whole tables or stream every transaction go to the heavy
+# pool; add new analytics routes here. Report and export generation runs on
+# the job queue (jobs.py), so submitting a job stays on the light pool.
+HEAVY_PATHS = frozenset({
+    '/',
+    '/get-airtime-payments-stats',
+    '/get-incoming-money-stats',
+    '/get-balance-timeline',
+    '/get-fee-analytics',
+    '/get-top-counterparties',
+    '/get-chart-series/balance',
+    # Full table dumps
+    '/get-airtime-payments',
+    '/get-incoming-money',
+    '/get-transfers-to-mobile-numbers',
+    '/get-payments-to-code-holders',
+    '/get-withdrawals-from-agents',
+    '/get-bank-transfers',
+    '/get-bundle-purchases',
+    '/get-cashpower-payments',
+    '/get-third-party-transactions',
+})
+HEAVY_PATH_PREFIXES = ('/get-trends/',)
+
+CANCEL_EVENT_KEY = 'momo.cancel_event'
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded number of in-flight jobs. Callers beyond
+    the bound wait on the event loop, where they stay cancellable.
+    """
+
+    def __init__(self, max_workers, name):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = None
+
+    async def run(self, func, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin1').upper().replace('-', '_')
+        value = raw_value.decode('latin1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was complete."""
+
+
+class WSGIResponse:
+    """
+    A WSGI app's response, read one body chunk at a time so the server can
+    send each chunk as soon as it is produced. Reads and ``close`` are
+    serialized, so closing waits for a read still running in the pool.
+    """
+
+    def __init__(self, wsgi_app, environ):
+        self.wsgi_app = wsgi_app
+        self.environ = environ
+        self.status = None
+        self.headers = None
+        self._written = []
+        self._result = None
+        self._chunks = iter(())
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [
+            (name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers
+        ]
+        return self._written.append
+
+    def start(self):
+        """Call the app and return its first body chunk (``None`` for an empty body)."""
+        with self._lock:
+            self._result = self.wsgi_app(self.environ, self._start_response)
+            self._chunks = iter(self._result)
+            chunk = self._read()
+        if self.status is None:
+            raise RuntimeError('WSGI app returned without calling start_response')
+        return chunk
+
+    def next_chunk(self):
+        """Return the next non-empty body chunk, or ``None`` once the body is complete."""
+        with self._lock:
+            return self._read()
+
+    def _read(self):
+        if self._closed:
+            return None
+        if self._written:
+            return self._written.pop(0)
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return None
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                if hasattr(self._result, 'close'):
+                    self._result.close()
+
+
+class AsyncApp:
+    """ASGI application that serves a WSGI app from bounded thread pools."""
+
+    def __init__(self, wsgi_app, light_workers=LIGHT_WORKERS, heavy_workers=HEAVY_WORKERS,
+                 heavy_paths=HEAVY_PATHS, heavy_path_prefixes=HEAVY_PATH_PREFIXES):
+        self.wsgi_app = wsgi_app
+        self.light = BoundedExecutor(light_workers, 'momo-light')
+        self.heavy = BoundedExecutor(heavy_workers, 'momo-heavy')
+        self.heavy_paths = frozenset(heavy_paths)
+        self.heavy_path_prefixes = tuple(heavy_path_prefixes)
+
+    def executor_for(self, path):
+        if path in self.heavy_paths or path.startswith(self.heavy_path_prefixes):
+            return self.heavy
+        return self.light
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.light.shutdown()
+                self.heavy.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def _wait_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def _unless_disconnected(self, work, disconnect):
+        """Await ``work``, or raise ClientDisconnected if the client goes away first."""
+        work = asyncio.ensure_future(work)
+        done, _ = await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if work not in done:
+            work.cancel()
+            raise ClientDisconnected()
+        return work.result()
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+
+        environ = build_environ(scope, body)
+        cancel_event = threading.Event()
+        environ[CANCEL_EVENT_KEY] = cancel_event
+
+        executor = self.executor_for(scope['path'])
+        response = WSGIResponse(self.wsgi_app, environ)
+        disconnect = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            try:
+                chunk = await self._unless_disconnected(executor.run(response.start), disconnect)
+            except ClientDisconnected:
+                raise
+            except Exception as e:
+                logging.error(f"Unhandled error serving {scope['path']}: {e}")
+                await send({'type': 'http.response.start', 'status': 500,
+                            'headers': [(b'content-type', b'text/plain')]})
+                await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+                return
+
+            await send({'type': 'http.response.start', 'status': response.status, 'headers': response.headers})
+            # Each chunk goes out as soon as it is read, so large bodies stream
+            # and a disconnect mid-body stops the app between chunks
+            while True:
+                following = None
+                if chunk is not None:
+                    following = await self._unless_disconnected(executor.run(response.next_chunk), disconnect)
+                await send({'type': 'http.response.body', 'body': chunk or b'', 'more_body': following is not None})
+                if following is None:
+                    break
+                chunk = following
+        except ClientDisconnected:
+            # Client went away: drop the queued job or abort its SQLite work
+            cancel_event.set()
+            logging.info(f"Cancelled {scope['method']} {scope['path']} after client disconnect")
+        except Exception as e:
+            logging.error(f"Unhandled error streaming {scope['path']}: {e}")
+        finally:
+            disconnect.cancel()
+            await executor.run(response.close)
+
+
+application = AsyncApp(flask_app)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is required to run the async server: pip install uvicorn")
+    uvicorn.run(application, host='127.0.0.1', port=5000)
@@ -0,0 +1,196 @@
+import sqlite3
+import threading
+import logging
+import atexit
+import weakref
+from collections import OrderedDict
+
+from db import DATABASE_NAME
+from shards import ALL_SHARDS, current_db_path, router
+from singleflight import SingleFlight
+
+DEFAULT_MAX_ENTRIES = 256
+
+# Every live watcher, so their connections can be closed at shutdown
+_watchers = weakref.WeakSet()
+
+
+class DataVersion:
+    """
+    Tracks the data version of a SQLite database.
+
+    Uses a dedicated watcher connection and ``PRAGMA data_version``, which
+    changes whenever another connection (ingestion scripts, the parser, the
+    sample data generator, another process) commits to the database file.
+    """
+
+    def __init__(self, db_path=DATABASE_NAME):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._local_version = 0
+        _watchers.add(self)
+
+    def _watcher(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def current(self):
+        """Return an opaque, comparable version for the current data."""
+        with self._lock:
+            try:
+                db_version = self._watcher().execute('PRAGMA data_version').fetchone()[0]
+            except sqlite3.Error as e:
+                logging.warning(f"Could not read data version for {self.db_path}: {e}")
+                db_version = None
+            return (db_version, self._local_version)
+
+    def bump(self):
+        """Force a new version, e.g. after a commit made through the watcher's own process."""
+        with self._lock:
+            self._local_version += 1
+
+    def close(self):
+        """Close the watcher connection; the next ``current()`` reopens it."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                # A new connection restarts data_version, so it cannot be compared with the old one
+                self._local_version += 1
+
+
+def close_watchers():
+    """Close the watcher connection of every DataVersion."""
+    for data_version in list(_watchers):
+        data_version.close()
+
+
+atexit.register(close_watchers)
+
+
+def _is_error(result):
+    return isinstance(result, dict) and 'error' in result
+
+
+class ResultCache:
+    """
+    Bounded LRU cache for computed results, keyed by database (shard),
+    endpoint, parameters and data version. A database's entries are
+    dropped as soon as its data version changes, so results are
+    recomputed at most once per data change. Concurrent misses for the
+    same key share a single computation.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, data_version=None):
+        self.max_entries = max_entries
+        self._data_versions = {}
+        if data_version is not None:
+            self._data_versions[data_version.db_path] = data_version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._seen_versions = {}
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _data_version(self, db_path):
+        with self._lock:
+            data_version = self._data_versions.get(db_path)
+            if data_version is None:
+                data_version = self._data_versions[db_path] = DataVersion(db_path)
+            return data_version
+
+    def _current_version(self, db_path):
+        # Polled without holding the cache lock, so a slow shard does not block other lookups
+        if db_path == ALL_SHARDS:
+            # Fanned-out results depend on every shard
+            return tuple(self._data_version(path).current() for path in router.all_shards())
+        return self._data_version(db_path).current()
+
+    def _check_version(self, db_path, version):
+        # Called with the cache lock held
+        if version != self._seen_versions.get(db_path):
+            stale = [key for key in self._entries if key[0] == db_path]
+            if stale:
+                self.invalidations += 1
+                logging.info(f"Data version of {db_path} changed to {version}, dropping {len(stale)} cached results")
+            for key in stale:
+                del self._entries[key]
+            self._seen_versions[db_path] = version
+        return version
+
+    def get_or_compute(self, endpoint, params, compute, db_path=None):
+        """
+        Return the cached result for ``(endpoint, params)`` at the current
+        data version of ``db_path`` (default: the current shard), calling
+        ``compute()`` on a miss. Use ``shards.ALL_SHARDS`` for results
+        aggregated across every shard. Callers that miss while the same
+        key is being computed wait for that computation instead.
+        """
+        db_path = db_path or current_db_path()
+        version = self._current_version(db_path)
+        with self._lock:
+            self._check_version(db_path, version)
+            key = (db_path, endpoint, params, version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        def compute_and_store():
+            result = compute()
+            if _is_error(result):
+                return result
+            current = self._current_version(db_path)
+            with self._lock:
+                # Only store the result if no commit happened while computing it
+                if self._check_version(db_path, current) == version:
+                    self._entries[key] = result
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            return result
+
+        # Error results (e.g. an interrupted query) are returned but never cached or shared
+        return self._flights.do(key, compute_and_store, share=lambda result: not _is_error(result))
+
+    def invalidate(self):
+        """Drop every cached result and move every database to a new data version."""
+        with self._lock:
+            for data_version in self._data_versions.values():
+                data_version.bump()
+            self._entries.clear()
+            self.invalidations += 1
+
+    def close(self):
+        """Close the watcher connections of every database this cache has seen."""
+        with self._lock:
+            data_versions = list(self._data_versions.values())
+        for data_version in data_versions:
+            data_version.close()
+
+    def stats(self):
+        """Return hit and miss statistics for the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'data_version': self._seen_versions.get(router.default_path),
+                'databases': len(self._seen_versions),
+                'single_flight': self._flights.stats()
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,247 @@
+"""
+Chart series downsampled on the server
+
+The dashboard charts used to receive every transaction and bucket them in
+the browser. These series are aggregated inside SQLite and capped at a
+requested number of points before they are sent:
+
+- volume: transaction count and amount per hour, day, week or month
+  across the transaction tables (or one of them). With ``auto`` the
+  finest resolution that fits in the point budget is used.
+- balance: the merged balance curve from ``ledger.merged_transactions``,
+  streamed once and reduced to real transactions.
+
+Series that are still longer than the budget are reduced with
+Largest-Triangle-Three-Buckets (LTTB). LTTB keeps the first and last
+points and, in every bucket, the point that forms the largest triangle
+with its neighbours, so peaks and dips survive. A chart over years of
+data therefore transfers a few hundred points instead of every row.
+"""
+
+import logging
+import sqlite3
+from datetime import datetime
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES, get_table_columns
+from ledger import LEDGER_TABLES, count_transactions, merged_transactions
+
+RESOLUTIONS = ('hour', 'day', 'week', 'month')
+DEFAULT_CHART_POINTS = 300
+MAX_CHART_POINTS = 2000
+
+# SQL expression giving the bucket label of ``date`` and the label's strptime format
+BUCKETS = {
+    'hour': ("substr(replace(date, 'T', ' '), 1, 13) || ':00'", '%Y-%m-%d %H:%M'),
+    'day': ('substr(date, 1, 10)', '%Y-%m-%d'),
+    # Weeks start on Monday, as in trends.py
+    'week': ("date(substr(date, 1, 10), 'weekday 0', '-6 days')", '%Y-%m-%d'),
+    'month': ('substr(date, 1, 7)', '%Y-%m'),
+}
+# Approximate bucket lengths in seconds, used to pick an ``auto`` resolution
+BUCKET_SECONDS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30.44 * 86400}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def clamp_points(points):
+    return max(3, min(int(points), MAX_CHART_POINTS))
+
+
+def _seconds(moment):
+    return (moment - EPOCH).total_seconds()
+
+
+def lttb(points, threshold, total=None):
+    """
+    Downsample ``(x, y, ...)`` points sorted by ``x`` to at most
+    ``threshold`` points with Largest-Triangle-Three-Buckets. Extra tuple
+    members are carried along. ``points`` may be any iterable when
+    ``total`` gives its length; only two buckets are held in memory.
+    """
+    if total is None:
+        points = list(points)
+        total = len(points)
+    iterator = iter(points)
+    if threshold < 3 or total <= threshold:
+        return list(iterator)
+
+    def take(count):
+        bucket = []
+        for _ in range(count):
+            point = next(iterator, None)
+            if point is None:
+                break
+            bucket.append(point)
+        return bucket
+
+    def bucket_size(index):
+        # Integer bounds, so the buckets always cover exactly the points between first and last
+        return ((index + 1) * (total - 2)) // (threshold - 2) - (index * (total - 2)) // (threshold - 2)
+
+    selected = take(1)
+    if not selected:
+        return []
+    current = take(bucket_size(0))
+    for index in range(threshold - 2):
+        if not current:
+            break
+        following = take(bucket_size(index + 1)) if index < threshold - 3 else take(1)
+        if following:
+            next_x = sum(point[0] for point in following) / len(following)
+            next_y = sum(point[1] for point in following) / len(following)
+        else:
+            next_x, next_y = current[-1][0], current[-1][1]
+        ax, ay = selected[-1][0], selected[-1][1]
+        best, best_area = current[0], -1.0
+        for point in current:
+            # Twice the triangle area; the factor does not change the maximum
+            area = abs((ax - next_x) * (point[1] - ay) - (ax - point[0]) * (next_y - ay))
+            if area > best_area:
+                best, best_area = point, area
+        selected.append(best)
+        current = following
+    # ``current`` now holds the last point (or what was left of a short stream)
+    if current:
+        selected.append(current[-1])
+    return selected
+
+
+def _date_conditions(start, end):
+    conditions, params = ['date IS NOT NULL'], []
+    if start:
+        conditions.append('date >= ?')
+        params.append(start)
+    if end:
+        conditions.append('date <= ?')
+        params.append(end)
+    return ' AND '.join(conditions), params
+
+
+def get_date_span(conn, tables=None, start=None, end=None):
+    """Return ``{'first', 'last'}`` transaction dates over ``tables`` (``None`` when empty)."""
+    tables = tables or TRANSACTION_TABLES
+    where, params = _date_conditions(start, end)
+    firsts, lasts = [], []
+    try:
+        existing = [table for table in tables if table in get_table_columns(conn, tables)]
+        if existing:
+            # Separate MIN and MAX subqueries so each is answered from the date index
+            query = ' UNION ALL '.join(
+                f"SELECT (SELECT MIN(date) FROM {table} WHERE {where}), (SELECT MAX(date) FROM {table} WHERE {where})"
+                for table in existing)
+            for first, last in conn.execute(query, params * 2 * len(existing)):
+                if first:
+                    firsts.append(first)
+                    lasts.append(last)
+    except sqlite3.Error as e:
+        logging.error(f"Error getting the chart date span: {e}")
+    return {'first': min(firsts) if firsts else None, 'last': max(lasts) if lasts else None}
+
+
+def choose_resolution(span, points):
+    """The finest resolution whose bucket count over ``span`` fits in ``points``."""
+    if not span.get('first') or not span.get('last'):
+        return 'day'
+    try:
+        seconds = (datetime.fromisoformat(span['last']) - datetime.fromisoformat(span['first'])).total_seconds()
+    except ValueError:
+        return 'day'
+    for resolution in RESOLUTIONS:
+        if seconds / BUCKET_SECONDS[resolution] < points:
+            return resolution
+    return 'month'
+
+
+def get_volume_buckets(conn, tables=None, resolution='day', start=None, end=None):
+    """
+    Return ``[{'date', 'count', 'amount'}, ...]`` per ``resolution``
+    bucket over ``tables``, oldest first, aggregated inside SQLite. The
+    shape matches ``summaries.get_daily_totals`` so shards merge the same way.
+    """
+    tables = tables or TRANSACTION_TABLES
+    expression = BUCKETS[resolution][0]
+    where, params = _date_conditions(start, end)
+    try:
+        existing = [table for table in tables if table in get_table_columns(conn, tables)]
+        if not existing:
+            return []
+        per_table = ' UNION ALL '.join(
+            f"SELECT {expression} AS bucket, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS amount "
+            f"FROM {table} WHERE {where} GROUP BY bucket"
+            for table in existing)
+        query = f"""
+        SELECT bucket, SUM(count), SUM(amount)
+        FROM ({per_table})
+        GROUP BY bucket
+        ORDER BY bucket
+        """
+        return [
+            {'date': bucket, 'count': count, 'amount': amount}
+            for bucket, count, amount in conn.execute(query, params * len(existing))
+        ]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting {resolution} chart buckets: {e}")
+        return []
+
+
+def volume_series(buckets, resolution, points=DEFAULT_CHART_POINTS):
+    """Cap bucketed count/amount totals at ``points``, downsampling the amount curve with LTTB."""
+    points = clamp_points(points)
+    label_format = BUCKETS[resolution][1]
+    series = buckets
+    if len(buckets) > points:
+        located = []
+        for index, bucket in enumerate(buckets):
+            try:
+                x = _seconds(datetime.strptime(bucket['date'], label_format))
+            except (TypeError, ValueError):
+                x = located[-1][0] if located else 0
+            located.append((x, bucket['amount'], index))
+        series = [buckets[point[2]] for point in lttb(located, points)]
+    return {
+        'resolution': resolution,
+        'buckets': len(buckets),
+        'downsampled': len(series) < len(buckets),
+        'points': series
+    }
+
+
+def balance_series(conn=None, points=DEFAULT_CHART_POINTS, start=None, end=None, tables=None, db_path=DATABASE_NAME):
+    """
+    Balance after each transaction across every category, reduced with
+    LTTB to at most ``points`` real transactions. Rows are streamed, so
+    memory depends on the bucket size, not the table size.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    tables = tables or LEDGER_TABLES
+    points = clamp_points(points)
+    try:
+        total = count_transactions(conn, tables, start, end)
+
+        def located():
+            x = 0
+            for date, table_name, rowid, amount, fee, balance in merged_transactions(conn, tables, start, end):
+                try:
+                    x = _seconds(datetime.fromisoformat(date))
+                except (TypeError, ValueError):
+                    pass
+                yield x, balance, date, table_name
+
+        series = [
+            {'date': date, 'balance': balance, 'table': table_name}
+            for x, balance, date, table_name in lttb(located(), points, total)
+        ]
+        return {
+            'transactions': total,
+            'downsampled': len(series) < total,
+            'points': series
+        }
+    except sqlite3.Error as e:
+        logging.error(f"Error building balance chart series: {e}")
+        return {'error': str(e)}
+    finally:
+        if own_conn:
+            conn.close()
@@ -0,0 +1,219 @@
+"""
+Normalized counterparty dimension shared by all transaction tables
+
+Counterparty names live in differently named columns (``sender_name``,
+``recipient_name``, ``party_name``, ``agent_name``, ``recipient_number``).
+Each distinct normalized name gets a stable id in ``counterparties`` and
+every transaction that mentions it gets a row in
+``counterparty_transactions``, clustered by counterparty id so a lookup
+is a single range scan. The index is extended incrementally by rowid at
+ingest time and when the app starts.
+"""
+
+import logging
+import sqlite3
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES, get_table_columns
+
+# Column -> role of the counterparty in the transaction
+COUNTERPARTY_COLUMNS = {
+    'sender_name': 'sender',
+    'sender': 'sender',
+    'recipient_name': 'recipient',
+    'recipient': 'recipient',
+    'recipient_number': 'recipient',
+    'party_name': 'third_party',
+    'agent_name': 'agent'
+}
+AMOUNT_COLUMNS = ('amount', 'amount_received', 'payment_amount', 'amount_transferred')
+
+TOP_ORDERS = {'count': 'transactions', 'volume': 'total_amount'}
+DEFAULT_TOP = 10
+MAX_LOOKUP_ROWS = 500
+
+
+def normalize_name(value):
+    """Case- and whitespace-insensitive key for a counterparty name or number."""
+    if value is None:
+        return None
+    normalized = ' '.join(str(value).split()).casefold()
+    return normalized or None
+
+
+def prepare_connection(conn):
+    """Register ``normalize_counterparty()`` so SQL and Python normalize alike."""
+    conn.create_function('normalize_counterparty', 1, normalize_name, deterministic=True)
+    return conn
+
+
+def ensure_counterparty_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS counterparties (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            normalized_name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS counterparty_transactions (
+            counterparty_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            amount REAL,
+            date TEXT,
+            PRIMARY KEY (counterparty_id, table_name, row_id, role)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_counterparty_transactions_table
+            ON counterparty_transactions (table_name, counterparty_id, amount);
+        CREATE TABLE IF NOT EXISTS counterparty_index_state (
+            table_name TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL,
+            row_count INTEGER NOT NULL
+        );
+    """)
+
+
+def _index_rows(conn, table_name, columns, after_rowid):
+    amount = next((column for column in AMOUNT_COLUMNS if column in columns), None)
+    amount_sql = f"t.{amount}" if amount else 'NULL'
+    date_sql = 't.date' if 'date' in columns else 'NULL'
+    for column, role in COUNTERPARTY_COLUMNS.items():
+        if column not in columns:
+            continue
+        # New names keep the spelling of their first occurrence
+        conn.execute(f"""
+            INSERT OR IGNORE INTO counterparties (name, normalized_name)
+            SELECT trim(name), normalized_name
+            FROM (
+                SELECT {column} AS name, normalize_counterparty({column}) AS normalized_name
+                FROM {table_name}
+                WHERE rowid > ?
+                ORDER BY rowid
+            )
+            WHERE normalized_name IS NOT NULL
+        """, (after_rowid,))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO counterparty_transactions
+                (counterparty_id, table_name, row_id, role, amount, date)
+            SELECT c.id, ?, t.rowid, ?, {amount_sql}, {date_sql}
+            FROM {table_name} t
+            JOIN counterparties c ON c.normalized_name = normalize_counterparty(t.{column})
+            WHERE t.rowid > ?
+            ORDER BY c.id, t.rowid
+        """, (table_name, role, after_rowid))
+
+
+def sync_counterparty_index(conn, tables=None, rebuild=False):
+    """
+    Index rows added since the last sync. A table whose row count or
+    highest rowid went down (rows deleted) is re-indexed from scratch, as
+    is every table when ``rebuild`` is set. Returns the number of tables
+    that were touched.
+    """
+    tables = tables or TRANSACTION_TABLES
+    prepare_connection(conn)
+    ensure_counterparty_tables(conn)
+    columns = get_table_columns(conn, tables)
+    touched = 0
+    for table in tables:
+        table_columns = columns.get(table)
+        if not table_columns or not any(column in COUNTERPARTY_COLUMNS for column in table_columns):
+            continue
+        row_count, max_rowid = conn.execute(
+            f"SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM {table}").fetchone()
+        state = conn.execute(
+            "SELECT last_rowid, row_count FROM counterparty_index_state WHERE table_name = ?",
+            (table,)).fetchone()
+        last_rowid, indexed_count = state if state else (0, 0)
+
+        if rebuild or max_rowid < last_rowid or row_count < indexed_count:
+            conn.execute("DELETE FROM counterparty_transactions WHERE table_name = ?", (table,))
+            last_rowid = 0
+        elif max_rowid == last_rowid and state is not None:
+            continue
+
+        _index_rows(conn, table, table_columns, last_rowid)
+        conn.execute(
+            "INSERT OR REPLACE INTO counterparty_index_state (table_name, last_rowid, row_count) VALUES (?, ?, ?)",
+            (table, max_rowid, row_count))
+        touched += 1
+    conn.commit()
+    if touched:
+        logging.info(f"Counterparty index updated for {touched} tables")
+    return touched
+
+
+class CounterpartyIndexer:
+    """Ingest observer that indexes the tables it saw on ``flush``."""
+
+    def __init__(self):
+        self._tables = set()
+
+    def observe(self, table_name, record, rowid=None):
+        self._tables.add(table_name)
+
+    def flush(self, conn):
+        if self._tables:
+            sync_counterparty_index(conn, sorted(self._tables))
+            self._tables = set()
+
+
+def get_top_counterparties(conn, table_name=None, by='count', limit=DEFAULT_TOP):
+    """Top counterparties by number of transactions or by total amount."""
+    if by not in TOP_ORDERS:
+        raise ValueError(f"Unknown ordering: {by}")
+    where = 'WHERE ct.table_name = ?' if table_name else ''
+    params = [table_name] if table_name else []
+    query = f"""
+    SELECT c.id, c.name, COUNT(*) AS transactions, TOTAL(ct.amount) AS total_amount,
+           MIN(ct.date) AS first_date, MAX(ct.date) AS last_date
+    FROM counterparty_transactions ct
+    JOIN counterparties c ON c.id = ct.counterparty_id
+    {where}
+    GROUP BY ct.counterparty_id
+    ORDER BY {TOP_ORDERS[by]} DESC, c.id
+    LIMIT ?
+    """
+    return [
+        {
+            'id': row[0],
+            'name': row[1],
+            'transactions': row[2],
+            'total_amount': row[3],
+            'first_date': row[4],
+            'last_date': row[5]
+        }
+        for row in conn.execute(query, params + [limit])
+    ]
+
+
+def get_counterparty_transactions(conn, name, limit=MAX_LOOKUP_ROWS):
+    """
+    Every indexed transaction involving ``name`` across all tables, newest
+    first, resolved with one query on the counterparty primary key.
+    """
+    query = """
+    SELECT c.id, c.name, ct.table_name, ct.row_id, ct.role, ct.amount, ct.date
+    FROM counterparties c
+    JOIN counterparty_transactions ct ON ct.counterparty_id = c.id
+    WHERE c.normalized_name = ?
+    ORDER BY ct.date DESC
+    LIMIT ?
+    """
+    rows = conn.execute(query, (normalize_name(name), limit)).fetchall()
+    if not rows:
+        return None
+    return {
+        'id': rows[0][0],
+        'name': rows[0][1],
+        'transactions': [
+            {'table_name': row[2], 'rowid': row[3], 'role': row[4], 'amount': row[5], 'date': row[6]}
+            for row in rows
+        ]
+    }
+
+
+if __name__ == '__main__':
+    with sqlite3.connect(DATABASE_NAME) as conn:
+        sync_counterparty_index(conn, rebuild=True)
+    print("Counterparty index rebuilt")
@@ -1,7 +1,35 @@
+import os
 import sqlite3
 import json
+import logging
 
-DATABASE_NAME = 'momo_data.db'
+from log_config import configure_logging, sampled
+from memprofile import profile_stage
+
+# Overridable so ingestion, the app and the tools can target another database or shard
+DATABASE_NAME = os.environ.get('MOMO_DB_PATH', 'momo_data.db')
+
+logger = logging.getLogger('momo.ingest')
+
+# Objects with observe(table_name, record, rowid) and flush(conn), notified
+# of every inserted record and flushed after each loaded file
+INGEST_OBSERVERS = []
+
+
+def register_ingest_observer(observer):
+    """Registers an observer that is fed each record as it is inserted."""
+    if observer not in INGEST_OBSERVERS:
+        INGEST_OBSERVERS.append(observer)
+    return observer
+
+
+def flush_ingest_observers(conn):
+    """Lets every registered observer persist what it has accumulated."""
+    for observer in INGEST_OBSERVERS:
+        try:
+            observer.flush(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Error flushing ingest observer {type(observer).__name__}: {e}")
 
 
 def create_connection(db_name):
@@ -22,9 +50,9 @@ def create_table(conn, table_creation_sql):
         c = conn.cursor()
         c.execute(table_creation_sql)
         conn.commit()
-        print("Table created successfully.")
+        logger.info("Table created successfully.")
     except sqlite3.Error as e:
-        print(f"Error creating table: {e}")
+        logger.error(f"Error creating table: {e}")
 
 
 def insert_data(conn, table_name, data, column_names):
@@ -35,6 +63,9 @@ def insert_data(conn, table_name, data, column_names):
         table_name: The name of the table to insert data into.
         data: A dictionary containing the data to insert.
         column_names: A tuple of column names for the table.
+
+    Returns:
+        True if the record was inserted, False otherwise.
     """
     placeholders = ', '.join(['?'] * len(column_names)
                              )  # dynamically create placeholders
@@ -46,14 +77,21 @@ def insert_data(conn, table_name, data, column_names):
         # Use data.get() for safer access
         c.execute(sql, [data.get(col) for col in column_names])
         conn.commit()
-        # flexible id
-        print(
-            f"Data inserted successfully into {table_name} with id {data.get('txid') or data.get('transaction_id')}")
+        for observer in INGEST_OBSERVERS:
+            observer.observe(table_name, data, c.lastrowid)
+        return True
     except sqlite3.IntegrityError:
-        print(
-            f"Record with  id {data.get('txid') or data.get('transaction_id')} already exists in {table_name}. Skipping.")
+        # Per-record messages are sampled so a large import is not slowed down by logging
+        count = sampled(f'ingest.duplicate.{table_name}')
+        if count:
+            logger.info(
+                f"Record with id {data.get('txid') or data.get('transaction_id')} already exists in {table_name}. "
+                f"Skipping ({count} duplicates so far).")
     except sqlite3.Error as e:
-        print(f"Error inserting data into {table_name}: {e}")
+        count = sampled(f'ingest.error.{table_name}')
+        if count:
+            logger.error(f"Error inserting data into {table_name}: {e} ({count} errors so far)")
+    return False
 
 
 def load_and_insert_data(conn, table_name, json_file_path, column_names):
@@ -66,20 +104,32 @@ def load_and_insert_data(conn, table_name, json_file_path, column_names):
         column_names: A tuple of column names for the table.
     """
     try:
-        with open(json_file_path, 'r') as f:
+        with profile_stage(f"load:{table_name}"), open(json_file_path, 'r') as f:
             data = json.load(f)
+            inserted = 0
             for record in data:
-                insert_data(conn, table_name, record, column_names)
+                inserted += insert_data(conn, table_name, record, column_names)
+        with profile_stage('flush_observers'):
+            flush_ingest_observers(conn)
+        logger.info(f"Inserted {inserted} of {len(data)} records from {json_file_path} into {table_name}")
     except FileNotFoundError:
-        print(f"Error: File not found: {json_file_path}")
+        logger.error(f"Error: File not found: {json_file_path}")
     except json.JSONDecodeError:
-        print(f"Error: Invalid JSON format in file: {json_file_path}")
+        logger.error(f"Error: Invalid JSON format in file: {json_file_path}")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
 
 
 def main():
     """Main function to create tables and load data."""
+    configure_logging()
+    from sketches import SketchStore
+    from counterparties import CounterpartyIndexer
+    from anomaly import AnomalyDetector
+
+    register_ingest_observer(SketchStore())
+    register_ingest_observer(CounterpartyIndexer())
+    detector = register_ingest_observer(AnomalyDetector())
 
     table_schemas = {
         'airtime_payments': {
@@ -216,12 +266,13 @@ def main():
     }
 
     with create_connection(DATABASE_NAME) as conn:
+        detector.prime(conn)
         for table_name, schema in table_schemas.items():
             create_table(conn, schema['sql'])
             load_and_insert_data(
                 conn, table_name, data_files[table_name], schema['columns'])
 
-    print("Data loading complete.")
+    logger.info("Data loading complete.")
 
 
 if __name__ == "__main__":
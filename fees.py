@@ -0,0 +1,138 @@
+"""
+Fee analytics across transaction categories
+
+Computes the effective fee rate (total fee / total amount) per amount
+bucket, per category and per month for every table that records a fee.
+Each table is aggregated with a single GROUP BY over (month, amount
+bucket) inside SQLite; the small result is rolled up in Python, so the
+cost per request does not grow with the number of rows returned.
+"""
+
+import logging
+import sqlite3
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES, get_table_columns
+from sql_analytics import amount_column
+
+# Upper bounds (exclusive) of the amount buckets in RWF; the last bucket is open-ended
+AMOUNT_BUCKET_EDGES = (1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+
+def bucket_labels(edges=AMOUNT_BUCKET_EDGES):
+    labels = []
+    lower = 0
+    for upper in edges:
+        labels.append(f"{lower}-{upper}")
+        lower = upper
+    labels.append(f"{lower}+")
+    return labels
+
+
+def _bucket_expression(amount, edges):
+    cases = ' '.join(f"WHEN {amount} < {upper} THEN {index}" for index, upper in enumerate(edges))
+    return f"CASE {cases} ELSE {len(edges)} END"
+
+
+def _totals():
+    return {'transactions': 0, 'total_amount': 0, 'total_fees': 0, 'min_fee': None, 'max_fee': None}
+
+
+def _add(totals, count, amount, fees, min_fee, max_fee):
+    totals['transactions'] += count
+    totals['total_amount'] += amount
+    totals['total_fees'] += fees
+    if min_fee is not None:
+        totals['min_fee'] = min_fee if totals['min_fee'] is None else min(totals['min_fee'], min_fee)
+    if max_fee is not None:
+        totals['max_fee'] = max_fee if totals['max_fee'] is None else max(totals['max_fee'], max_fee)
+
+
+def _finish(totals):
+    amount = totals['total_amount']
+    totals['average_fee'] = round(totals['total_fees'] / totals['transactions'], 2) if totals['transactions'] else 0
+    # Effective rate as a percentage of the amount moved
+    totals['effective_fee_rate'] = round(totals['total_fees'] / amount * 100, 4) if amount else 0
+    return totals
+
+
+def get_fee_groups(conn, table_name, amount, edges=AMOUNT_BUCKET_EDGES):
+    """Per (month, amount bucket) fee aggregates for one table."""
+    query = f"""
+    SELECT substr(date, 1, 7) AS month, {_bucket_expression(amount, edges)} AS bucket,
+           COUNT(*), TOTAL({amount}), TOTAL(fee), MIN(fee), MAX(fee)
+    FROM {table_name}
+    WHERE fee IS NOT NULL AND {amount} IS NOT NULL
+    GROUP BY month, bucket
+    """
+    return conn.execute(query).fetchall()
+
+
+def collect_fee_groups(conn, tables=None, edges=AMOUNT_BUCKET_EDGES):
+    """
+    Return ``{table: [(month, bucket, count, amount, fees, min_fee, max_fee), ...]}``
+    for every table with a ``fee`` column. Groups from several shards can
+    be concatenated per table before ``rollup_fee_groups``.
+    """
+    tables = tables or TRANSACTION_TABLES
+    columns = get_table_columns(conn, tables)
+    return {
+        table: [tuple(row) for row in get_fee_groups(conn, table, amount_column(columns[table]), edges)]
+        for table in tables
+        if 'fee' in columns.get(table, [])
+    }
+
+
+def rollup_fee_groups(groups, edges=AMOUNT_BUCKET_EDGES):
+    """Effective fee rates by amount bucket, category and month from ``collect_fee_groups`` output."""
+    labels = bucket_labels(edges)
+    overall = _totals()
+    by_bucket = {label: _totals() for label in labels}
+    by_month = {}
+    categories = {}
+    for table, rows in groups.items():
+        category = {'totals': _totals(), 'by_bucket': {}, 'by_month': {}}
+        for month, bucket, count, total, fees, min_fee, max_fee in rows:
+            label = labels[bucket]
+            month = month or 'unknown'
+            for target in (
+                overall, by_bucket[label], by_month.setdefault(month, _totals()),
+                category['totals'],
+                category['by_bucket'].setdefault(label, _totals()),
+                category['by_month'].setdefault(month, _totals())
+            ):
+                _add(target, count, total, fees, min_fee, max_fee)
+        categories[table] = {
+            'totals': _finish(category['totals']),
+            'by_bucket': {label: _finish(category['by_bucket'][label])
+                          for label in labels if label in category['by_bucket']},
+            'by_month': {month: _finish(totals) for month, totals in sorted(category['by_month'].items())}
+        }
+
+    return {
+        'bucket_edges': list(edges),
+        'totals': _finish(overall),
+        'by_bucket': {label: _finish(totals) for label, totals in by_bucket.items() if totals['transactions']},
+        'by_month': {month: _finish(totals) for month, totals in sorted(by_month.items())},
+        'categories': categories
+    }
+
+
+def analyze_fees(conn=None, tables=None, edges=AMOUNT_BUCKET_EDGES, db_path=DATABASE_NAME):
+    """
+    Fee schedule and totals for every table with a ``fee`` column: the
+    effective rate by amount bucket, by category and by month, overall
+    and per category.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    try:
+        groups = collect_fee_groups(conn, tables, edges)
+    except sqlite3.Error as e:
+        logging.error(f"Error analyzing fees: {e}")
+        return {'error': str(e)}
+    finally:
+        if own_conn:
+            conn.close()
+    return rollup_fee_groups(groups, edges)
@@ -1,167 +1,435 @@
 #!/usr/bin/env python3
 """
 Sample data generator for MoMo Analytics Dashboard
-This script adds sample transaction data for demonstration purposes
+
+Generates realistic transactions for all nine tables, from the small
+demonstration set (the default) up to tens of millions of rows for
+benchmarks:
+
+- transactions are generated day by day in time order over a configurable
+  span, with weekly, month-end and December seasonality and optional growth
+- amounts follow a Zipf distribution over each category's price points, and
+  counterparties a Zipf distribution over a configurable number of names
+- a single running balance is kept across all tables, so the balance
+  timeline reconciles
+- rows are written with batched ``executemany`` in large transactions, with
+  secondary indexes dropped during large loads and rebuilt afterwards
+- optionally a matching ``sms.xml`` backup is written, in the message
+  formats ``new-parser.py`` understands
+
+    python generate_sample_data.py                                  # demo data
+    python generate_sample_data.py --rows 20000000 --days 1095 \\
+        --counterparties 50000 --seed 1 --sms-xml big_sms.xml
 """
 
-import sqlite3
+import argparse
+import bisect
+import math
 import random
+import sqlite3
+import time
 from datetime import datetime, timedelta
+from itertools import accumulate
+from xml.sax.saxutils import quoteattr
 
-def create_sample_data():
-    """Generate sample transaction data for dashboard demonstration"""
-    
-    conn = sqlite3.connect('momo_data.db')
-    cursor = conn.cursor()
-    
-    # Clear existing data
-    tables = [
-        'airtime_payments', 'incoming_money', 'transfers_to_mobile_numbers',
-        'payments_to_code_holders', 'bank_transfers', 'bundle_purchases',
-        'cashpower_payments', 'third_party_transactions', 'withdrawals_from_agents'
-    ]
-    
-    for table in tables:
-        try:
-            cursor.execute(f"DELETE FROM {table}")
-        except sqlite3.Error:
-            pass
-    
-    # Sample names and data
-    senders = ['John Doe', 'Jane Smith', 'Bob Johnson', 'Alice Brown', 'Charlie Wilson']
-    recipients = ['Mary Johnson', 'David Wilson', 'Sarah Connor', 'Michael Scott', 'Emma Watson']
-    banks = ['Bank of Kigali', 'Equity Bank', 'KCB Bank Rwanda', 'Cogebanque', 'BNR']
-    agents = ['Agent A', 'Agent B', 'Agent C', 'Agent D', 'Agent E']
-    agent_numbers = ['250123456789', '250987654321', '250111222333', '250444555666', '250777888999']
-    bundle_types = ['1GB Internet', '2GB Internet', '500MB Internet', 'Voice Bundle', 'Social Media']
-    
-    # Generate sample data for each table
-    
-    # 1. Airtime Payments
-    for i in range(50):
-        amount = random.randint(500, 10000)
-        fee = int(amount * 0.02)  # 2% fee
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO airtime_payments (transaction_id, amount, fee, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"AT{1000000 + i}", amount, fee, date, balance))
-    
-    # 2. Incoming Money
-    for i in range(75):
-        amount = random.randint(1000, 50000)
-        sender = random.choice(senders)
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO incoming_money (transaction_id, amount, sender_name, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"IM{2000000 + i}", amount, sender, date, balance))
-    
-    # 3. Transfers to Mobile Numbers
-    for i in range(60):
-        amount = random.randint(1000, 30000)
-        recipient = f"25078{random.randint(1000000, 9999999)}"
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO transfers_to_mobile_numbers (transaction_id, amount, recipient_number, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"TM{3000000 + i}", amount, recipient, date, balance))
-    
-    # 4. Payments to Code Holders
-    for i in range(40):
-        amount = random.randint(500, 25000)
-        recipient = random.choice(recipients)
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO payments_to_code_holders (transaction_id, amount, recipient_name, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"PC{4000000 + i}", amount, recipient, date, balance))
-    
-    # 5. Bank Transfers
-    for i in range(35):
-        amount = random.randint(5000, 100000)
-        bank = random.choice(banks)
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO bank_transfers (transaction_id, amount, bank_name, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"BT{5000000 + i}", amount, bank, date, balance))
-    
-    # 6. Bundle Purchases
-    for i in range(45):
-        amount = random.randint(1000, 5000)
-        bundle = random.choice(bundle_types)
-        validity = f"{random.choice([7, 30, 90])} days"
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO bundle_purchases (transaction_id, amount, bundle_type, validity, date, new_balance)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (f"BP{6000000 + i}", amount, bundle, validity, date, balance))
-    
-    # 7. CashPower Payments
-    for i in range(30):
-        amount = random.randint(2000, 20000)
-        fee = int(amount * 0.01)  # 1% fee
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO cashpower_payments (transaction_id, amount, fee, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"CP{7000000 + i}", amount, fee, date, balance))
-    
-    # 8. Third Party Transactions
-    for i in range(25):
-        amount = random.randint(1000, 15000)
-        party = f"Service Provider {random.choice(['A', 'B', 'C', 'D', 'E'])}"
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO third_party_transactions (transaction_id, amount, party_name, date, new_balance)
-            VALUES (?, ?, ?, ?, ?)
-        """, (f"TP{8000000 + i}", amount, party, date, balance))
-    
-    # 9. Withdrawals from Agents
-    for i in range(55):
-        amount = random.randint(5000, 50000)
-        agent = random.choice(agents)
-        agent_number = random.choice(agent_numbers)
-        date = (datetime.now() - timedelta(days=random.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')
-        balance = random.randint(10000, 100000)
-        
-        cursor.execute("""
-            INSERT INTO withdrawals_from_agents (transaction_id, amount, agent_name, agent_number, date, new_balance)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (f"WA{9000000 + i}", amount, agent, agent_number, date, balance))
-    
+from db import DATABASE_NAME
+from ingest_daemon import APP_TABLES, ensure_app_tables
+from sketches import build_sketches
+from counterparties import sync_counterparty_index
+from anomaly import rescan as rescan_anomalies
+
+# Share of rows per table; the defaults reproduce the demonstration data set
+TABLE_WEIGHTS = {
+    'airtime_payments': 50,
+    'incoming_money': 75,
+    'transfers_to_mobile_numbers': 60,
+    'payments_to_code_holders': 40,
+    'bank_transfers': 35,
+    'bundle_purchases': 45,
+    'cashpower_payments': 30,
+    'third_party_transactions': 25,
+    'withdrawals_from_agents': 55,
+}
+TABLES = list(TABLE_WEIGHTS)
+CREDIT_TABLES = {'incoming_money'}
+FEE_TABLES = {'airtime_payments', 'cashpower_payments'}
+
+# Price points per table as (lowest, highest, step)
+AMOUNT_RANGES = {
+    'airtime_payments': (100, 10000, 100),
+    'incoming_money': (1000, 500000, 500),
+    'transfers_to_mobile_numbers': (100, 300000, 100),
+    'payments_to_code_holders': (100, 100000, 100),
+    'bank_transfers': (5000, 2000000, 5000),
+    'bundle_purchases': (500, 20000, 500),
+    'cashpower_payments': (1000, 50000, 500),
+    'third_party_transactions': (1000, 500000, 1000),
+    'withdrawals_from_agents': (1000, 1000000, 1000),
+}
+# Fee by amount tier: (amount below, fee)
+FEE_TIERS = [(1000, 0), (10000, 100), (150000, 250), (2000000, 1500)]
+
+# Transaction id prefixes; ids are all digits, like the ones in real messages
+ID_PREFIXES = {table: str(index + 1) for index, table in enumerate(TABLES)}
+
+FIRST_NAMES = ['John', 'Jane', 'Bob', 'Alice', 'Charlie', 'Mary', 'David', 'Sarah', 'Michael', 'Emma',
+               'Samuel', 'Grace', 'Eric', 'Diane', 'Patrick', 'Aline', 'Jean', 'Claudine', 'Olivier', 'Divine',
+               'Kevin', 'Esther', 'Moses', 'Ruth', 'Isaac', 'Linda', 'Robert', 'Sandra', 'Peter', 'Nadia']
+LAST_NAMES = ['Doe', 'Smith', 'Johnson', 'Brown', 'Wilson', 'Connor', 'Scott', 'Watson', 'Carter', 'Green',
+              'Mugisha', 'Uwase', 'Niyonzima', 'Habimana', 'Mukamana', 'Ndayisaba', 'Uwimana', 'Nshuti', 'Iradukunda',
+              'Ishimwe', 'Kamanzi', 'Byiringiro', 'Ingabire', 'Tuyishime', 'Gasana', 'Munyaneza', 'Rukundo',
+              'Hakizimana', 'Nkurunziza', 'Bizimana']
+SYLLABLES = ['ka', 'mu', 'ri', 'ne', 'go', 'sa', 'bi', 'to', 'ya', 'le', 'mo', 'di']
+BANKS = ['Bank of Kigali', 'Equity Bank', 'KCB Bank Rwanda', 'Cogebanque', 'BPR Bank', 'I and M Bank',
+         'Access Bank', 'Ecobank']
+BUNDLES = [('1GB Internet', '30 days'), ('2GB Internet', '30 days'), ('500MB Internet', '7 days'),
+           ('Voice Bundle', '7 days'), ('Social Media', '7 days'), ('10GB Internet', '90 days')]
+COMPANY_SUFFIXES = ['LTD', 'PAYMENTS', 'SERVICES', 'STORES', 'INSURANCE']
+
+# Relative activity by weekday (Monday first) and hour of day
+WEEKDAY_WEIGHTS = [1.0, 0.95, 0.95, 1.0, 1.15, 1.2, 0.75]
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.3, 0.5, 1, 3, 6, 8, 9, 9, 9, 10, 9, 8, 8, 8, 9, 10, 9, 7, 5, 3, 2]
+
+BATCH_ROWS = 50000
+COMMIT_ROWS = 1000000
+DROP_INDEXES_ABOVE = 1000000
+
+TIMES = [f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}" for second in range(86400)]
+
+
+def zipf_cumulative(count, exponent):
+    """Cumulative Zipf weights for ranks 1..count."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def price_points(table_name):
+    """A table's amounts ordered by popularity: small and round amounts first."""
+    low, high, step = AMOUNT_RANGES[table_name]
+    amounts = range(low, high + 1, step)
+
+    def rank(amount):
+        roundness = 5 if amount % 1000 == 0 else 2 if amount % 500 == 0 else 1
+        return amount / roundness
+
+    return sorted(amounts, key=rank)
+
+
+def fee_for(amount):
+    for below, fee in FEE_TIERS:
+        if amount < below:
+            return fee
+    return FEE_TIERS[-1][1]
+
+
+def person_names(count):
+    """``count`` distinct names made of letters and spaces only."""
+    names = []
+    for index in range(count):
+        first = FIRST_NAMES[index % len(FIRST_NAMES)]
+        last = LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]
+        extra = index // (len(FIRST_NAMES) * len(LAST_NAMES))
+        name = f"{first} {last}"
+        if extra:
+            syllables = []
+            while extra:
+                extra, digit = divmod(extra, len(SYLLABLES))
+                syllables.append(SYLLABLES[digit])
+            name += ' ' + ''.join(syllables).capitalize()
+        names.append(name)
+    return names
+
+
+def phone_number(index):
+    return f"2507{8 + index % 2}{index * 7919 % 10 ** 7:07d}"
+
+
+def counterparty_pools(count):
+    people = person_names(count)
+    return {
+        'incoming_money': people,
+        'transfers_to_mobile_numbers': [(name, phone_number(index)) for index, name in enumerate(people)],
+        'payments_to_code_holders': people,
+        'bank_transfers': BANKS,
+        'bundle_purchases': BUNDLES,
+        'third_party_transactions': [
+            f"{name.split()[-1].upper()} {COMPANY_SUFFIXES[index % len(COMPANY_SUFFIXES)]}"
+            for index, name in enumerate(people)],
+        'withdrawals_from_agents': [
+            (f"Agent {name.split()[0]}", phone_number(index + count))
+            for index, name in enumerate(people[:max(1, count // 10)])],
+    }
+
+
+def allocate_rows(rows, weights=TABLE_WEIGHTS):
+    """
+    Split ``rows`` across tables in proportion to ``weights`` with
+    largest-remainder rounding, so the per-table counts add up to ``rows``.
+    """
+    total_weight = sum(weights.values())
+    counts, remainders = {}, {}
+    for table, weight in weights.items():
+        counts[table], remainders[table] = divmod(rows * weight, total_weight)
+    missing = rows - sum(counts.values())
+    for table in sorted(remainders, key=remainders.get, reverse=True)[:missing]:
+        counts[table] += 1
+    return counts
+
+
+def day_weights(start, days, seasonality, growth):
+    """Relative transaction volume for each day of the span."""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        raw = WEEKDAY_WEIGHTS[day.weekday()]
+        if day.day >= 25 or day.day <= 2:
+            raw *= 1.4  # month-end salaries
+        raw *= 1 + 0.25 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 350) / 365)
+        weight = 1 + seasonality * (raw - 1)
+        weights.append(weight * (1 + growth) ** (offset / 365))
+    return weights
+
+
+class SmsWriter:
+    """Writes generated transactions as an SMS backup in the formats new-parser.py parses."""
+
+    def __init__(self, path, total):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        self.file.write(f'<smses count="{total}" type="full">\n')
+
+    def body(self, table_name, row, fee):
+        transaction_id, amount = row[0], row[1]
+        date, balance = row[-2], row[-1]
+        if table_name == 'incoming_money':
+            return (f"You have received {amount} RWF from {row[2]} (*********{transaction_id[-3:]}) on your mobile "
+                    f"money account at {date}. Message from sender: . Your new balance:{balance} RWF. "
+                    f"Financial Transaction Id: {transaction_id}.")
+        if table_name == 'payments_to_code_holders':
+            return (f"TxId: {transaction_id}. Your payment of {amount:,} RWF to {row[2]} {transaction_id[-5:]} "
+                    f"has been completed at {date}. Your new balance: {balance:,} RWF. Fee was 0 RWF.")
+        if table_name == 'transfers_to_mobile_numbers':
+            return (f"*165*S*{amount} RWF transferred to {row[2][0]} ({row[2][1]}) from 36521838 at {date} . "
+                    f"Fee was: 0 RWF. New balance: {balance} RWF.*EN#")
+        if table_name == 'bank_transfers':
+            return (f"You have transferred {amount} RWF to {row[2]} (250788000000) from your mobile money account "
+                    f"36521838 at {date}. Your new balance: {balance} RWF. Financial Transaction Id: {transaction_id}.")
+        if table_name == 'third_party_transactions':
+            return (f"*164*S*Y'ello,A transaction of {amount} RWF by {row[2]} on your MOMO account was successfully "
+                    f"completed at {date}. Message from debit receiver: . Your new balance:{balance} RWF. "
+                    f"Fee was 0 RWF. Financial Transaction Id: {transaction_id}. "
+                    f"External Transaction Id: {transaction_id[::-1]}.*EN#")
+        if table_name == 'withdrawals_from_agents':
+            return (f"You Account Holder (*********036) have via agent: {row[2]} ({row[3]}), withdrawn {amount} RWF "
+                    f"from your mobile money account: 36521838 at {date} and you can now collect your money in "
+                    f"cash. Your new balance: {balance} RWF. Fee paid: 0 RWF. Message from agent: 1. "
+                    f"Financial Transaction Id: {transaction_id}.")
+        payee = {'airtime_payments': 'Airtime with token ',
+                 'cashpower_payments': f"MTN Cash Power with token {transaction_id[-5:]}-{transaction_id[-10:-5]}",
+                 'bundle_purchases': 'Bundles and Packs with token '}[table_name]
+        return (f"*162*TxId:{transaction_id}*S*Your payment of {amount} RWF to {payee} has been completed at "
+                f"{date}. Fee was {fee} RWF. Your new balance: {balance} RWF . Message: - -. *EN#")
+
+    def write(self, table_name, row, fee):
+        timestamp = int(datetime.strptime(row[-2], '%Y-%m-%d %H:%M:%S').timestamp() * 1000)
+        self.file.write(f'  <sms protocol="0" address="M-Money" date="{timestamp}" type="1" '
+                        f'body={quoteattr(self.body(table_name, row, fee))} read="1" />\n')
+
+    def close(self):
+        self.file.write('</smses>\n')
+        self.file.close()
+
+
+def _secondary_indexes(conn, tables):
+    placeholders = ', '.join('?' * len(tables))
+    return conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({placeholders})", tables).fetchall()
+
+
+def generate_dataset(db_path=DATABASE_NAME, rows=sum(TABLE_WEIGHTS.values()), days=365, end=None,
+                     counterparties=5, amount_exponent=1.1, counterparty_exponent=1.0,
+                     seasonality=1.0, growth=0.0, start_balance=50000, seed=None,
+                     append=False, sms_xml=None, rebuild_derived=True, progress=True):
+    """
+    Write ``rows`` transactions spread over the ``days`` before ``end`` into
+    ``db_path`` and return the number of rows written per table.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    start = (end - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    conn = sqlite3.connect(db_path)
+    ensure_app_tables(conn)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    if not append:
+        for table in TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+    # Index maintenance dominates large loads; rebuild the indexes once at the end instead
+    dropped = _secondary_indexes(conn, TABLES) if rows >= DROP_INDEXES_ABOVE else []
+    for name, _ in dropped:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    pools = counterparty_pools(max(1, counterparties))
+    pool_weights = {table: zipf_cumulative(len(pool), counterparty_exponent) for table, pool in pools.items()}
+    amounts = {table: price_points(table) for table in TABLES}
+    amount_weights = {table: zipf_cumulative(len(points), amount_exponent) for table, points in amounts.items()}
+    next_ids = {
+        table: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0] + 1 for table in TABLES
+    }
+    inserts = {
+        table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for table, columns in APP_TABLES.items()
+    }
+
+    table_rows = allocate_rows(rows)
+    weights = day_weights(start, days, seasonality, growth)
+    weight_sum = sum(weights)
+    hour_weights = list(accumulate(HOUR_WEIGHTS))
+    carry = dict.fromkeys(TABLES, 0.0)
+
+    sms = SmsWriter(sms_xml, rows) if sms_xml else None
+    batches = {table: [] for table in TABLES}
+    written = dict.fromkeys(TABLES, 0)
+    balance = start_balance
+    pending = 0
+    began = time.perf_counter()
+
+    def flush_batches():
+        for table, batch in batches.items():
+            if batch:
+                conn.executemany(inserts[table], batch)
+                batch.clear()
+
+    for offset, weight in enumerate(weights):
+        day = (start + timedelta(days=offset)).strftime('%Y-%m-%d')
+        labels = []
+        for table in TABLES:
+            expected = table_rows[table] * weight / weight_sum + carry[table]
+            # Round on the last day so the totals come out exact
+            count = round(expected) if offset == days - 1 else int(expected)
+            carry[table] = expected - count
+            labels.extend([table] * count)
+        if not labels:
+            continue
+        rng.shuffle(labels)
+
+        # Seconds of the day by hour weight, nudged apart so each transaction has its own timestamp
+        seconds = sorted(
+            bisect.bisect(hour_weights, rng.random() * hour_weights[-1]) * 3600 + rng.randrange(3600)
+            for _ in labels)
+        previous = -1
+        for index, second in enumerate(seconds):
+            if second <= previous and previous < 86399:
+                second = previous + 1
+            seconds[index] = previous = second
+
+        for table, second in zip(labels, seconds):
+            amount = rng.choices(amounts[table], cum_weights=amount_weights[table])[0]
+            fee = fee_for(amount) if table in FEE_TABLES else 0
+            if table not in CREDIT_TABLES and balance < amount + fee:
+                # Not enough funds: the account receives money instead
+                table, fee = 'incoming_money', 0
+                amount = rng.choices(amounts[table], cum_weights=amount_weights[table])[0]
+            balance += amount if table in CREDIT_TABLES else -(amount + fee)
+
+            transaction_id = f"{ID_PREFIXES[table]}{next_ids[table]:010d}"
+            next_ids[table] += 1
+            date = f"{day} {TIMES[second]}"
+            if table in FEE_TABLES:
+                row = (transaction_id, amount, fee, date, balance)
+            elif table == 'withdrawals_from_agents':
+                agent, number = rng.choices(pools[table], cum_weights=pool_weights[table])[0]
+                row = (transaction_id, amount, agent, number, date, balance)
+            elif table == 'bundle_purchases':
+                bundle, validity = rng.choices(pools[table], cum_weights=pool_weights[table])[0]
+                row = (transaction_id, amount, bundle, validity, date, balance)
+            else:
+                row = (transaction_id, amount, rng.choices(pools[table], cum_weights=pool_weights[table])[0],
+                       date, balance)
+            if sms is not None:
+                sms.write(table, row, fee)
+            if table == 'transfers_to_mobile_numbers':
+                row = (transaction_id, amount, row[2][1], date, balance)
+            batches[table].append(row)
+            written[table] += 1
+            pending += 1
+
+        if sum(len(batch) for batch in batches.values()) >= BATCH_ROWS:
+            flush_batches()
+        if pending >= COMMIT_ROWS:
+            flush_batches()
+            conn.commit()
+            pending = 0
+            if progress:
+                done = sum(written.values())
+                print(f"   {done:,} rows ({done / (time.perf_counter() - began):,.0f} rows/s), up to {day}")
+
+    flush_batches()
     conn.commit()
+    if sms is not None:
+        sms.close()
+
+    if dropped:
+        if progress:
+            print(f"   rebuilding {len(dropped)} indexes")
+        for _, sql in dropped:
+            conn.execute(sql)
+        conn.commit()
+
+    if rebuild_derived:
+        # Regenerated tables invalidate the stored sketches, counterparty index and anomaly state
+        build_sketches(conn, TABLES)
+        sync_counterparty_index(conn, TABLES, rebuild=True)
+        rescan_anomalies(conn, TABLES)
     conn.close()
-    
+    return written
+
+
+def create_sample_data():
+    """Generate sample transaction data for dashboard demonstration"""
+    generate_dataset()
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='Generate synthetic MoMo transactions.')
+    arguments.add_argument('--db', default=DATABASE_NAME, help='database to write (default: MOMO_DB_PATH)')
+    arguments.add_argument('--rows', type=int, default=sum(TABLE_WEIGHTS.values()),
+                           help='total transactions across all tables')
+    arguments.add_argument('--days', type=int, default=365, help='length of the time span in days')
+    arguments.add_argument('--end', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                           help='last day of the span, YYYY-MM-DD (default: today)')
+    arguments.add_argument('--counterparties', type=int, default=5, help='distinct counterparties per category')
+    arguments.add_argument('--amount-exponent', type=float, default=1.1, help='Zipf exponent for amounts')
+    arguments.add_argument('--counterparty-exponent', type=float, default=1.0,
+                           help='Zipf exponent for counterparty popularity')
+    arguments.add_argument('--seasonality', type=float, default=1.0,
+                           help='strength of weekly, month-end and yearly patterns (0 disables)')
+    arguments.add_argument('--growth', type=float, default=0.0, help='yearly growth in volume, e.g. 0.2')
+    arguments.add_argument('--start-balance', type=int, default=50000)
+    arguments.add_argument('--seed', type=int, help='seed for a reproducible data set')
+    arguments.add_argument('--append', action='store_true', help='keep existing rows')
+    arguments.add_argument('--sms-xml', help='also write the transactions as an SMS backup to this file')
+    arguments.add_argument('--skip-derived', action='store_true',
+                           help='do not rebuild sketches, the counterparty index and anomaly state')
+    options = arguments.parse_args(argv)
+
+    began = time.perf_counter()
+    written = generate_dataset(
+        options.db, options.rows, options.days, options.end, options.counterparties,
+        options.amount_exponent, options.counterparty_exponent, options.seasonality, options.growth,
+        options.start_balance, options.seed, options.append, options.sms_xml, not options.skip_derived)
+
     print("✅ Sample data generated successfully!")
     print("📊 Transaction counts:")
-    print("   - Airtime Payments: 50")
-    print("   - Incoming Money: 75") 
-    print("   - Mobile Transfers: 60")
-    print("   - Code Payments: 40")
-    print("   - Bank Transfers: 35")
-    print("   - Bundle Purchases: 45")
-    print("   - CashPower Payments: 30")
-    print("   - Third Party: 25")
-    print("   - Agent Withdrawals: 55")
-    print(f"📈 Total: {50+75+60+40+35+45+30+25+55} transactions")
+    for table, count in written.items():
+        print(f"   - {table.replace('_', ' ').title()}: {count:,}")
+    print(f"📈 Total: {sum(written.values()):,} transactions in {time.perf_counter() - began:.1f}s")
+    if options.sms_xml:
+        print(f"📱 SMS backup written to {options.sms_xml}")
+
 
 if __name__ == "__main__":
-    create_sample_data()
+    main()
@@ -1,25 +1,23 @@
 import sqlite3
-import json
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('momo_analytics.log'),
-        logging.StreamHandler()
-    ]
-)
+from analytics import analyze_transactions
+from sql_analytics import analyze_table_sql
+from reports import generate_report, report_path_for
+from shards import current_db_path
+from profiler import ProfiledConnection
+from log_config import configure_logging, sampled
+
+# Configure logging (queued, rotating; see log_config.py)
+configure_logging()
 
 def get_db_connection():
     """
     Establish database connection with proper error handling
     """
     try:
-        conn = sqlite3.connect('momo_data.db')
+        conn = sqlite3.connect(current_db_path(), factory=ProfiledConnection)
         conn.row_factory = sqlite3.Row
         return conn
     except sqlite3.Error as e:
@@ -68,7 +66,9 @@ def get_table_summary(table_name):
                 summary['total_fees'] = fee_result['total_fees'] if fee_result else 0
             
             conn.close()
-            logging.info(f"Generated summary for table: {table_name}")
+            count = sampled('helpers.table_summary')
+            if count:
+                logging.info(f"Generated summary for table: {table_name} ({count} so far)")
             return summary
         
         conn.close()
@@ -86,95 +86,41 @@ def analyze_incoming_money_transactions(data):
         return {'error': 'No data provided'}
     
     try:
-        total_transactions = len(data)
-        total_amount_received = sum(item.get('amount_received', item.get('amount', 0)) for item in data)
-        final_balance = data[-1].get('new_balance') if data else None
-
-        # Convert date strings to datetime objects
-        dates = []
-        for item in data:
-            try:
-                date_str = item.get('date', '')
-                if 'T' in date_str:
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
-                else:
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                dates.append(date_obj)
-            except ValueError:
-                logging.warning(f"Invalid date format: {item.get('date')}")
-                continue
-
-        earliest_date = min(dates).strftime("%Y-%m-%d %H:%M:%S") if dates else None
-        latest_date = max(dates).strftime("%Y-%m-%d %H:%M:%S") if dates else None
-
-        # Sender analysis
-        senders = {}
-        for item in data:
-            sender = item.get('sender', item.get('sender_name', 'Unknown'))
-            senders[sender] = senders.get(sender, 0) + 1
-
-        # Top transactions
-        amount_key = 'amount_received' if 'amount_received' in data[0] else 'amount'
-        largest_transactions = sorted(
-            data, 
-            key=lambda x: x.get(amount_key, 0), 
-            reverse=True
-        )[:5]
-
-        # Monthly breakdown
-        monthly_transactions = defaultdict(lambda: {'count': 0, 'amount': 0})
-        for item in data:
-            if item.get('date'):
-                try:
-                    date_str = item['date']
-                    if 'T' in date_str:
-                        date = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
-                    else:
-                        date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                    month_year = date.strftime("%Y-%m")
-                    monthly_transactions[month_year]['count'] += 1
-                    monthly_transactions[month_year]['amount'] += item.get(amount_key, 0)
-                except ValueError:
-                    continue
-
-        # Daily patterns
-        daily_patterns = defaultdict(lambda: {'count': 0, 'amount': 0})
-        for item in data:
-            if item.get('date'):
-                try:
-                    date_str = item['date']
-                    if 'T' in date_str:
-                        date = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
-                    else:
-                        date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                    day_name = date.strftime("%A")
-                    daily_patterns[day_name]['count'] += 1
-                    daily_patterns[day_name]['amount'] += item.get(amount_key, 0)
-                except ValueError:
-                    continue
-
-        results = {
-            'total_transactions': total_transactions,
-            'total_amount_received': total_amount_received,
-            'average_amount': round(total_amount_received / total_transactions, 2) if total_transactions > 0 else 0,
-            'final_balance': final_balance,
-            'earliest_transaction_date': earliest_date,
-            'latest_transaction_date': latest_date,
-            'unique_senders': len(senders),
-            'transactions_per_sender': dict(sorted(senders.items(), key=lambda x: x[1], reverse=True)[:10]),
-            'largest_transactions': largest_transactions,
-            'monthly_breakdown': dict(monthly_transactions),
-            'daily_patterns': dict(daily_patterns),
-            'analysis_timestamp': datetime.now().isoformat()
-        }
+        # Single pass over columnar data, vectorized with NumPy when available
+        results = analyze_transactions(data)
 
-        logging.info(f"Analyzed {total_transactions} incoming money transactions")
+        count = sampled('helpers.incoming_money')
+        if count:
+            logging.info(f"Analyzed {results['total_transactions']} incoming money transactions ({count} analyses so far)")
         return results
         
     except Exception as e:
         logging.error(f"Error analyzing incoming money transactions: {e}")
         return {'error': str(e)}
 
+def analyze_table_transactions(table_name, conn=None):
+    """
+    Analyze a transaction table with aggregate queries, so only grouped
+    rows come back from SQLite
+    """
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = get_db_connection()
+        results = analyze_table_sql(conn, table_name)
+
+        count = sampled('helpers.table_analysis')
+        if count:
+            logging.info(f"Analyzed transactions for table: {table_name} ({count} so far)")
+        return results
+
+    except Exception as e:
+        logging.error(f"Error analyzing transactions for {table_name}: {e}")
+        return {'error': str(e)}
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+
 def analyze_transaction_trends(table_name, days=30):
     """
     Analyze transaction trends over specified period
@@ -182,29 +128,28 @@ def analyze_transaction_trends(table_name, days=30):
     try:
         conn = get_db_connection()
         
-        # Get transactions from last N days
+        # Aggregate transactions from the last N days per day inside SQLite
         query = f"""
-        SELECT date, amount, transaction_id
+        SELECT substr(date, 1, 10) AS day,
+               COUNT(*) AS count,
+               COALESCE(SUM(amount), 0) AS total_amount
         FROM {table_name}
-        WHERE date >= date('now', '-{days} days')
-        ORDER BY date
+        WHERE date >= date('now', ?)
+        GROUP BY day
+        ORDER BY day
         """
         
-        cursor = conn.execute(query)
-        transactions = cursor.fetchall()
+        cursor = conn.execute(query, (f'-{int(days)} days',))
+        daily_rows = cursor.fetchall()
         conn.close()
         
-        if not transactions:
+        if not daily_rows:
             return {'error': 'No recent transactions found'}
         
-        # Group by date
-        daily_data = defaultdict(lambda: {'count': 0, 'total_amount': 0, 'transactions': []})
-        
-        for txn in transactions:
-            date_key = txn['date'][:10]  # Extract date part (YYYY-MM-DD)
-            daily_data[date_key]['count'] += 1
-            daily_data[date_key]['total_amount'] += txn['amount']
-            daily_data[date_key]['transactions'].append(dict(txn))
+        daily_data = {
+            row['day']: {'count': row['count'], 'total_amount': row['total_amount']}
+            for row in daily_rows
+        }
         
         # Calculate trends
         dates = sorted(daily_data.keys())
@@ -228,7 +173,9 @@ def analyze_transaction_trends(table_name, days=30):
             'analysis_date': datetime.now().isoformat()
         }
         
-        logging.info(f"Analyzed trends for {table_name} over {days} days")
+        count = sampled('helpers.trends')
+        if count:
+            logging.info(f"Analyzed trends for {table_name} over {days} days ({count} so far)")
         return results
         
     except Exception as e:
@@ -295,7 +242,9 @@ def get_transaction_distribution():
             'analysis_timestamp': datetime.now().isoformat()
         }
         
-        logging.info("Generated transaction distribution analysis")
+        count = sampled('helpers.distribution')
+        if count:
+            logging.info(f"Generated transaction distribution analysis ({count} so far)")
         return results
         
     except Exception as e:
@@ -307,38 +256,8 @@ def export_data_summary():
     Export comprehensive data summary for reporting
     """
     try:
-        summary = {
-            'generated_at': datetime.now().isoformat(),
-            'database_file': 'momo_data.db',
-            'tables': {},
-            'overall_stats': {}
-        }
-        
-        # Get distribution
-        distribution = get_transaction_distribution()
-        if 'error' not in distribution:
-            summary['overall_stats'] = distribution['totals']
-            summary['transaction_distribution'] = distribution['distribution']
-        
-        # Get individual table summaries
-        tables = [
-            'airtime_payments', 'incoming_money', 'transfers_to_mobile_numbers',
-            'payments_to_code_holders', 'bank_transfers', 'bundle_purchases',
-            'cashpower_payments', 'third_party_transactions', 'withdrawals_from_agents'
-        ]
-        
-        for table in tables:
-            table_summary = get_table_summary(table)
-            if table_summary:
-                summary['tables'][table] = table_summary
-        
-        # Save to file
-        with open('data_summary_export.json', 'w') as f:
-            json.dump(summary, f, indent=2, default=str)
-        
-        logging.info("Exported comprehensive data summary")
-        return summary
-        
+        db_path = current_db_path()
+        return generate_report(db_path, report_path_for(db_path))
     except Exception as e:
         logging.error(f"Error exporting data summary: {e}")
         return {'error': str(e)}
@@ -370,7 +289,7 @@ def analyze__airtime_transactions(data):
 # Connect to the database
 
 def get_db_connection():
-    conn = sqlite3.connect("momo_data.db")
+    conn = sqlite3.connect(current_db_path(), factory=ProfiledConnection)
     conn.row_factory = sqlite3.Row  # Enables dictionary-like row access
     return conn
 
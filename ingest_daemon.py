@@ -0,0 +1,500 @@
+"""
+Continuous ingest from a drop directory
+
+Watches ``MOMO_DROP_DIR`` for SMS backup XML files and loads them into
+the app database without an operator step. Files are picked up once
+their size has stopped changing, queued, and ingested by a bounded pool
+of workers. Each file is streamed in batches: messages are classified and
+parsed with the functions in ``new-parser.py``, mapped to the app tables
+and written with ``INSERT OR IGNORE``; the ingest observers (sketches,
+counterparty index, anomaly scoring) see every new row.
+
+Per-file status, progress and throughput are kept in the ``ingest_files``
+table. Progress is committed together with each batch, so after a crash
+files left in ``processing`` are resumed from the last committed batch.
+
+With sharding enabled, files in ``<drop dir>/<account>/`` go to that
+account's shard; other files go to ``MOMO_DB_PATH``.
+
+    python ingest_daemon.py [--once] [drop_dir]
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db import DATABASE_NAME
+from log_config import configure_logging
+from memprofile import profile_stage
+from shards import router
+from sketches import SketchStore, sync_sketches
+from counterparties import CounterpartyIndexer
+from anomaly import AnomalyDetector
+
+DROP_DIR = os.environ.get('MOMO_DROP_DIR', 'incoming')
+INGEST_WORKERS = int(os.environ.get('MOMO_INGEST_WORKERS', '2'))
+POLL_SECONDS = float(os.environ.get('MOMO_INGEST_POLL_SECONDS', '1'))
+# A file is ingested once its size and mtime are unchanged for this long
+SETTLE_SECONDS = float(os.environ.get('MOMO_INGEST_SETTLE_SECONDS', '1'))
+BATCH_SIZE = int(os.environ.get('MOMO_INGEST_BATCH_SIZE', '2000'))
+STATUS_TABLE = 'ingest_files'
+
+logger = logging.getLogger('momo.ingest')
+
+
+def _load_parser():
+    spec = importlib.util.spec_from_file_location(
+        'momo_sms_parser', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'new-parser.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # The parser functions export JSON files for db.py; the daemon writes to the database directly
+    module.export_to_json = lambda data, filename=None: None
+    return module
+
+
+parser = _load_parser()
+
+# Columns of the app tables, in the order used by the CREATE TABLE statements
+APP_TABLES = {
+    'incoming_money': ('transaction_id', 'amount', 'sender_name', 'date', 'new_balance'),
+    'payments_to_code_holders': ('transaction_id', 'amount', 'recipient_name', 'date', 'new_balance'),
+    'transfers_to_mobile_numbers': ('transaction_id', 'amount', 'recipient_number', 'date', 'new_balance'),
+    'airtime_payments': ('transaction_id', 'amount', 'fee', 'date', 'new_balance'),
+    'cashpower_payments': ('transaction_id', 'amount', 'fee', 'date', 'new_balance'),
+    'third_party_transactions': ('transaction_id', 'amount', 'party_name', 'date', 'new_balance'),
+    'withdrawals_from_agents': ('transaction_id', 'amount', 'agent_name', 'agent_number', 'date', 'new_balance'),
+    'bank_transfers': ('transaction_id', 'amount', 'bank_name', 'date', 'new_balance'),
+    'bundle_purchases': ('transaction_id', 'amount', 'bundle_type', 'validity', 'date', 'new_balance'),
+}
+INTEGER_COLUMNS = {'amount', 'fee', 'new_balance'}
+
+# Parser category -> (parser function, app table). Categories are tried in
+# this order and a message goes to the first match, so e.g. airtime
+# payments are not also counted as payments to code holders.
+CATEGORIES = {
+    'airtime': ('populate_airtime_table', 'airtime_payments'),
+    'cash_power_bill_payments': ('cash_power_bill_payments', 'cashpower_payments'),
+    'internet_voice_bundle': ('internet_voice_bundles', 'bundle_purchases'),
+    'transtxns_initiate_by_third_parties': ('txns_intitiated_by_third_parties', 'third_party_transactions'),
+    'bank_transfers': ('bank_transfers', 'bank_transfers'),
+    'incoming_money': ('populate_received_money_table', 'incoming_money'),
+    'withdrawals_from_agents': ('withdrawals_from_agents', 'withdrawals_from_agents'),
+    'transfers_to_mobile_numbers': ('transfer_to_mobile_numbers', 'transfers_to_mobile_numbers'),
+    'payment_to_code_holders': ('payment_to_code_holders', 'payments_to_code_holders'),
+}
+
+
+def _integer(value):
+    if value is None:
+        return None
+    try:
+        return int(str(value).replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+def _date(value):
+    return str(value).replace('T', ' ')[:19] if value else None
+
+
+def to_app_record(table_name, parsed):
+    """Map a record produced by new-parser.py to the columns of ``table_name``."""
+    amount = (parsed.get('amount') or parsed.get('amount_received') or parsed.get('amount_transferred')
+              or parsed.get('payment_amount'))
+    record = {
+        'transaction_id': parsed.get('transaction_id') or parsed.get('txid'),
+        'amount': amount,
+        'date': _date(parsed.get('date')),
+        'new_balance': parsed.get('new_balance'),
+        'fee': parsed.get('fee'),
+        'sender_name': parsed.get('sender'),
+        'recipient_name': parsed.get('recipient'),
+        'recipient_number': parsed.get('recipient_number'),
+        'party_name': parsed.get('sender'),
+        'agent_name': parsed.get('agent_name'),
+        'agent_number': parsed.get('agent_number'),
+        'bank_name': parsed.get('recipient_name'),
+        'bundle_type': parsed.get('service'),
+    }
+    record = {column: record.get(column) for column in APP_TABLES[table_name]}
+    for column in INTEGER_COLUMNS.intersection(record):
+        record[column] = _integer(record[column])
+    if not record['transaction_id']:
+        # Transfer messages carry no transaction id; derive a stable one so re-ingest is idempotent
+        record['transaction_id'] = f"{table_name}:{record['date']}:{record['amount']}:{record['new_balance']}"
+    return record
+
+
+def classify(body):
+    for category in CATEGORIES:
+        if parser.TABLE_CONFIG[category] in body:
+            return category
+    return None
+
+
+def parse_messages(category, bodies):
+    """Parse a batch of message bodies of one category; returns (records, unparsed count)."""
+    function = getattr(parser, CATEGORIES[category][0])
+    try:
+        parsed = function({category: bodies})
+    except Exception:
+        # One malformed message fails the whole batch for the split-based parsers; isolate it
+        parsed = []
+        for body in bodies:
+            try:
+                parsed.extend(function({category: [body]}))
+            except Exception as e:
+                logger.debug(f"Could not parse {category} message: {e}")
+    return parsed, len(bodies) - len(parsed)
+
+
+def iter_messages(path):
+    """Stream message bodies from an SMS backup without loading the whole tree."""
+    context = ET.iterparse(path, events=('start', 'end'))
+    root = None
+    for event, element in context:
+        if root is None:
+            root = element
+        if event == 'end' and element.tag == parser.SMS_TAG:
+            yield element.get('body') or ''
+            root.clear()
+
+
+def ensure_app_tables(conn):
+    for table_name, columns in APP_TABLES.items():
+        definitions = ', '.join(
+            f"{column} {'INTEGER' if column in INTEGER_COLUMNS else 'TEXT'}"
+            f"{' UNIQUE' if column == 'transaction_id' else ''}"
+            for column in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name} "
+                     f"(id INTEGER PRIMARY KEY AUTOINCREMENT, {definitions})")
+    conn.commit()
+
+
+def ensure_status_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATUS_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            db_path TEXT,
+            status TEXT,
+            messages INTEGER DEFAULT 0,
+            inserted INTEGER DEFAULT 0,
+            duplicates INTEGER DEFAULT 0,
+            unparsed INTEGER DEFAULT 0,
+            queued_at TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            seconds REAL,
+            messages_per_second REAL,
+            error TEXT,
+            UNIQUE (path, size, mtime_ns)
+        )
+    """)
+    conn.commit()
+
+
+class ShardWriter:
+    """Observers and a write lock for one target database."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        # SketchStore first: its flush commits the batch's rows together with the sketches
+        self.observers = [SketchStore(), CounterpartyIndexer(), AnomalyDetector()]
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_app_tables(conn)
+            # Sketches only grow incrementally from here, so start from complete ones
+            sync_sketches(conn)
+            self.observers[2].prime(conn)
+        finally:
+            conn.close()
+
+    def write_batch(self, conn, records, progress, record_progress=None):
+        """
+        Insert ``records`` [(table, record)], feed the observers and commit.
+        ``record_progress`` is called before the commit so progress kept in
+        the same database is committed atomically with the rows.
+        """
+        inserted = 0
+        with self.lock:
+            for table_name, record in records:
+                columns = APP_TABLES[table_name]
+                cursor = conn.execute(
+                    f"INSERT OR IGNORE INTO {table_name} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    [record[column] for column in columns])
+                if cursor.rowcount == 1:
+                    inserted += 1
+                    for observer in self.observers:
+                        observer.observe(table_name, record, cursor.lastrowid)
+            progress['inserted'] += inserted
+            progress['duplicates'] += len(records) - inserted
+            if record_progress is not None:
+                record_progress()
+            for observer in self.observers:
+                try:
+                    observer.flush(conn)
+                except sqlite3.Error as e:
+                    logger.error(f"Error flushing ingest observer {type(observer).__name__}: {e}")
+            conn.commit()
+
+
+def _update_status(conn, file_id, values, commit=True):
+    assignments = ', '.join(f"{column} = ?" for column in values)
+    conn.execute(f"UPDATE {STATUS_TABLE} SET {assignments} WHERE id = ?", [*values.values(), file_id])
+    if commit:
+        conn.commit()
+
+
+class IngestDaemon:
+    """Polls the drop directory and ingests new files on a bounded worker pool."""
+
+    def __init__(self, drop_dir=DROP_DIR, workers=INGEST_WORKERS, state_db=DATABASE_NAME):
+        self.drop_dir = drop_dir
+        self.workers = max(1, workers)
+        self.state_db = state_db
+        self._writers = {}
+        self._writers_lock = threading.Lock()
+        self._status_lock = threading.Lock()
+        self._seen = {}
+        self._known = set()
+        self._stop = threading.Event()
+        os.makedirs(drop_dir, exist_ok=True)
+        self._status_conn = sqlite3.connect(state_db, timeout=30, check_same_thread=False)
+        ensure_status_table(self._status_conn)
+        self._known = set(self._status_conn.execute(f"SELECT path, size, mtime_ns FROM {STATUS_TABLE}"))
+
+    def target_for(self, relative_path):
+        parts = relative_path.split(os.sep)
+        if router.sharded and len(parts) > 1:
+            return router.shard_for(parts[0])
+        return router.default_path if router.sharded else self.state_db
+
+    def _writer(self, db_path):
+        with self._writers_lock:
+            writer = self._writers.get(db_path)
+            if writer is None:
+                writer = self._writers[db_path] = ShardWriter(db_path)
+            return writer
+
+    def scan(self):
+        """
+        New files whose size and mtime are unchanged since the previous scan
+        and older than ``SETTLE_SECONDS``, as (relative path, size, mtime_ns).
+        """
+        ready = []
+        now = time.time()
+        for directory, subdirectories, files in os.walk(self.drop_dir):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            for name in files:
+                if name.startswith('.') or not name.lower().endswith('.xml'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                relative = os.path.relpath(path, self.drop_dir)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                previous = self._seen.get(relative)
+                self._seen[relative] = signature
+                if (relative, *signature) in self._known:
+                    continue
+                # A file still being written changes between scans; wait until it settles
+                if previous == signature and now - stat.st_mtime >= SETTLE_SECONDS:
+                    ready.append((relative, *signature))
+        return ready
+
+    def enqueue(self, relative, size, mtime_ns):
+        """Record a queued file; returns its status row id, or None if already known."""
+        self._known.add((relative, size, mtime_ns))
+        with self._status_lock:
+            cursor = self._status_conn.execute(
+                f"INSERT OR IGNORE INTO {STATUS_TABLE} (path, size, mtime_ns, db_path, status, queued_at) "
+                f"VALUES (?, ?, ?, ?, 'queued', ?)",
+                (relative, size, mtime_ns, self.target_for(relative), datetime.now().isoformat()))
+            self._status_conn.commit()
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    def recover(self):
+        """Requeue files that were queued or interrupted mid-ingest by a crash."""
+        with self._status_lock:
+            self._status_conn.execute(
+                f"UPDATE {STATUS_TABLE} SET status = 'queued' WHERE status = 'processing'")
+            self._status_conn.commit()
+            rows = self._status_conn.execute(
+                f"SELECT id, path, size, mtime_ns FROM {STATUS_TABLE} WHERE status = 'queued' ORDER BY id"
+            ).fetchall()
+        pending = []
+        for file_id, relative, size, mtime_ns in rows:
+            path = os.path.join(self.drop_dir, relative)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                with self._status_lock:
+                    _update_status(self._status_conn, file_id, {'status': 'missing'})
+                continue
+            pending.append(file_id)
+        if pending:
+            logger.info(f"Resuming {len(pending)} queued or interrupted files")
+        return pending
+
+    def ingest(self, file_id):
+        """Ingest one queued file, resuming after the messages already committed."""
+        with self._status_lock:
+            relative, db_path, done, inserted, duplicates, unparsed = self._status_conn.execute(
+                f"SELECT path, db_path, messages, inserted, duplicates, unparsed FROM {STATUS_TABLE} WHERE id = ?",
+                (file_id,)).fetchone()
+            _update_status(self._status_conn, file_id,
+                           {'status': 'processing', 'started_at': datetime.now().isoformat(), 'error': None})
+        path = os.path.join(self.drop_dir, relative)
+        writer = self._writer(db_path)
+        conn = sqlite3.connect(db_path, timeout=30)
+        same_db = os.path.abspath(db_path) == os.path.abspath(self.state_db)
+        progress = {'messages': done, 'inserted': inserted, 'duplicates': duplicates, 'unparsed': unparsed}
+        start = time.perf_counter()
+        processed = 0
+
+        def flush(batch):
+            records = []
+            with profile_stage('parse_batch'):
+                for category, bodies in batch.items():
+                    parsed, failed = parse_messages(category, bodies)
+                    progress['unparsed'] += failed
+                    table_name = CATEGORIES[category][1]
+                    records.extend((table_name, to_app_record(table_name, record)) for record in parsed)
+            with profile_stage('write_batch'):
+                write(records)
+
+        def write(records):
+            if same_db:
+                writer.write_batch(conn, records, progress,
+                                   lambda: _update_status(conn, file_id, progress, commit=False))
+            else:
+                # Progress is recorded after the rows are committed; resuming may
+                # re-read a batch, which INSERT OR IGNORE skips
+                writer.write_batch(conn, records, progress)
+                with self._status_lock:
+                    _update_status(self._status_conn, file_id, progress)
+
+        try:
+            with profile_stage('ingest_file'):
+                batch, batch_size = {}, 0
+                for index, body in enumerate(iter_messages(path)):
+                    if index < done:
+                        continue
+                    category = classify(body)
+                    if category is None:
+                        progress['unparsed'] += 1
+                    else:
+                        batch.setdefault(category, []).append(body)
+                    batch_size += 1
+                    if batch_size >= BATCH_SIZE:
+                        progress['messages'] += batch_size
+                        processed += batch_size
+                        flush(batch)
+                        batch, batch_size = {}, 0
+                progress['messages'] += batch_size
+                processed += batch_size
+                flush(batch)
+            status = 'done'
+            error = None
+        except (ET.ParseError, OSError, sqlite3.Error) as e:
+            status = 'failed'
+            error = str(e)
+            logger.error(f"Error ingesting {relative}: {e}")
+        finally:
+            conn.close()
+
+        seconds = time.perf_counter() - start
+        rate = round(processed / seconds, 1) if seconds > 0 else None
+        with self._status_lock:
+            _update_status(self._status_conn, file_id, {
+                'status': status, 'error': error, 'finished_at': datetime.now().isoformat(),
+                'seconds': round(seconds, 3), 'messages_per_second': rate})
+        if status == 'done':
+            logger.info(
+                f"Ingested {relative} into {db_path}: {progress['messages']} messages, "
+                f"{progress['inserted']} new rows, {progress['duplicates']} duplicates, "
+                f"{progress['unparsed']} unparsed ({rate} messages/s)")
+        return status
+
+    def _run_file(self, file_id):
+        try:
+            return self.ingest(file_id)
+        except Exception as e:
+            logger.error(f"Unexpected error ingesting file {file_id}: {e}")
+            with self._status_lock:
+                _update_status(self._status_conn, file_id, {'status': 'failed', 'error': str(e)})
+            return 'failed'
+
+    def run(self, once=False):
+        """Poll and ingest until stopped; with ``once``, ingest the files present and return."""
+        logger.info(f"Watching {self.drop_dir} with {self.workers} workers")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+
+            def submit(file_id):
+                futures.append(executor.submit(self._run_file, file_id))
+
+            for file_id in self.recover():
+                submit(file_id)
+            scans = 0
+            while not self._stop.is_set():
+                for relative, size, mtime_ns in self.scan():
+                    file_id = self.enqueue(relative, size, mtime_ns)
+                    if file_id is not None:
+                        submit(file_id)
+                futures[:] = [future for future in futures if not future.done()]
+                scans += 1
+                # A file is ready on the second scan that sees it unchanged
+                if once and scans >= 2:
+                    break
+                self._stop.wait(POLL_SECONDS)
+            for future in futures:
+                future.result()
+        self._status_conn.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+def get_ingest_status(conn, limit=50):
+    """Most recent files seen by the ingest daemon, newest first."""
+    try:
+        rows = conn.execute(f"SELECT * FROM {STATUS_TABLE} ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    except sqlite3.Error as e:
+        if 'no such table' in str(e):
+            return []
+        logging.error(f"Error reading ingest status: {e}")
+        return {'error': str(e)}
+    return [dict(row) for row in rows]
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Ingest SMS backups dropped into a directory.')
+    arguments.add_argument('drop_dir', nargs='?', default=DROP_DIR)
+    arguments.add_argument('--once', action='store_true', help='ingest the files present and exit')
+    arguments.add_argument('--workers', type=int, default=INGEST_WORKERS)
+    options = arguments.parse_args()
+
+    configure_logging()
+    daemon = IngestDaemon(options.drop_dir, options.workers)
+    try:
+        daemon.run(once=options.once)
+    except KeyboardInterrupt:
+        # Files interrupted mid-ingest are resumed on the next start
+        logger.info("Ingest daemon stopped")
@@ -0,0 +1,357 @@
+"""
+Background jobs for heavy analytics and exports
+
+Data summary exports, full-table stats and CSV exports can take longer
+than a browser is willing to wait. Instead of running in the request
+thread they are submitted as jobs: the request returns at once with a
+job id, a bounded pool of ``MOMO_JOB_WORKERS`` threads does the work, and
+the client polls the job for its status and progress and downloads the
+result file once it is done.
+
+Jobs are kept in the ``jobs`` table of their own SQLite file
+(``MOMO_JOBS_DB``), so their status survives a restart. Commits there do
+not change the data version of the transaction database, so queueing and
+running jobs leaves the result cache alone. Progress within a running job
+is only kept in memory; the table is written when a job changes status.
+Jobs that were queued or running when the process stopped are queued
+again on the next start; every job kind is safe to rerun. Result files
+are written to ``MOMO_JOB_DIR`` and removed with their job
+``MOMO_JOB_RETENTION_HOURS`` after it finished.
+"""
+
+import csv
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from db import DATABASE_NAME
+from shards import use_shard
+from profiler import ProfiledConnection
+from summaries import TRANSACTION_TABLES
+from helpers import analyze_table_transactions
+from fees import analyze_fees
+from ledger import build_balance_timeline, DEFAULT_POINTS, DEFAULT_TOLERANCE
+from reports import generate_report, report_path_for, write_report_atomically
+
+JOBS_DB = os.environ.get('MOMO_JOBS_DB', 'momo_jobs.db')
+JOB_WORKERS = int(os.environ.get('MOMO_JOB_WORKERS', '2'))
+JOB_DIR = os.environ.get('MOMO_JOB_DIR', 'job_results')
+RETENTION_HOURS = float(os.environ.get('MOMO_JOB_RETENTION_HOURS', '24'))
+EXPORT_BATCH_SIZE = 5000
+JOBS_TABLE = 'jobs'
+
+logger = logging.getLogger('momo.jobs')
+
+
+class JobContext:
+    """What a running job gets: its database, result location and progress reporting."""
+
+    def __init__(self, queue, job_id, kind, db_path):
+        self.queue = queue
+        self.job_id = job_id
+        self.kind = kind
+        self.db_path = db_path
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, factory=ProfiledConnection)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def progress(self, done, total, message=None):
+        self.queue._set_progress(self.job_id, round(done / total, 4) if total else 1.0, message)
+
+    def result_path(self, extension):
+        return os.path.join(self.queue.result_dir, f"{self.job_id}.{extension}")
+
+    def write_json(self, result):
+        """Write an analytics result as the job's JSON result file; ``{'error': ...}`` fails the job."""
+        if isinstance(result, dict) and 'error' in result:
+            raise RuntimeError(result['error'])
+        path = self.result_path('json')
+        write_report_atomically(result, path)
+        return path
+
+
+def run_export_summary(context):
+    # Written to the usual report file first so unchanged tables are reused from the last export
+    report_path = report_path_for(context.db_path)
+    generate_report(context.db_path, report_path,
+                    progress=lambda done, total: context.progress(done, total, f"Summarized {done} of {total} tables"))
+    path = context.result_path('json')
+    shutil.copyfile(report_path, path)
+    return path
+
+
+def run_table_stats(context, table=None):
+    tables = [table] if table else TRANSACTION_TABLES
+    results = {}
+    conn = context.connect()
+    try:
+        for done, table_name in enumerate(tables, 1):
+            stats = analyze_table_transactions(table_name, conn)
+            if 'error' in stats:
+                raise RuntimeError(f"{table_name}: {stats['error']}")
+            results[table_name] = stats
+            context.progress(done, len(tables), f"Analyzed {table_name}")
+    finally:
+        conn.close()
+    return context.write_json(results[table] if table else results)
+
+
+def run_fee_analytics(context, table=None):
+    conn = context.connect()
+    try:
+        return context.write_json(analyze_fees(conn, [table] if table else TRANSACTION_TABLES))
+    finally:
+        conn.close()
+
+
+def run_balance_timeline(context, points=DEFAULT_POINTS, start=None, end=None, tolerance=DEFAULT_TOLERANCE):
+    conn = context.connect()
+    try:
+        return context.write_json(
+            build_balance_timeline(conn, int(points), start, end, float(tolerance)))
+    finally:
+        conn.close()
+
+
+def run_export_table(context, table, start=None, end=None):
+    """Stream a table (optionally a date range) to CSV, oldest transaction first."""
+    conditions, params = [], []
+    if start:
+        conditions.append('date >= ?')
+        params.append(start)
+    if end:
+        conditions.append('date < ?')
+        params.append(end)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    path = context.result_path('csv')
+    partial_path = path + '.part'
+    conn = context.connect()
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+        cursor = conn.execute(f"SELECT * FROM {table}{where} ORDER BY date, id", params)
+        with open(partial_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(column[0] for column in cursor.description)
+            done = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                done += len(rows)
+                context.progress(done, total, f"Exported {done} of {total} rows")
+        os.replace(partial_path, path)
+    finally:
+        conn.close()
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+    return path
+
+
+# Job kind -> runner, accepted parameters and required parameters
+JOB_KINDS = {
+    'export-summary': {'run': run_export_summary, 'params': (), 'required': ()},
+    'table-stats': {'run': run_table_stats, 'params': ('table',), 'required': ()},
+    'fee-analytics': {'run': run_fee_analytics, 'params': ('table',), 'required': ()},
+    'balance-timeline': {'run': run_balance_timeline, 'params': ('points', 'start', 'end', 'tolerance'),
+                         'required': ()},
+    'export-table': {'run': run_export_table, 'params': ('table', 'start', 'end'), 'required': ('table',)},
+}
+
+
+def validate_job(kind, params):
+    """Check a submission before it is queued; raises ``ValueError`` with the reason."""
+    spec = JOB_KINDS.get(kind)
+    if spec is None:
+        raise ValueError(f"Unknown job kind: {kind} (expected one of {', '.join(JOB_KINDS)})")
+    if not isinstance(params, dict):
+        raise ValueError('params must be an object')
+    params = {name: value for name, value in params.items() if value is not None}
+    unknown = sorted(set(params) - set(spec['params']))
+    if unknown:
+        raise ValueError(f"Unknown parameters for {kind}: {', '.join(unknown)}")
+    missing = [name for name in spec['required'] if name not in params]
+    if missing:
+        raise ValueError(f"Missing parameters for {kind}: {', '.join(missing)}")
+    if 'table' in params and params['table'] not in TRANSACTION_TABLES:
+        raise ValueError(f"Unknown table: {params['table']}")
+    return params
+
+
+def ensure_jobs_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+            id TEXT PRIMARY KEY,
+            kind TEXT,
+            params TEXT,
+            db_path TEXT,
+            status TEXT,
+            progress REAL DEFAULT 0,
+            message TEXT,
+            result_path TEXT,
+            error TEXT,
+            submitted_at TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            seconds REAL
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{JOBS_TABLE}_submitted_at ON {JOBS_TABLE}(submitted_at)")
+    conn.commit()
+
+
+def _job_dict(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'] or '{}')
+    return job
+
+
+class JobQueue:
+    """Persistent job table plus the worker pool that runs the jobs."""
+
+    def __init__(self, state_db=JOBS_DB, result_dir=JOB_DIR, workers=JOB_WORKERS):
+        self.state_db = state_db
+        self.result_dir = result_dir
+        self.workers = max(1, workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        # job id -> (progress, message) while the job is running
+        self._progress = {}
+        self._progress_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.state_db, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id, values):
+        assignments = ', '.join(f"{column} = ?" for column in values)
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE {JOBS_TABLE} SET {assignments} WHERE id = ?", [*values.values(), job_id])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _set_progress(self, job_id, progress, message):
+        with self._progress_lock:
+            self._progress[job_id] = (progress, message)
+
+    def _with_progress(self, job):
+        with self._progress_lock:
+            current = self._progress.get(job['id'])
+        if current is not None and job['status'] == 'running':
+            job['progress'], job['message'] = current
+        return job
+
+    def start(self):
+        """Create the table and worker pool on first use and requeue jobs a restart interrupted."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            os.makedirs(self.result_dir, exist_ok=True)
+            conn = self._connect()
+            try:
+                ensure_jobs_table(conn)
+                self._prune(conn)
+                conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET status = 'queued', progress = 0, message = NULL, started_at = NULL "
+                    f"WHERE status = 'running'")
+                conn.commit()
+                pending = [row['id'] for row in conn.execute(
+                    f"SELECT id FROM {JOBS_TABLE} WHERE status = 'queued' ORDER BY submitted_at")]
+            finally:
+                conn.close()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='momo-job')
+        if pending:
+            logger.info(f"Requeued {len(pending)} interrupted jobs")
+        for job_id in pending:
+            self._executor.submit(self._run, job_id)
+
+    def _prune(self, conn):
+        cutoff = (datetime.now() - timedelta(hours=RETENTION_HOURS)).isoformat()
+        expired = conn.execute(
+            f"SELECT id, result_path FROM {JOBS_TABLE} WHERE finished_at < ?", (cutoff,)).fetchall()
+        for row in expired:
+            if row['result_path'] and os.path.exists(row['result_path']):
+                os.unlink(row['result_path'])
+        conn.executemany(f"DELETE FROM {JOBS_TABLE} WHERE id = ?", [(row['id'],) for row in expired])
+
+    def submit(self, kind, params=None, db_path=DATABASE_NAME):
+        """Queue a job and return it; raises ``ValueError`` for an invalid submission."""
+        params = validate_job(kind, params or {})
+        self.start()
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            self._prune(conn)
+            conn.execute(
+                f"INSERT INTO {JOBS_TABLE} (id, kind, params, db_path, status, progress, submitted_at) "
+                f"VALUES (?, ?, ?, ?, 'queued', 0, ?)",
+                (job_id, kind, json.dumps(params), db_path, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Queued job {job_id} ({kind} on {db_path})")
+        return self.get(job_id)
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if job is None or job['status'] != 'queued':
+            return None
+        self._update(job_id, {'status': 'running', 'started_at': datetime.now().isoformat()})
+        context = JobContext(self, job_id, job['kind'], job['db_path'])
+        start = time.perf_counter()
+        try:
+            with use_shard(job['db_path']):
+                result_path = JOB_KINDS[job['kind']]['run'](context, **job['params'])
+            values = {'status': 'done', 'progress': 1.0, 'message': None, 'result_path': result_path}
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['kind']}) failed: {e}")
+            values = {'status': 'failed', 'error': str(e)}
+        seconds = time.perf_counter() - start
+        values.update({'finished_at': datetime.now().isoformat(), 'seconds': round(seconds, 3)})
+        self._update(job_id, values)
+        with self._progress_lock:
+            self._progress.pop(job_id, None)
+        if values['status'] == 'done':
+            logger.info(f"Job {job_id} ({job['kind']}) finished in {seconds:.2f}s")
+        return values['status']
+
+    def get(self, job_id):
+        self.start()
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT * FROM {JOBS_TABLE} WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._with_progress(_job_dict(row)) if row is not None else None
+
+    def list_jobs(self, limit=50, status=None):
+        self.start()
+        query = f"SELECT * FROM {JOBS_TABLE}"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY submitted_at DESC LIMIT ?"
+        params.append(max(1, limit))
+        conn = self._connect()
+        try:
+            return [self._with_progress(_job_dict(row)) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+
+
+job_queue = JobQueue()
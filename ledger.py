@@ -0,0 +1,179 @@
+"""
+Unified balance timeline across all transaction categories
+
+Every table records the ``new_balance`` after each transaction. Each
+table is streamed in time order with ``fetchmany`` and the streams are
+k-way merged with ``heapq.merge`` into a single balance series, so memory
+stays proportional to the number of tables and output points rather than
+the number of rows. Consecutive balances are reconciled against the
+transaction amount and fee, and mismatches are reported as gaps.
+"""
+
+import heapq
+import logging
+import math
+import sqlite3
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES, get_table_columns
+
+LEDGER_TABLES = TRANSACTION_TABLES + ['bank_deposits']
+# Tables whose amount is added to the balance; every other table is a debit
+CREDIT_TABLES = {'incoming_money', 'bank_deposits'}
+
+BATCH_SIZE = 5000
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+MAX_GAPS = 100
+DEFAULT_TOLERANCE = 1
+
+
+def stream_table(conn, table_name, columns, start=None, end=None, batch_size=BATCH_SIZE):
+    """
+    Yield ``(date, table_name, rowid, amount, fee, new_balance)`` for one
+    table in time order, fetching ``batch_size`` rows at a time.
+    """
+    fee = 'COALESCE(fee, 0)' if 'fee' in columns else '0'
+    conditions = ['date IS NOT NULL', 'new_balance IS NOT NULL']
+    # The table name is selected as a bound value so rows can be yielded as-is
+    params = [table_name]
+    if start:
+        conditions.append('date >= ?')
+        params.append(start)
+    if end:
+        conditions.append('date <= ?')
+        params.append(end)
+    query = f"""
+    SELECT date, ?, rowid, COALESCE(amount, 0), {fee}, new_balance
+    FROM {table_name}
+    WHERE {' AND '.join(conditions)}
+    ORDER BY date, rowid
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def merged_transactions(conn, tables=None, start=None, end=None, batch_size=BATCH_SIZE):
+    """Merge the per-table streams into one stream ordered by date."""
+    tables = tables or LEDGER_TABLES
+    columns = get_table_columns(conn, tables)
+    streams = [
+        stream_table(conn, table, columns[table], start, end, batch_size)
+        for table in tables
+        if 'new_balance' in columns.get(table, [])
+    ]
+    return heapq.merge(*streams)
+
+
+def _bucket(start_date, last, low, high, transactions):
+    return {
+        'start_date': start_date,
+        'date': last[0],
+        'balance': last[2],
+        'min_balance': low,
+        'max_balance': high,
+        'transactions': transactions
+    }
+
+
+def count_transactions(conn, tables, start=None, end=None):
+    columns = get_table_columns(conn, tables)
+    total = 0
+    for table in tables:
+        if 'new_balance' not in columns.get(table, []):
+            continue
+        conditions = ['date IS NOT NULL', 'new_balance IS NOT NULL']
+        params = []
+        if start:
+            conditions.append('date >= ?')
+            params.append(start)
+        if end:
+            conditions.append('date <= ?')
+            params.append(end)
+        total += conn.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE {' AND '.join(conditions)}", params).fetchone()[0]
+    return total
+
+
+def build_balance_timeline(conn=None, points=DEFAULT_POINTS, start=None, end=None,
+                           tolerance=DEFAULT_TOLERANCE, tables=None, db_path=DATABASE_NAME):
+    """
+    Build the merged balance series downsampled to at most ``points``
+    buckets of consecutive transactions. Each bucket reports its closing
+    balance and the minimum and maximum balance inside it so spikes stay
+    visible on a chart. Up to ``MAX_GAPS`` reconciliation gaps are listed;
+    ``gap_count`` counts all of them.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    tables = tables or LEDGER_TABLES
+    points = max(1, min(int(points), MAX_POINTS))
+
+    try:
+        total = count_transactions(conn, tables, start, end)
+        bucket_size = max(1, math.ceil(total / points))
+
+        series = []
+        gaps = []
+        gap_count = 0
+        previous = None
+        # Current bucket kept in locals; this loop runs once per transaction
+        in_bucket = 0
+        bucket_start = low = high = None
+        for date, table_name, rowid, amount, fee, balance in merged_transactions(conn, tables, start, end):
+            if previous is not None:
+                if table_name in CREDIT_TABLES:
+                    expected = previous[2] + amount - fee
+                else:
+                    expected = previous[2] - amount - fee
+                if abs(balance - expected) > tolerance:
+                    gap_count += 1
+                    if len(gaps) < MAX_GAPS:
+                        gaps.append({
+                            'date': date,
+                            'table_name': table_name,
+                            'rowid': rowid,
+                            'previous_date': previous[0],
+                            'previous_table': previous[1],
+                            'previous_balance': previous[2],
+                            'expected_balance': expected,
+                            'actual_balance': balance,
+                            'difference': balance - expected
+                        })
+            previous = (date, table_name, balance)
+
+            if in_bucket == 0:
+                bucket_start = date
+                low = high = balance
+            elif balance < low:
+                low = balance
+            elif balance > high:
+                high = balance
+            in_bucket += 1
+            if in_bucket >= bucket_size:
+                series.append(_bucket(bucket_start, previous, low, high, in_bucket))
+                in_bucket = 0
+        if in_bucket:
+            series.append(_bucket(bucket_start, previous, low, high, in_bucket))
+    except sqlite3.Error as e:
+        logging.error(f"Error building balance timeline: {e}")
+        return {'error': str(e)}
+    finally:
+        if own_conn:
+            conn.close()
+
+    return {
+        'total_transactions': total,
+        'bucket_size': bucket_size,
+        'final_balance': previous[2] if previous else None,
+        'series': series,
+        'gap_count': gap_count,
+        'gaps': gaps
+    }
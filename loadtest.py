@@ -0,0 +1,384 @@
+"""
+Load test that replays the dashboard's request pattern
+
+Virtual users repeatedly run weighted scenarios modelled on what the
+browser does:
+
+- ``dashboard``: ``/`` followed by the nine ``/get-*`` fetches that
+  ``index.html`` issues one after another
+- ``page``: a category page render and the lazy rows requests it makes
+  while scrolling, each continuing from the previous page's cursor
+- ``stats``: the per-category stats and analytics endpoints
+
+The app is reached over HTTP (an already running server with ``--url``,
+or one started in this process with ``--serve``) or through Flask's test
+client (``--test-client``). Throughput, p50/p95/p99 latency and error
+rates are reported per route, and the results are saved as JSON so runs
+can be compared with ``--compare``.
+
+    python loadtest.py --serve --users 16 --duration 30 --output results.json
+    python loadtest.py --url http://127.0.0.1:5000 --compare results.json
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit, quote
+
+DASHBOARD_FETCHES = [
+    '/get-airtime-payments',
+    '/get-incoming-money',
+    '/get-transfers-to-mobile-numbers',
+    '/get-payments-to-code-holders',
+    '/get-bank-transfers',
+    '/get-bundle-purchases',
+    '/get-cashpower-payments',
+    '/get-third-party-transactions',
+    '/get-withdrawals-from-agents',
+]
+
+# Category page -> table whose rows it loads lazily
+CATEGORY_PAGES = {
+    '/airtime': 'airtime_payments',
+    '/incoming-money': 'incoming_money',
+    '/transfers-to-mobile': 'transfers_to_mobile_numbers',
+    '/code-holders': 'payments_to_code_holders',
+    '/bank-transfers': 'bank_transfers',
+    '/cash-power': 'cashpower_payments',
+    '/internet-voice': 'bundle_purchases',
+    '/third-parties': 'third_party_transactions',
+    '/agent-withdrawals': 'withdrawals_from_agents',
+}
+
+STATS_ENDPOINTS = [
+    '/get-airtime-payments-stats',
+    '/get-incoming-money-stats',
+    '/get-fee-analytics',
+    '/get-trends/incoming_money',
+    '/get-sketch-summary',
+    '/get-balance-timeline',
+    '/get-top-counterparties',
+]
+
+# Lazy rows pages a page visit scrolls through (at most)
+SCROLL_PAGES = 3
+ROWS_PAGE_SIZE = 50
+
+# The cursor the rendered page starts scrolling from (templates/lazy-rows.html)
+PAGE_CURSOR = re.compile(rb'let nextCursor = (.*?);')
+
+DEFAULT_MIX = 'dashboard=5,page=4,stats=1'
+PERCENTILES = (50, 95, 99)
+
+
+# Scenarios are generators: they yield request paths and are sent each
+# response as ``(status, body)``, so later requests can depend on earlier ones.
+
+def decode_body(body):
+    """Response body with gzip content encoding undone."""
+    return gzip.decompress(body) if body[:2] == b'\x1f\x8b' else body
+
+
+def dashboard_scenario(rng):
+    for path in ['/'] + DASHBOARD_FETCHES:
+        yield path
+
+
+def page_scenario(rng):
+    page, table = rng.choice(list(CATEGORY_PAGES.items()))
+    status, body = yield page
+    match = PAGE_CURSOR.search(decode_body(body)) if status == 200 else None
+    cursor = json.loads(match.group(1)) if match else None
+    # Scroll like the browser: each rows request continues from the last cursor
+    for _ in range(rng.randint(1, SCROLL_PAGES)):
+        if not cursor:
+            return
+        status, body = yield f"/get-table-rows/{table}?cursor={quote(str(cursor))}&limit={ROWS_PAGE_SIZE}"
+        if status != 200:
+            return
+        cursor = json.loads(decode_body(body)).get('next_cursor')
+
+
+def stats_scenario(rng):
+    for path in rng.sample(STATS_ENDPOINTS, 2):
+        yield path
+
+
+SCENARIOS = {
+    'dashboard': dashboard_scenario,
+    'page': page_scenario,
+    'stats': stats_scenario,
+}
+
+
+def parse_mix(spec):
+    """Parse ``"dashboard=5,page=4"`` into scenario weights."""
+    mix = {}
+    for entry in spec.split(','):
+        name, _, weight = entry.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name} (expected one of {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class HttpTransport:
+    """Keep-alive HTTP client; one connection per virtual user."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return conn
+
+    def get(self, path):
+        conn = self._connection()
+        try:
+            conn.request('GET', self.prefix + path, headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection so the next request reconnects
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+class TestClientTransport:
+    """Calls the app in-process through Flask's test client (no sockets)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def get(self, path):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+        return response.status_code, response.data
+
+
+def serve_in_background(app, host='127.0.0.1'):
+    """Start a threaded development server for ``app`` on a free port; returns (server, base URL)."""
+    from werkzeug.serving import make_server
+
+    server = make_server(host, 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+class LoadTest:
+    def __init__(self, transport, users=8, duration=30.0, warmup=2.0, mix=None, seed=None):
+        self.transport = transport
+        self.users = users
+        self.duration = duration
+        self.warmup = warmup
+        self.mix = mix or parse_mix(DEFAULT_MIX)
+        self.seed = seed
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def _user(self, index, measure_from, stop_at):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        samples = []
+        while time.perf_counter() < stop_at:
+            scenario = rng.choices(names, weights)[0]
+            requests = SCENARIOS[scenario](rng)
+            path = next(requests, None)
+            while path is not None:
+                start = time.perf_counter()
+                error = None
+                try:
+                    status, body = self.transport.get(path)
+                except Exception as e:
+                    status, body, error = None, b'', f"{type(e).__name__}: {e}"
+                end = time.perf_counter()
+                if start >= measure_from:
+                    # Report cursor requests under their route, not one entry per cursor
+                    samples.append((scenario, path.split('?', 1)[0], status, end - start, len(body), error))
+                if end >= stop_at:
+                    break
+                try:
+                    path = requests.send((status, body))
+                except StopIteration:
+                    path = None
+        with self._lock:
+            self._samples.extend(samples)
+
+    def run(self):
+        start = time.perf_counter()
+        measure_from = start + self.warmup
+        stop_at = measure_from + self.duration
+        threads = [
+            threading.Thread(target=self._user, args=(index, measure_from, stop_at), daemon=True)
+            for index in range(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(self._samples, self.duration)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _stats(samples, duration):
+    latencies = sorted(sample[3] for sample in samples)
+    errors = [sample for sample in samples if sample[5] is not None or sample[2] is None or sample[2] >= 400]
+    stats = {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / duration, 2) if duration else None,
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(samples), 4) if samples else 0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+        'bytes': sum(sample[4] for sample in samples),
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        stats[f"p{p}_ms"] = round(value * 1000, 2) if value is not None else None
+    statuses = {}
+    for sample in samples:
+        key = str(sample[2]) if sample[2] is not None else 'exception'
+        statuses[key] = statuses.get(key, 0) + 1
+    stats['statuses'] = statuses
+    return stats
+
+
+def summarize(samples, duration):
+    by_route = {}
+    by_scenario = {}
+    for sample in samples:
+        by_scenario.setdefault(sample[0], []).append(sample)
+        by_route.setdefault(sample[1], []).append(sample)
+    first_errors = sorted({sample[5] for sample in samples if sample[5]})[:10]
+    return {
+        'overall': _stats(samples, duration),
+        'scenarios': {name: _stats(group, duration) for name, group in sorted(by_scenario.items())},
+        'routes': {path: _stats(group, duration) for path, group in sorted(by_route.items())},
+        'error_messages': first_errors,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    header = f"{'route':<40} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6}"
+    print(header)
+    print('-' * len(header))
+    rows = [('OVERALL', results['overall'])] + list(results['routes'].items())
+    for name, stats in rows:
+        print(f"{name[:40]:<40} {stats['requests']:>7} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']!s:>8} {stats['p95_ms']!s:>8} {stats['p99_ms']!s:>8} "
+              f"{stats['error_rate'] * 100:>6.2f}")
+        if baseline is not None:
+            previous = (baseline['overall'] if name == 'OVERALL' else baseline['routes'].get(name))
+            if previous:
+                print(f"{'  vs baseline':<40} {'':>7} {_delta(stats, previous, 'throughput_rps'):>8} "
+                      f"{_delta(stats, previous, 'p50_ms'):>8} {_delta(stats, previous, 'p95_ms'):>8} "
+                      f"{_delta(stats, previous, 'p99_ms'):>8}")
+    for message in results['error_messages']:
+        print(f"error: {message}")
+
+
+def _delta(current, previous, key):
+    if not current.get(key) or not previous.get(key):
+        return '-'
+    return f"{(current[key] - previous[key]) / previous[key] * 100:+.0f}%"
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='Replay dashboard traffic against the MoMo app.')
+    target = arguments.add_mutually_exclusive_group()
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--serve', action='store_true', help='start the app on a local port in this process')
+    target.add_argument('--test-client', action='store_true', help="use Flask's test client (default)")
+    arguments.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    arguments.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    arguments.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before measuring')
+    arguments.add_argument('--mix', default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    arguments.add_argument('--seed', type=int, help='seed for reproducible scenario choices')
+    arguments.add_argument('--output', help='write results to this JSON file')
+    arguments.add_argument('--compare', help='print deltas against a previous results file')
+    options = arguments.parse_args(argv)
+
+    server = None
+    if options.url:
+        transport = HttpTransport(options.url)
+        target_name = options.url
+    else:
+        from app import app
+        if options.serve:
+            server, base_url = serve_in_background(app)
+            transport = HttpTransport(base_url)
+            target_name = base_url
+        else:
+            transport = TestClientTransport(app)
+            target_name = 'test-client'
+
+    test = LoadTest(transport, options.users, options.duration, options.warmup,
+                    parse_mix(options.mix), options.seed)
+    try:
+        results = test.run()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    results['run'] = {
+        'started_at': datetime.now().isoformat(),
+        'target': target_name,
+        'revision': git_revision(),
+        'users': options.users,
+        'duration': options.duration,
+        'warmup': options.warmup,
+        'mix': parse_mix(options.mix),
+        'python': sys.version.split()[0],
+    }
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {options.output}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Logging setup
+
+Log records are handed to a queue and written by a background listener
+thread, so a request or an ingest run never waits on the log file. The
+file rotates by size. Levels can be set per subsystem: a logger name
+(e.g. ``momo.sql``) or, for code logging through the root logger, a
+module name (e.g. ``summaries``):
+
+    MOMO_LOG_LEVEL=INFO MOMO_LOG_LEVELS="summaries=WARNING,momo.ingest=DEBUG"
+
+Messages emitted on every request or record go through ``sampled()``,
+which lets the first occurrence and then one in ``MOMO_LOG_SAMPLE_EVERY``
+through.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = os.environ.get('MOMO_LOG_FILE', 'momo_analytics.log')
+LOG_MAX_BYTES = int(os.environ.get('MOMO_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get('MOMO_LOG_BACKUPS', '5'))
+LOG_LEVEL = os.environ.get('MOMO_LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('MOMO_LOG_LEVELS', '')
+SAMPLE_EVERY = max(1, int(os.environ.get('MOMO_LOG_SAMPLE_EVERY', '100')))
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+_configure_lock = threading.Lock()
+_sample_counts = {}
+_sample_lock = threading.Lock()
+
+
+def parse_levels(spec):
+    """Parse ``"name=LEVEL,name=LEVEL"`` into ``{name: level number}``, skipping bad entries."""
+    levels = {}
+    for entry in spec.split(','):
+        name, _, level = entry.partition('=')
+        level = logging.getLevelName(level.strip().upper())
+        if name.strip() and isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+class SubsystemFilter(logging.Filter):
+    """Applies per-module levels to records logged through the root logger."""
+
+    def __init__(self, levels):
+        super().__init__()
+        self.levels = levels
+
+    def filter(self, record):
+        if record.name != 'root':
+            # Named loggers have their level set directly
+            return True
+        level = self.levels.get(record.module)
+        return level is None or record.levelno >= level
+
+
+def configure_logging(level=LOG_LEVEL, levels=LOG_LEVELS, log_file=LOG_FILE):
+    """
+    Route the root logger through a queue to a rotating file and stderr.
+    Safe to call more than once; only the first call configures.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        file_handler = RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8', delay=True)
+        stream_handler = logging.StreamHandler()
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+
+        levels = parse_levels(levels) if isinstance(levels, str) else dict(levels)
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(SubsystemFilter(levels))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        for name, name_level in levels.items():
+            logging.getLogger(name).setLevel(name_level)
+
+        _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
+
+
+def sampled(key, every=SAMPLE_EVERY):
+    """
+    Count an occurrence of ``key`` and return the count if this occurrence
+    should be logged (the first and every ``every``-th), otherwise 0.
+    """
+    with _sample_lock:
+        count = _sample_counts.get(key, 0) + 1
+        _sample_counts[key] = count
+    return count if count == 1 or count % every == 0 else 0
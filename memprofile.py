@@ -0,0 +1,232 @@
+"""
+Memory profiling for ingestion stages and API requests
+
+Profiling is off by default. ``MOMO_MEMPROFILE=1`` profiles every request
+and ingest stage; a request sent with the ``X-Memory-Profile: 1`` header
+is profiled on its own. A profiled stage takes ``tracemalloc`` snapshots
+when it starts and finishes, and its report holds:
+
+- the peak traced memory during the stage, including nested stages
+- the top allocation sites still alive at the end
+- the diff between the two snapshots
+
+Reports are appended as JSON lines to ``MOMO_MEMPROFILE_FILE`` and served
+with per-stage and per-route peaks on ``/get-memory-profile``. Peaks are
+process-wide, so concurrent profiled requests inflate each other's numbers.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, jsonify, request
+
+ENABLED = os.environ.get('MOMO_MEMPROFILE', '0') == '1'
+PROFILE_FILE = os.environ.get('MOMO_MEMPROFILE_FILE', 'memory_profile.jsonl')
+FRAMES = int(os.environ.get('MOMO_MEMPROFILE_FRAMES', '1'))
+TOP_SITES = int(os.environ.get('MOMO_MEMPROFILE_TOP', '15'))
+HEADER = 'X-Memory-Profile'
+MAX_REPORTS = 100
+
+# Allocations made by the profiler itself are left out of the reports
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _site(traceback):
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class Measurement:
+    """One profiled stage, from ``MemoryProfiler.start`` to ``finish``."""
+
+    def __init__(self, profiler, kind, name, started_tracing):
+        self.profiler = profiler
+        self.kind = kind
+        self.name = name
+        self.started_tracing = started_tracing
+        self.started_at = datetime.now().isoformat()
+        self.start_time = time.perf_counter()
+        self.peak = 0
+        self.before = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        self.start_bytes = tracemalloc.get_traced_memory()[0]
+
+    def finish(self):
+        return self.profiler.finish(self)
+
+
+class MemoryProfiler:
+    """Collects stage reports and keeps per-stage and per-route peaks."""
+
+    def __init__(self, profile_file=PROFILE_FILE, top=TOP_SITES):
+        self.profile_file = profile_file
+        self.top = top
+        self._lock = threading.RLock()
+        self._active = []
+        self._reports = deque(maxlen=MAX_REPORTS)
+        self._stages = {}
+        self._last_snapshot = None
+
+    def _checkpoint(self):
+        """Credit the peak since the last checkpoint to every active stage, then reset it."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for measurement in self._active:
+            measurement.peak = max(measurement.peak, peak)
+        tracemalloc.reset_peak()
+
+    def start(self, kind, name):
+        with self._lock:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(FRAMES)
+            self._checkpoint()
+            measurement = Measurement(self, kind, name, started_tracing)
+            self._active.append(measurement)
+            return measurement
+
+    def finish(self, measurement):
+        with self._lock:
+            self._checkpoint()
+            self._active.remove(measurement)
+            current = tracemalloc.get_traced_memory()[0]
+            after = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            # Tracing started for this stage only (header-triggered) stops with it
+            if measurement.started_tracing and not self._active and not ENABLED:
+                tracemalloc.stop()
+
+        top = after.statistics('lineno')[:self.top]
+        diff = after.compare_to(measurement.before, 'lineno')[:self.top]
+        report = {
+            'kind': measurement.kind,
+            'name': measurement.name,
+            'started_at': measurement.started_at,
+            'seconds': round(time.perf_counter() - measurement.start_time, 4),
+            'start_bytes': measurement.start_bytes,
+            'end_bytes': current,
+            'peak_bytes': measurement.peak,
+            'peak_increase_bytes': max(0, measurement.peak - measurement.start_bytes),
+            'top_allocations': [
+                {'site': _site(stat.traceback), 'size': stat.size, 'count': stat.count} for stat in top
+            ],
+            'diff': [
+                {'site': _site(stat.traceback), 'size_diff': stat.size_diff,
+                 'count_diff': stat.count_diff, 'size': stat.size}
+                for stat in diff if stat.size_diff or stat.count_diff
+            ],
+        }
+        self._record(report)
+        return report
+
+    def _record(self, report):
+        key = f"{report['kind']}:{report['name']}"
+        with self._lock:
+            self._reports.append(report)
+            stage = self._stages.setdefault(key, {'runs': 0, 'max_peak_increase_bytes': 0, 'total_seconds': 0.0})
+            stage['runs'] += 1
+            stage['max_peak_increase_bytes'] = max(stage['max_peak_increase_bytes'], report['peak_increase_bytes'])
+            stage['last_peak_increase_bytes'] = report['peak_increase_bytes']
+            stage['total_seconds'] = round(stage['total_seconds'] + report['seconds'], 4)
+        if self.profile_file:
+            try:
+                with open(self.profile_file, 'a') as f:
+                    f.write(json.dumps(report) + '\n')
+            except OSError as e:
+                logging.warning(f"Could not write memory profile to {self.profile_file}: {e}")
+        logging.info(
+            f"Memory profile {report['kind']} {report['name']}: peak +{report['peak_increase_bytes'] / 1024:.0f} KiB, "
+            f"retained {(report['end_bytes'] - report['start_bytes']) / 1024:+.0f} KiB")
+
+    def snapshot_diff(self):
+        """Top differences since the previous call (the first call only sets the baseline)."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            previous, self._last_snapshot = self._last_snapshot, snapshot
+        if previous is None:
+            return []
+        return [
+            {'site': _site(stat.traceback), 'size_diff': stat.size_diff,
+             'count_diff': stat.count_diff, 'size': stat.size}
+            for stat in snapshot.compare_to(previous, 'lineno')[:self.top]
+        ]
+
+    def summary(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'tracing': tracemalloc.is_tracing(),
+                'traced_bytes': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+                'stages': {key: dict(stage) for key, stage in sorted(self._stages.items())},
+                'reports': list(self._reports),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._reports.clear()
+            self._stages.clear()
+            self._last_snapshot = None
+
+
+memory_profiler = MemoryProfiler()
+
+
+@contextmanager
+def profile_stage(name, kind='ingest', enabled=None):
+    """Profile the enclosed block when profiling is enabled; otherwise do nothing."""
+    if not (ENABLED if enabled is None else enabled):
+        yield None
+        return
+    measurement = memory_profiler.start(kind, name)
+    try:
+        yield measurement
+    finally:
+        measurement.finish()
+
+
+def init_memprofile(app):
+    """Profile requests (all, or those sent with the header) and add ``/get-memory-profile``."""
+    if ENABLED:
+        tracemalloc.start(FRAMES)
+
+    @app.before_request
+    def start_memory_profile():
+        if ENABLED or request.headers.get(HEADER) == '1':
+            rule = request.url_rule
+            g.memory_measurement = memory_profiler.start('request', rule.rule if rule else request.path)
+
+    @app.after_request
+    def add_memory_header(response):
+        measurement = g.get('memory_measurement')
+        if measurement is not None:
+            peak = max(measurement.peak, tracemalloc.get_traced_memory()[1]) if tracemalloc.is_tracing() else 0
+            response.headers['X-Memory-Peak-Increase'] = str(max(0, peak - measurement.start_bytes))
+        return response
+
+    @app.teardown_request
+    def finish_memory_profile(exc=None):
+        measurement = g.pop('memory_measurement', None)
+        if measurement is not None:
+            measurement.finish()
+
+    @app.route('/get-memory-profile')
+    def get_memory_profile():
+        summary = memory_profiler.summary()
+        if request.args.get('compare') == '1':
+            summary['diff_since_last_compare'] = memory_profiler.snapshot_diff()
+        if request.args.get('reset') == '1':
+            memory_profiler.reset()
+        return jsonify(summary)
+
+    return memory_profiler
@@ -0,0 +1,268 @@
+"""
+Request instrumentation and Prometheus-style metrics
+
+Records, per route: a latency histogram, requests by status, requests
+in flight and a response size histogram. The time each request spends
+in SQLite, rendering templates and serializing JSON is recorded in
+separate histograms. SQLite time is measured by ``TimedConnection``,
+which ``get_db_connection`` passes as the connection factory. Everything
+is exposed on ``/metrics`` in the Prometheus text format.
+"""
+
+import bisect
+import contextvars
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, request, template_rendered, before_render_template
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Per-request accumulators: {'db': seconds, 'render': seconds, 'serialize': seconds}
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram; bucket counts are stored non-cumulatively."""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe store for the request metrics, keyed by label tuples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+
+    def _histogram(self, name, labels, bounds):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(bounds)
+        return histogram
+
+    def observe(self, name, labels, value, bounds=LATENCY_BUCKETS):
+        with self._lock:
+            self._histogram(name, labels, bounds).observe(value)
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_gauge(self, name, labels, amount):
+        with self._lock:
+            key = (name, labels)
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def describe(self, name, metric_type, text):
+        self.help[name] = (metric_type, text)
+
+    def render(self):
+        """Serialize every metric in the Prometheus text exposition format."""
+        with self._lock:
+            series = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                lines = series.setdefault(name, [])
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        output = []
+        for name in sorted(series):
+            metric_type, text = self.help.get(name, ('untyped', name))
+            output.append(f"# HELP {name} {text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(series[name])
+        return '\n'.join(output) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('momo_http_request_duration_seconds', 'histogram', 'Request latency by route')
+registry.describe('momo_http_requests_total', 'counter', 'Requests by route, method and status')
+registry.describe('momo_http_requests_in_flight', 'gauge', 'Requests currently being served by route')
+registry.describe('momo_http_response_size_bytes', 'histogram', 'Response body size (before compression) by route')
+registry.describe('momo_db_time_seconds', 'histogram', 'Time spent in SQLite per request by route')
+registry.describe('momo_render_time_seconds', 'histogram', 'Template rendering time per request by route')
+registry.describe('momo_serialization_time_seconds', 'histogram', 'JSON serialization time per request by route')
+
+
+def _add_timing(kind, seconds):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[kind] = timings.get(kind, 0.0) + seconds
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time spent executing and fetching to the current request."""
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            _add_timing('db', time.perf_counter() - start)
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            _add_timing('db', time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _add_timing('db', time.perf_counter() - start)
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            _add_timing('db', time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _add_timing('db', time.perf_counter() - start)
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _add_timing('db', time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including ``conn.execute``) are ``TimedCursor``s."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args, **kwargs):
+        return self.cursor().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self.cursor().executemany(*args, **kwargs)
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_metrics(app):
+    """Register the instrumentation hooks and the ``/metrics`` endpoint on ``app``."""
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = _route_label()
+        g.metrics_token = _request_timings.set({})
+        registry.add_gauge('momo_http_requests_in_flight', (('route', g.metrics_route),), 1)
+
+    @app.after_request
+    def record_response_metrics(response):
+        route = g.get('metrics_route')
+        if route is None:
+            return response
+        labels = (('route', route), ('method', request.method), ('status', str(response.status_code)))
+        registry.increment('momo_http_requests_total', labels)
+        g.metrics_recorded = True
+        size = response.content_length
+        if size is None and not response.is_streamed and not response.direct_passthrough:
+            size = len(response.get_data())
+        if size is not None:
+            registry.observe('momo_http_response_size_bytes', (('route', route),), size, SIZE_BUCKETS)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        route = g.pop('metrics_route', None)
+        if route is None:
+            return
+        labels = (('route', route),)
+        registry.observe('momo_http_request_duration_seconds', labels + (('method', request.method),),
+                         time.perf_counter() - g.pop('metrics_start'))
+        registry.add_gauge('momo_http_requests_in_flight', labels, -1)
+        if not g.pop('metrics_recorded', False):
+            registry.increment('momo_http_requests_total',
+                               labels + (('method', request.method), ('status', '500')))
+
+        timings = _request_timings.get() or {}
+        _request_timings.reset(g.pop('metrics_token'))
+        for kind, name in (('db', 'momo_db_time_seconds'), ('render', 'momo_render_time_seconds'),
+                           ('serialize', 'momo_serialization_time_seconds')):
+            if kind in timings:
+                registry.observe(name, labels, timings[kind])
+
+    def start_render(sender, template, context, **extra):
+        g.metrics_render_start = time.perf_counter()
+
+    def finish_render(sender, template, context, **extra):
+        start = g.pop('metrics_render_start', None)
+        if start is not None:
+            _add_timing('render', time.perf_counter() - start)
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
+
+    # Time JSON serialization done by jsonify()
+    json_response = app.json.response
+
+    def timed_json_response(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return json_response(*args, **kwargs)
+        finally:
+            _add_timing('serialize', time.perf_counter() - start)
+
+    app.json.response = timed_json_response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    return registry
@@ -6,6 +6,8 @@ import re
 import json
 import os
 
+from memprofile import profile_stage
+
 # Constants for table names and their corresponding search strings
 TABLE_CONFIG = {
     'incoming_money': 'You have received',
@@ -315,9 +317,11 @@ def export_to_json(data, filename="data/airtime_payments.json"):
 
 def main():
     xml_file = 'sms.xml'
-    root = parse_xml(xml_file)
+    with profile_stage('parse_xml'):
+        root = parse_xml(xml_file)
     if root is not None:
-        sms_data = extract_sms_data(root)
+        with profile_stage('extract_sms_data'):
+            sms_data = extract_sms_data(root)
         for table, messages in sms_data.items():
             print(f"Table: {table}")
             for message in messages:
@@ -0,0 +1,86 @@
+import base64
+import json
+import logging
+import sqlite3
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(date, row_key):
+    """Encode the position after a row as an opaque, URL-safe cursor."""
+    raw = json.dumps([date, row_key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by ``encode_cursor``; returns ``None`` if invalid."""
+    if not cursor:
+        return None
+    try:
+        date, row_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(date), int(row_key)
+    except (ValueError, TypeError):
+        logging.warning(f"Ignoring invalid page cursor: {cursor}")
+        return None
+
+
+def clamp_page_size(limit, default=DEFAULT_PAGE_SIZE):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def fetch_rows_page(conn, table_name, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of a transaction table, newest first.
+
+    Uses keyset pagination on ``(date, rowid)`` so every page is an index
+    range scan regardless of how deep the user has scrolled. Returns
+    ``{'rows': [...], 'next_cursor': str or None}``.
+    """
+    limit = clamp_page_size(limit)
+    position = decode_cursor(cursor)
+
+    if position is None:
+        query = f"""
+        SELECT rowid AS row_key, * FROM {table_name}
+        ORDER BY date DESC, rowid DESC
+        LIMIT ?
+        """
+        params = (limit + 1,)
+    else:
+        query = f"""
+        SELECT rowid AS row_key, * FROM {table_name}
+        WHERE (date, rowid) < (?, ?)
+        ORDER BY date DESC, rowid DESC
+        LIMIT ?
+        """
+        params = (*position, limit + 1)
+
+    rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor(rows[-1]['date'], rows[-1]['row_key'])
+    for row in rows:
+        row.pop('row_key', None)
+
+    return {'rows': rows, 'next_cursor': next_cursor}
+
+
+def ensure_date_indexes(conn, tables):
+    """
+    Create the ``date`` indexes the page queries rely on, skipping tables
+    that do not exist. Safe to call on every start-up.
+    """
+    for table in tables:
+        try:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_date ON {table} (date)")
+        except sqlite3.Error as e:
+            logging.warning(f"Could not create date index on {table}: {e}")
+    conn.commit()
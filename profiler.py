@@ -0,0 +1,239 @@
+"""
+SQL statement profiler
+
+``ProfiledConnection`` is a connection factory whose cursors time every
+statement from ``execute`` until its rows are exhausted (or the cursor is
+reused or closed) and count the rows returned. Statistics are kept per
+normalized statement, with literals replaced by ``?``. Statements slower
+than ``MOMO_SLOW_QUERY_MS`` are logged with their parameters, row count
+and ``EXPLAIN QUERY PLAN`` output. ``query_profiler.top_statements()``
+ranks statements by total time.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from metrics import TimedConnection, TimedCursor
+
+SLOW_QUERY_MS = float(os.environ.get('MOMO_SLOW_QUERY_MS', '100'))
+PROFILER_ENABLED = os.environ.get('MOMO_QUERY_PROFILER', '1') != '0'
+MAX_STATEMENTS = 1000
+MAX_PARAM_LENGTH = 200
+
+logger = logging.getLogger('momo.sql')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals so equivalent statements group together."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class StatementStats:
+    __slots__ = ('sql', 'calls', 'total_time', 'max_time', 'rows', 'slow_calls', 'plan')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.slow_calls = 0
+        self.plan = None
+
+    def to_dict(self):
+        return {
+            'sql': self.sql,
+            'calls': self.calls,
+            'total_ms': round(self.total_time * 1000, 3),
+            'average_ms': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0,
+            'max_ms': round(self.max_time * 1000, 3),
+            'rows': self.rows,
+            'slow_calls': self.slow_calls,
+            'plan': self.plan
+        }
+
+
+class QueryProfiler:
+    """Aggregated timings per normalized statement."""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, max_statements=MAX_STATEMENTS):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._normalized = {}
+
+    def normalize(self, sql):
+        normalized = self._normalized.get(sql)
+        if normalized is None:
+            normalized = normalize_sql(sql)
+            if len(self._normalized) < self.max_statements * 4:
+                self._normalized[sql] = normalized
+        return normalized
+
+    def record(self, connection, sql, params, elapsed, rows):
+        normalized = self.normalize(sql)
+        slow = elapsed >= self.slow_query_seconds
+        with self._lock:
+            stats = self._statements.get(normalized)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    return
+                stats = self._statements[normalized] = StatementStats(normalized)
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.rows += rows
+            if slow:
+                stats.slow_calls += 1
+            capture_plan = slow and stats.plan is None
+        if slow:
+            plan = explain(connection, sql, params) if capture_plan else stats.plan
+            if capture_plan:
+                stats.plan = plan
+            logger.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms, {rows} rows): {normalized} "
+                f"params={_format_params(params)} plan={plan}")
+
+    def top_statements(self, limit=20, order='total'):
+        key = {
+            'total': lambda stats: stats.total_time,
+            'average': lambda stats: stats.total_time / stats.calls if stats.calls else 0,
+            'max': lambda stats: stats.max_time,
+            'calls': lambda stats: stats.calls
+        }[order]
+        with self._lock:
+            ranked = sorted(self._statements.values(), key=key, reverse=True)[:limit]
+            return [stats.to_dict() for stats in ranked]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+
+def _format_params(params):
+    text = repr(params)
+    return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + '...'
+
+
+def explain(connection, sql, params):
+    """``EXPLAIN QUERY PLAN`` details for ``sql``, or ``None`` if it cannot be explained."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+        return None
+    try:
+        # A plain cursor, so explaining is not itself profiled
+        cursor = sqlite3.Cursor(connection)
+        cursor.row_factory = None
+        rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+        cursor.close()
+        return [row[3] for row in rows]
+    except sqlite3.Error as e:
+        logger.debug(f"Could not explain query: {e}")
+        return None
+
+
+query_profiler = QueryProfiler()
+
+
+class ProfiledCursor(TimedCursor):
+    """
+    Cursor that reports each statement to ``query_profiler`` once its
+    rows have been consumed, the cursor is reused or it is closed.
+    """
+
+    _statement = None
+
+    def _finish(self):
+        statement = self._statement
+        if statement is not None:
+            self._statement = None
+            sql, params, elapsed, rows = statement
+            query_profiler.record(self.connection, sql, params, elapsed, rows)
+
+    def _track(self, start, rows=0, exhausted=False):
+        if self._statement is not None:
+            sql, params, elapsed, counted = self._statement
+            self._statement = (sql, params, elapsed + time.perf_counter() - start, counted + rows)
+            if exhausted:
+                self._finish()
+
+    def execute(self, sql, parameters=(), /):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        finally:
+            self._statement = (sql, parameters, time.perf_counter() - start, 0)
+        if self.description is None:
+            # Statements that return no rows are complete once executed
+            self._statement = self._statement[:3] + (max(self.rowcount, 0),)
+            self._finish()
+        return result
+
+    def executemany(self, sql, seq_of_parameters, /):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            query_profiler.record(self.connection, sql, None, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._track(start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        self._track(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._track(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._track(start, 0, True)
+            raise
+        self._track(start, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except (sqlite3.Error, AttributeError):
+            pass
+
+
+class ProfiledConnection(TimedConnection):
+    """Connection factory whose cursors are profiled (and timed for /metrics)."""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = ProfiledCursor if PROFILER_ENABLED else TimedCursor
+        return super().cursor(factory)
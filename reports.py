@@ -0,0 +1,204 @@
+"""
+Parallel, incremental data summary reports
+
+The per-table work of a report is fanned out over a thread pool, each
+worker holding its own read-only connection. Every table entry carries a
+fingerprint (its highest rowid, a constant-time lookup); when the
+previous report for the same database has an entry with the same
+fingerprint it is reused instead of recomputed. Reports are written to a
+temporary file and moved into place, so readers never see a partial file.
+
+Generate reports for one or more databases with:
+
+    python reports.py [database.db ...]
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES, get_table_summary
+
+EXPORT_FILE = 'data_summary_export.json'
+REPORT_WORKERS = int(os.environ.get('MOMO_REPORT_WORKERS', '8'))
+
+
+class ReadConnections:
+    """One read-only connection per worker thread, closed together."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+def table_fingerprint(conn, table_name):
+    """
+    Highest rowid of ``table_name``, read from the end of the table's
+    b-tree without scanning it. Transaction tables are append-only (ingest
+    uses INSERT OR IGNORE and nothing updates rows), so any new row changes it.
+    """
+    row = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()
+    return list(row)
+
+
+def load_previous_report(output_path):
+    try:
+        with open(output_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_report_atomically(report, output_path):
+    """Write ``report`` as JSON next to ``output_path`` and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.report-', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _summarize_table(connections, table_name, previous):
+    conn = connections.get()
+    try:
+        fingerprint = table_fingerprint(conn, table_name)
+    except sqlite3.Error as e:
+        logging.warning(f"Could not summarize {table_name} in {connections.db_path}: {e}")
+        return table_name, None, False
+    if previous and previous.get('fingerprint') == fingerprint:
+        return table_name, previous, True
+    summary = get_table_summary(table_name, conn=conn)
+    if summary is None:
+        return table_name, None, False
+    return table_name, {'fingerprint': fingerprint, 'summary': summary}, False
+
+
+def build_distribution(entries):
+    total_transactions = sum(entry['summary']['total_transactions'] for entry in entries.values())
+    total_volume = sum(entry['summary']['total_amount'] for entry in entries.values())
+    distribution = {}
+    for table, entry in entries.items():
+        count = entry['summary']['total_transactions']
+        volume = entry['summary']['total_amount']
+        distribution[table] = {
+            'count': count,
+            'volume': volume,
+            'table_display_name': table.replace('_', ' ').title(),
+            'count_percentage': (count / total_transactions * 100) if total_transactions > 0 else 0,
+            'volume_percentage': (volume / total_volume * 100) if total_volume > 0 else 0
+        }
+    totals = {'total_transactions': total_transactions, 'total_volume': total_volume}
+    return distribution, totals
+
+
+def generate_report(db_path=DATABASE_NAME, output_path=EXPORT_FILE, tables=None, executor=None, progress=None):
+    """
+    Build the data summary report for ``db_path`` and write it to
+    ``output_path``. Pass a shared ``executor`` to run several databases
+    on one pool, and ``progress(done, total)`` to follow the tables as
+    they finish.
+    """
+    tables = tables or TRANSACTION_TABLES
+    previous_report = load_previous_report(output_path) or {}
+    if previous_report.get('database_file') != db_path:
+        previous_report = {}
+    previous_tables = previous_report.get('table_entries', {})
+
+    connections = ReadConnections(db_path)
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(REPORT_WORKERS, len(tables))))
+    try:
+        futures = [
+            executor.submit(_summarize_table, connections, table, previous_tables.get(table))
+            for table in tables
+        ]
+        entries = {}
+        reused = 0
+        for done, future in enumerate(futures, 1):
+            table, entry, was_reused = future.result()
+            if entry is not None:
+                entries[table] = entry
+                reused += was_reused
+            if progress is not None:
+                progress(done, len(futures))
+    finally:
+        if own_executor:
+            executor.shutdown()
+        connections.close()
+
+    distribution, totals = build_distribution(entries)
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'database_file': db_path,
+        'tables': {table: entry['summary'] for table, entry in entries.items()},
+        'overall_stats': totals,
+        'transaction_distribution': distribution,
+        'table_entries': entries
+    }
+    write_report_atomically(report, output_path)
+    logging.info(f"Exported data summary for {db_path}: {len(entries) - reused} tables computed, {reused} reused")
+    return report
+
+
+def generate_reports(db_paths, workers=REPORT_WORKERS):
+    """
+    Generate reports for several databases. Databases are processed
+    concurrently and all of their per-table work shares one thread pool.
+    """
+    def run(db_path):
+        try:
+            return generate_report(db_path, report_path_for(db_path), executor=table_pool)
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Error generating report for {db_path}: {e}")
+            return {'error': str(e)}
+
+    db_paths = list(db_paths)
+    with ThreadPoolExecutor(max_workers=workers) as table_pool, \
+            ThreadPoolExecutor(max_workers=max(1, min(workers, len(db_paths)))) as report_pool:
+        return dict(zip(db_paths, report_pool.map(run, db_paths)))
+
+
+def report_path_for(db_path):
+    if db_path == DATABASE_NAME:
+        return EXPORT_FILE
+    stem = os.path.splitext(db_path)[0]
+    return f"{stem}_summary_export.json"
+
+
+if __name__ == '__main__':
+    results = generate_reports(sys.argv[1:] or [DATABASE_NAME])
+    for path, report in results.items():
+        status = report.get('error') or f"{report['overall_stats']['total_transactions']} transactions"
+        print(f"{path}: {status}")
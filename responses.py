@@ -0,0 +1,105 @@
+import gzip
+import json
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional; when it is not installed we fall back to the stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html')
+MIN_COMPRESS_SIZE = 1024
+COMPRESS_LEVEL = 6
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Compact JSON provider that uses orjson when available.
+
+    Used by ``jsonify`` and by the ``tojson`` template filter. Output is
+    never pretty-printed, even when the app runs in debug mode.
+    """
+
+    compact = True
+    sort_keys = False
+    ensure_ascii = False
+
+    def _orjson_dumps(self, obj, default=None, sort_keys=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default or self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and 'indent' not in kwargs and 'cls' not in kwargs:
+            try:
+                return self._orjson_dumps(
+                    obj, kwargs.get('default'), kwargs.get('sort_keys', self.sort_keys)).decode('utf-8')
+            except TypeError:
+                # Values orjson cannot encode (e.g. integers above 64 bits)
+                pass
+        kwargs.setdefault('separators', (',', ':'))
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            try:
+                body = self._orjson_dumps(obj)
+                return self._app.response_class(body, mimetype=self.mimetype)
+            except TypeError:
+                pass
+        return self._app.response_class(self.dumps(obj), mimetype=self.mimetype)
+
+
+def _accepts_gzip():
+    # Quality-aware, so "gzip;q=0" refuses gzip and "*" accepts it
+    return request.accept_encodings['gzip'] > 0
+
+
+def compress_response(response, min_size=MIN_COMPRESS_SIZE, level=COMPRESS_LEVEL):
+    """
+    Gzip-compress a JSON or HTML response when the client accepts it and
+    the body is larger than ``min_size`` bytes.
+    """
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if (not 200 <= response.status_code < 300
+            or response.status_code == 204
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or not _accepts_gzip()):
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_responses(app, min_size=MIN_COMPRESS_SIZE, level=COMPRESS_LEVEL):
+    """
+    Install the compact JSON provider and response compression on ``app``.
+    Must be called before the first template is rendered.
+    """
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, min_size, level)
+
+    return app
@@ -0,0 +1,261 @@
+"""
+Account-sharded storage
+
+With ``MOMO_SHARD_DIR`` set, data is split into one SQLite file per
+account group (``shard_000.db`` ... in that directory); an account is
+routed to its group by a stable hash, and ``MOMO_SHARD_COUNT`` groups
+are used (set it to the number of accounts for one shard per account).
+Without it everything lives in the single ``MOMO_DB_PATH`` database.
+
+The shard for the current request or job is kept in a context variable
+so connection helpers pick it up without extra arguments. Aggregates
+that span accounts run on every shard in parallel and the partial
+results are merged.
+
+Print the shard for an account (e.g. to ingest a backup into it):
+
+    MOMO_DB_PATH=$(python shards.py 250788123456) python db.py
+"""
+
+import contextvars
+import glob
+import logging
+import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from db import DATABASE_NAME
+from counterparties import normalize_name
+from log_config import sampled
+
+SHARD_DIR = os.environ.get('MOMO_SHARD_DIR')
+SHARD_COUNT = int(os.environ.get('MOMO_SHARD_COUNT', '16'))
+FAN_OUT_WORKERS = int(os.environ.get('MOMO_FAN_OUT_WORKERS', '8'))
+# Cache/shard key for results aggregated over every shard
+ALL_SHARDS = '*'
+
+current_shard = contextvars.ContextVar('current_shard', default=None)
+
+
+def normalize_account(account):
+    """Strip whitespace and a leading '+' so an account always routes to the same shard."""
+    return ''.join(str(account).split()).lstrip('+')
+
+
+class ShardRouter:
+    """Maps accounts to shard database files."""
+
+    def __init__(self, shard_dir=SHARD_DIR, shard_count=SHARD_COUNT, default_path=DATABASE_NAME):
+        self.shard_dir = shard_dir
+        self.shard_count = max(1, shard_count)
+        self.default_path = default_path
+
+    @property
+    def sharded(self):
+        return bool(self.shard_dir)
+
+    def shard_path(self, index):
+        return os.path.join(self.shard_dir, f"shard_{index:03d}.db")
+
+    def shard_for(self, account):
+        """Database path holding ``account``'s data."""
+        if not self.sharded:
+            return self.default_path
+        key = normalize_account(account).encode('utf-8')
+        return self.shard_path(zlib.crc32(key) % self.shard_count)
+
+    def all_shards(self):
+        """Every existing shard, or the single database when not sharded."""
+        if not self.sharded:
+            return [self.default_path]
+        return sorted(glob.glob(os.path.join(self.shard_dir, 'shard_*.db')))
+
+
+router = ShardRouter()
+
+
+def current_db_path():
+    """Database path for the shard bound to the current context."""
+    return current_shard.get() or router.default_path
+
+
+@contextmanager
+def use_shard(db_path):
+    """Bind ``db_path`` as the current shard for the duration of the block."""
+    token = current_shard.set(db_path)
+    try:
+        yield db_path
+    finally:
+        current_shard.reset(token)
+
+
+def fan_out(function, shards=None, workers=FAN_OUT_WORKERS):
+    """
+    Call ``function(db_path)`` for every shard in parallel, with that shard
+    bound as the current one, and return the results in shard order.
+    """
+    shards = list(shards if shards is not None else router.all_shards())
+    if len(shards) == 1:
+        with use_shard(shards[0]):
+            return [function(shards[0])]
+
+    def run(db_path):
+        with use_shard(db_path):
+            return function(db_path)
+
+    # Each task runs in a copy of the caller's context so request-scoped state carries over
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards)))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run, db_path) for db_path in shards]
+        results = [future.result() for future in futures]
+    name = getattr(function, '__name__', 'query')
+    if sampled(f'shards.fan_out.{name}'):
+        logging.info(f"Fanned out {name} over {len(shards)} shards")
+    return results
+
+
+def merge_table_summaries(partials):
+    """
+    Merge per-shard ``summaries.get_table_summary`` results for one table
+    into a single summary; ``None`` partials (missing tables) are skipped.
+    """
+    partials = [partial for partial in partials if partial]
+    if not partials:
+        return None
+    merged = dict(partials[0])
+    for partial in partials[1:]:
+        merged['total_transactions'] += partial['total_transactions']
+        merged['total_amount'] += partial['total_amount']
+        if partial['total_transactions']:
+            if merged['total_transactions'] == partial['total_transactions']:
+                merged['min_amount'] = partial['min_amount']
+                merged['max_amount'] = partial['max_amount']
+            else:
+                merged['min_amount'] = min(merged['min_amount'], partial['min_amount'])
+                merged['max_amount'] = max(merged['max_amount'], partial['max_amount'])
+        for key, pick in (('earliest_date', min), ('latest_date', max)):
+            dates = [date for date in (merged.get(key), partial.get(key)) if date]
+            merged[key] = pick(dates) if dates else None
+        if 'total_fees' in partial:
+            merged['total_fees'] = merged.get('total_fees', 0) + partial['total_fees']
+    count = merged['total_transactions']
+    merged['average_amount'] = round(merged['total_amount'] / count, 2) if count else 0
+    return merged
+
+
+def merge_summary_maps(partials):
+    """Merge per-shard ``summaries.summarize_tables`` results table by table."""
+    tables = []
+    for partial in partials:
+        for table in partial:
+            if table not in tables:
+                tables.append(table)
+    return {
+        table: merge_table_summaries([partial.get(table) for partial in partials])
+        for table in tables
+    }
+
+
+def merge_daily_totals(partials):
+    """
+    Merge per-shard ``summaries.get_daily_totals`` (or
+    ``charts.get_volume_buckets``) results by date or bucket.
+    """
+    days = {}
+    for partial in partials:
+        for point in partial or []:
+            day = days.setdefault(point['date'], {'date': point['date'], 'count': 0, 'amount': 0})
+            day['count'] += point['count']
+            day['amount'] += point['amount']
+    return [days[date] for date in sorted(days, key=lambda date: (date is None, date))]
+
+
+def merge_date_spans(partials):
+    """Merge per-shard ``charts.get_date_span`` results into the overall first and last dates."""
+    firsts = [partial['first'] for partial in partials if partial and partial['first']]
+    lasts = [partial['last'] for partial in partials if partial and partial['last']]
+    return {'first': min(firsts) if firsts else None, 'last': max(lasts) if lasts else None}
+
+
+def merge_row_pages(partials, limit):
+    """
+    Combine the first page of rows from every shard into one page, newest
+    first. Shards have independent rowids, so no cursor is returned.
+    """
+    rows = [row for partial in partials for row in partial['rows']]
+    rows.sort(key=lambda row: row.get('date') or '', reverse=True)
+    return {'rows': rows[:limit], 'next_cursor': None}
+
+
+
+def merge_fee_groups(partials):
+    """Concatenate per-shard ``fees.collect_fee_groups`` results table by table."""
+    merged = {}
+    for partial in partials:
+        for table, rows in partial.items():
+            merged.setdefault(table, []).extend(rows)
+    return merged
+
+
+def merge_sketch_maps(partials):
+    """Merge per-shard ``sketches.load_sketches`` results; sketches of one table are combined."""
+    merged = {}
+    for partial in partials:
+        for table, sketch in partial.items():
+            if table in merged:
+                merged[table].merge(sketch)
+            else:
+                merged[table] = sketch
+    return merged
+
+
+def merge_counterparty_rankings(partials, key, limit):
+    """
+    Merge complete per-shard ``counterparties.get_top_counterparties``
+    rankings by normalized name and keep the top ``limit`` by ``key``.
+    Counterparty ids are per shard, so merged entries have none.
+    """
+    merged = {}
+    for partial in partials:
+        for entry in partial:
+            name = normalize_name(entry['name'])
+            total = merged.get(name)
+            if total is None:
+                merged[name] = dict(entry, id=None)
+                continue
+            total['transactions'] += entry['transactions']
+            total['total_amount'] += entry['total_amount']
+            for field, pick in (('first_date', min), ('last_date', max)):
+                dates = [date for date in (total[field], entry[field]) if date]
+                total[field] = pick(dates) if dates else None
+    ranking = sorted(merged.values(), key=lambda entry: (-entry[key], entry['name']))
+    return ranking[:limit]
+
+
+def merge_counterparty_lookups(partials, limit):
+    """
+    Merge per-shard ``counterparties.get_counterparty_transactions``
+    results into one newest-first list; ``None`` when no shard knows the name.
+    """
+    found = [partial for partial in partials if partial]
+    if not found:
+        return None
+    return {
+        'id': None,
+        'name': found[0]['name'],
+        'transactions': merge_recent([partial['transactions'] for partial in found], limit)
+    }
+
+def merge_recent(partials, limit):
+    """Concatenate per-shard row lists and keep the ``limit`` newest by ``date``."""
+    rows = [row for partial in partials for row in partial or []]
+    rows.sort(key=lambda row: row.get('date') or '', reverse=True)
+    return rows[:limit]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python shards.py <account>")
+        sys.exit(1)
+    print(router.shard_for(sys.argv[1]))
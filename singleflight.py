@@ -0,0 +1,96 @@
+"""
+Single-flight coalescing of identical concurrent computations
+
+When many clients ask for the same expensive result at the same moment
+(a shared dashboard opened by a whole team, or every open tab refreshing
+after an ingest invalidated the cache), only the first caller for a key
+computes it. Callers that arrive while that computation is in flight
+wait for it and get the same result.
+
+Results the caller marks as not shareable, such as ``{'error': ...}`` from
+a query interrupted because the first client disconnected, are not handed
+to the waiters. They start a new flight instead. A waiter that has waited
+``MOMO_SINGLEFLIGHT_WAIT_SECONDS`` computes the result itself.
+"""
+
+import logging
+import os
+import threading
+
+WAIT_SECONDS = float(os.environ.get('MOMO_SINGLEFLIGHT_WAIT_SECONDS', '120'))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.shared = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time and shares its result with concurrent callers."""
+
+    def __init__(self, wait_seconds=WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def do(self, key, compute, share=None):
+        """
+        Return ``compute()`` for ``key``, or the result of the computation
+        already running for it. ``share(result)`` decides whether a result
+        may be given to the callers waiting on it (default: always).
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.leaders += 1
+                else:
+                    flight.waiters += 1
+            if leader:
+                return self._lead(key, flight, compute, share)
+
+            if not flight.done.wait(self.wait_seconds):
+                with self._lock:
+                    self.timeouts += 1
+                logging.warning(f"Gave up waiting {self.wait_seconds}s for an in-flight computation of {key!r}")
+                return compute()
+            if flight.shared:
+                with self._lock:
+                    self.coalesced += 1
+                return flight.result
+            # The leader's result was not shareable: run a new flight
+            with self._lock:
+                self.retries += 1
+
+    def _lead(self, key, flight, compute, share):
+        try:
+            flight.result = compute()
+            flight.shared = share is None or share(flight.result)
+            return flight.result
+        finally:
+            # An exception leaves the flight unshared, so waiters retry
+            with self._lock:
+                del self._flights[key]
+                waiters = flight.waiters
+            flight.done.set()
+            if waiters and flight.shared:
+                logging.debug(f"Shared one computation of {key!r} with {waiters} waiting callers")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'computations': self.leaders,
+                'coalesced': self.coalesced,
+                'retries': self.retries,
+                'timeouts': self.timeouts
+            }
@@ -0,0 +1,514 @@
+"""
+Mergeable streaming sketches per transaction category
+
+Each category keeps, per day, per month and for all time, a t-digest of
+amounts (p50/p90/p99) and HyperLogLog counters of distinct senders and
+recipients. Sketches are updated at ingest time and merged on read (a
+date range uses whole months plus the days at its edges), so percentile
+and cardinality queries cost the same no matter how many transactions
+are stored.
+
+The app rebuilds the sketches of any table whose stored count does not
+match its rows when it opens a database. Rebuild them all from the
+current tables with:
+
+    python sketches.py
+"""
+
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+import sys
+
+# NumPy is optional; without it HyperLogLog registers are merged in pure Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from db import DATABASE_NAME
+from summaries import TRANSACTION_TABLES, get_table_columns
+
+SKETCH_TABLE = 'category_sketches'
+# Monthly rollups, so a date range merges whole months plus the days at its edges
+MONTH_SKETCH_TABLE = 'category_sketch_months'
+ALL_DAYS = '*'
+QUANTILES = (0.5, 0.9, 0.99)
+DIGEST_COMPRESSION = 200
+
+AMOUNT_COLUMNS = ('amount', 'amount_received', 'payment_amount', 'amount_transferred',
+                  'amount_paid', 'transaction_amount')
+SENDER_COLUMNS = ('sender', 'sender_name', 'transaction_initiator')
+RECIPIENT_COLUMNS = ('recipient_name', 'recipient', 'recipient_number', 'agent_name',
+                     'party_name', 'bank_name')
+
+
+def first_value(record, columns):
+    for column in columns:
+        value = record.get(column)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+class TDigest:
+    """
+    Merging t-digest for streaming quantile estimates.
+
+    Centroid sizes follow the k1 (arcsine) scale function, which keeps
+    them small near both tails, where p90/p99 live; roughly
+    ``compression`` centroids are kept.
+    """
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.centroids = []
+        self.total_weight = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        value = float(value)
+        self._buffer.append((value, weight))
+        self.total_weight += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        # Digests stored with a smaller compression are upgraded as they merge
+        self.compression = max(self.compression, other.compression)
+        self._buffer.extend((mean, weight) for mean, weight in other.centroids)
+        self.total_weight += other.total_weight
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    @classmethod
+    def merge_all(cls, digests):
+        """Merge many digests at once: their centroids are pooled and compressed a single time."""
+        merged = cls(max((digest.compression for digest in digests), default=DIGEST_COMPRESSION))
+        for digest in digests:
+            merged._buffer.extend(digest.centroids)
+            merged._buffer.extend(digest._buffer)
+            merged.total_weight += digest.total_weight
+            merged.min = min(merged.min, digest.min)
+            merged.max = max(merged.max, digest.max)
+        merged._compress()
+        return merged
+
+    def _k(self, q):
+        # k1 scale: a centroid may span one unit of k
+        return self.compression / math.pi * math.asin(2 * q - 1)
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged = [list(points[0])]
+        weight_so_far = 0
+        k_lower = self._k(0)
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            q_upper = (weight_so_far + current[1] + weight) / total
+            if self._k(min(q_upper, 1)) - k_lower <= 1:
+                new_weight = current[1] + weight
+                current[0] += (mean - current[0]) * weight / new_weight
+                current[1] = new_weight
+            else:
+                weight_so_far += current[1]
+                k_lower = self._k(weight_so_far / total)
+                merged.append([mean, weight])
+        self.centroids = [tuple(centroid) for centroid in merged]
+
+    def quantile(self, q):
+        """
+        Estimate the value at quantile ``q`` (0..1); ``None`` if empty.
+
+        Interpolates between the centers of neighbouring centroids. A
+        centroid of weight one is an exact sample, and the outer halves of
+        the first and last centroids are interpolated towards min and max.
+        """
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        index = q * self.total_weight
+        if index < 1:
+            return self.min
+        if index >= self.total_weight - 1:
+            return self.max
+
+        first_mean, first_weight = self.centroids[0]
+        if first_weight > 2 and index < first_weight / 2:
+            return self.min + (first_mean - self.min) * (index - 1) / (first_weight / 2 - 1)
+
+        # Cumulative weight at the center of the left centroid
+        weight_so_far = first_weight / 2
+        for (left_mean, left_weight), (right_mean, right_weight) in zip(self.centroids, self.centroids[1:]):
+            gap = (left_weight + right_weight) / 2
+            if weight_so_far + gap > index:
+                offset = index - weight_so_far
+                if left_weight == 1 and offset < 0.5:
+                    return left_mean
+                if right_weight == 1 and gap - offset <= 0.5:
+                    return right_mean
+                left_unit = 0.5 if left_weight == 1 else 0
+                right_unit = 0.5 if right_weight == 1 else 0
+                fraction = (offset - left_unit) / (gap - left_unit - right_unit)
+                return left_mean + (right_mean - left_mean) * fraction
+            weight_so_far += gap
+
+        last_mean, last_weight = self.centroids[-1]
+        if last_weight > 2:
+            return last_mean + (self.max - last_mean) * (index - weight_so_far) / (last_weight / 2 - 1)
+        return self.max
+
+    def to_dict(self):
+        self._compress()
+        return {
+            'compression': self.compression,
+            'centroids': [[mean, weight] for mean, weight in self.centroids],
+            'min': self.min if self.centroids else None,
+            'max': self.max if self.centroids else None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data.get('compression', DIGEST_COMPRESSION))
+        digest.centroids = [(mean, weight) for mean, weight in data.get('centroids', [])]
+        digest.total_weight = sum(weight for _, weight in digest.centroids)
+        if digest.centroids:
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2 ** precision`` registers."""
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        remaining = (hashed << self.precision) & ((1 << 64) - 1)
+        rank = (64 - self.precision + 1) if remaining == 0 else (65 - remaining.bit_length())
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @classmethod
+    def merge_all(cls, counters, precision=12):
+        """Merge many counters at once, taking each register's maximum in a single pass."""
+        if not counters:
+            return cls(precision)
+        if len(counters) == 1:
+            return cls(counters[0].precision, counters[0].registers)
+        if np is not None:
+            stacked = np.frombuffer(b''.join(counter.registers for counter in counters), dtype=np.uint8)
+            registers = stacked.reshape(len(counters), -1).max(axis=0).tobytes()
+        else:
+            registers = bytes(map(max, *(counter.registers for counter in counters)))
+        return cls(counters[0].precision, registers)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        return cls(precision, data)
+
+
+class CategorySketch:
+    """Amount digest and distinct sender/recipient counters for one bucket."""
+
+    def __init__(self, digest=None, senders=None, recipients=None, count=0):
+        self.digest = digest or TDigest()
+        self.senders = senders or HyperLogLog()
+        self.recipients = recipients or HyperLogLog()
+        self.count = count
+
+    def observe(self, record):
+        amount = first_value(record, AMOUNT_COLUMNS)
+        if amount is not None:
+            try:
+                self.digest.add(float(amount))
+            except (TypeError, ValueError):
+                pass
+        sender = first_value(record, SENDER_COLUMNS)
+        if sender is not None:
+            self.senders.add(sender)
+        recipient = first_value(record, RECIPIENT_COLUMNS)
+        if recipient is not None:
+            self.recipients.add(recipient)
+        self.count += 1
+
+    def merge(self, other):
+        self.digest.merge(other.digest)
+        self.senders.merge(other.senders)
+        self.recipients.merge(other.recipients)
+        self.count += other.count
+        return self
+
+    @classmethod
+    def merge_all(cls, sketches):
+        """Merge many sketches, e.g. the daily rows of a date range, with one pass per component."""
+        return cls(
+            TDigest.merge_all([sketch.digest for sketch in sketches]),
+            HyperLogLog.merge_all([sketch.senders for sketch in sketches]),
+            HyperLogLog.merge_all([sketch.recipients for sketch in sketches]),
+            sum(sketch.count for sketch in sketches))
+
+    def summary(self):
+        percentiles = {f"p{round(q * 100)}": self.digest.quantile(q) for q in QUANTILES}
+        return {
+            'transactions': self.count,
+            'amount_percentiles': {
+                name: round(value, 2) if value is not None else None
+                for name, value in percentiles.items()
+            },
+            'distinct_senders': self.senders.count(),
+            'distinct_recipients': self.recipients.count()
+        }
+
+
+def ensure_sketch_table(conn):
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+            table_name TEXT,
+            day TEXT,
+            count INTEGER,
+            digest TEXT,
+            senders BLOB,
+            recipients BLOB,
+            PRIMARY KEY (table_name, day)
+        );
+        CREATE TABLE IF NOT EXISTS {MONTH_SKETCH_TABLE} (
+            table_name TEXT,
+            month TEXT,
+            count INTEGER,
+            digest TEXT,
+            senders BLOB,
+            recipients BLOB,
+            PRIMARY KEY (table_name, month)
+        );
+    """)
+
+
+def _load_sketch(row):
+    return CategorySketch(
+        TDigest.from_dict(json.loads(row['digest'])),
+        HyperLogLog.from_bytes(row['senders']),
+        HyperLogLog.from_bytes(row['recipients']),
+        row['count'])
+
+
+class SketchStore:
+    """
+    Ingest observer that accumulates sketches in memory and merges them
+    into the stored per-day, per-month and all-time rows on ``flush``.
+    """
+
+    # Stored sketch table -> its period column
+    PERIOD_COLUMNS = {SKETCH_TABLE: 'day', MONTH_SKETCH_TABLE: 'month'}
+
+    def __init__(self):
+        self._pending = {}
+
+    def observe(self, table_name, record, rowid=None):
+        day = str(record.get('date') or '')[:10] or None
+        if day is None:
+            return
+        keys = [(SKETCH_TABLE, table_name, day), (SKETCH_TABLE, table_name, ALL_DAYS)]
+        if len(day) == 10:
+            keys.append((MONTH_SKETCH_TABLE, table_name, day[:7]))
+        for key in keys:
+            sketch = self._pending.get(key)
+            if sketch is None:
+                sketch = self._pending[key] = CategorySketch()
+            sketch.observe(record)
+
+    def flush(self, conn):
+        if not self._pending:
+            return
+        previous_factory = conn.row_factory
+        conn.row_factory = sqlite3.Row
+        try:
+            ensure_sketch_table(conn)
+            for (sketch_table, table_name, period), sketch in self._pending.items():
+                column = self.PERIOD_COLUMNS[sketch_table]
+                row = conn.execute(
+                    f"SELECT * FROM {sketch_table} WHERE table_name = ? AND {column} = ?",
+                    (table_name, period)).fetchone()
+                if row is not None:
+                    sketch = _load_sketch(row).merge(sketch)
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {sketch_table} "
+                    f"(table_name, {column}, count, digest, senders, recipients) VALUES (?, ?, ?, ?, ?, ?)",
+                    (table_name, period, sketch.count, json.dumps(sketch.digest.to_dict()),
+                     sketch.senders.to_bytes(), sketch.recipients.to_bytes()))
+            conn.commit()
+            logging.info(f"Flushed {len(self._pending)} category sketches")
+            self._pending = {}
+        finally:
+            conn.row_factory = previous_factory
+
+
+def build_sketches(conn, tables):
+    """Rebuild the stored sketches for ``tables`` from their current rows."""
+    ensure_sketch_table(conn)
+    previous_factory = conn.row_factory
+    conn.row_factory = sqlite3.Row
+    try:
+        for table in tables:
+            try:
+                rows = conn.execute(f"SELECT * FROM {table}")
+            except sqlite3.Error as e:
+                logging.warning(f"Skipping sketches for {table}: {e}")
+                continue
+            conn.execute(f"DELETE FROM {SKETCH_TABLE} WHERE table_name = ?", (table,))
+            conn.execute(f"DELETE FROM {MONTH_SKETCH_TABLE} WHERE table_name = ?", (table,))
+            store = SketchStore()
+            for row in rows:
+                store.observe(table, dict(row))
+            store.flush(conn)
+        conn.commit()
+    finally:
+        conn.row_factory = previous_factory
+
+
+def sync_sketches(conn, tables=None):
+    """
+    Rebuild the sketches of tables whose all-time or monthly sketches are
+    missing or do not count the table's dated rows (rows stored before
+    sketches existed, or loaded without the ingest observers). Returns the
+    tables that were rebuilt.
+    """
+    tables = tables or TRANSACTION_TABLES
+    ensure_sketch_table(conn)
+    columns = get_table_columns(conn, tables)
+    stored = dict(conn.execute(
+        f"SELECT table_name, count FROM {SKETCH_TABLE} WHERE day = ?", (ALL_DAYS,)))
+    stored_months = dict(conn.execute(
+        f"SELECT table_name, SUM(count) FROM {MONTH_SKETCH_TABLE} GROUP BY table_name"))
+    stale = []
+    for table in tables:
+        if 'date' not in columns.get(table, []):
+            continue
+        # SketchStore skips rows without a date, and rolls up only full YYYY-MM-DD days
+        dated, full_days = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(length(substr(date, 1, 10)) = 10), 0) FROM {table} "
+            f"WHERE date IS NOT NULL AND date != ''").fetchone()
+        if stored.get(table, 0) != dated or stored_months.get(table, 0) != full_days:
+            stale.append(table)
+    if stale:
+        build_sketches(conn, stale)
+        logging.info(f"Rebuilt category sketches for {len(stale)} tables")
+    return stale
+
+
+def _whole_months(start_day, end_day, month):
+    """SQL condition for months (``month`` expression) lying entirely within the day range."""
+    conditions, params = [], []
+    if start_day:
+        conditions.append(f"{month} || '-01' >= ?")
+        params.append(start_day)
+    if end_day:
+        conditions.append(f"{month} || '-31' <= ?")
+        params.append(end_day)
+    return ' AND '.join(conditions), params
+
+
+def load_sketches(conn, table_name=None, start_day=None, end_day=None):
+    """
+    Return ``{table: CategorySketch}`` for one category (or all categories)
+    over an optional inclusive day range. Without a range the stored
+    all-time sketches are used, so the cost does not depend on history; a
+    range reads the monthly rollups it covers completely and daily rows
+    only for the partial months at its edges.
+    """
+    table_condition = 'table_name = ?' if table_name else '1'
+    table_params = [table_name] if table_name else []
+    if not (start_day or end_day):
+        queries = [(f"SELECT * FROM {SKETCH_TABLE} WHERE {table_condition} AND day = ?",
+                    table_params + [ALL_DAYS])]
+    else:
+        months, month_params = _whole_months(start_day, end_day, 'month')
+        day_months, day_month_params = _whole_months(start_day, end_day, 'substr(day, 1, 7)')
+        day_conditions, day_params = ['day != ?'], [ALL_DAYS]
+        if start_day:
+            day_conditions.append('day >= ?')
+            day_params.append(start_day)
+        if end_day:
+            day_conditions.append('day <= ?')
+            day_params.append(end_day)
+        # Days of the whole months come from the rollups; the two sets never overlap
+        day_conditions.append(f"NOT (length(day) = 10 AND {day_months})")
+        queries = [
+            (f"SELECT * FROM {MONTH_SKETCH_TABLE} WHERE {table_condition} AND {months}",
+             table_params + month_params),
+            (f"SELECT * FROM {SKETCH_TABLE} WHERE {table_condition} AND {' AND '.join(day_conditions)}",
+             table_params + day_params + day_month_params),
+        ]
+
+    previous_factory = conn.row_factory
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = {}
+        for query, params in queries:
+            for row in conn.execute(query, params):
+                rows.setdefault(row['table_name'], []).append(_load_sketch(row))
+        return {table: CategorySketch.merge_all(sketches) for table, sketches in rows.items()}
+    finally:
+        conn.row_factory = previous_factory
+
+
+def summarize_sketches(categories, start_day=None, end_day=None):
+    """Percentiles and distinct counts per category and overall from ``load_sketches`` output."""
+    combined = CategorySketch.merge_all(list(categories.values()))
+
+    return {
+        'start_day': start_day,
+        'end_day': end_day,
+        'categories': {name: sketch.summary() for name, sketch in sorted(categories.items())},
+        'overall': combined.summary()
+    }
+
+
+def get_sketch_summary(conn, table_name=None, start_day=None, end_day=None):
+    """Percentiles and distinct counts for one category (or all categories); see ``load_sketches``."""
+    return summarize_sketches(load_sketches(conn, table_name, start_day, end_day), start_day, end_day)
+
+
+if __name__ == '__main__':
+    tables = sys.argv[1:] or TRANSACTION_TABLES
+    with sqlite3.connect(DATABASE_NAME) as conn:
+        build_sketches(conn, tables)
+    print(f"Rebuilt sketches for {len(tables)} tables")
@@ -0,0 +1,189 @@
+"""
+Query-backed analytics for transaction tables
+
+Pushes the grouping behind the stats endpoints into SQLite so that only
+aggregate rows come back to Python: transactions are grouped per day
+over a covering index and rolled up into monthly and weekday breakdowns,
+sender counts use GROUP BY on the sender column and the largest
+transactions use ORDER BY amount DESC LIMIT 5 over an index. Output
+matches helpers.analyze_incoming_money_transactions.
+"""
+
+import logging
+import sqlite3
+from datetime import date, datetime
+
+from analytics import SENDER_COLUMNS, TOP_SENDERS, TOP_TRANSACTIONS, WEEKDAYS
+
+
+def get_column_names(conn, table_name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+def amount_column(columns):
+    """Name of the amount column among a table's ``columns``."""
+    return 'amount_received' if 'amount_received' in columns else 'amount'
+
+
+def _sender_column(columns):
+    return next((column for column in SENDER_COLUMNS if column in columns), None)
+
+
+def ensure_analytics_indexes(conn, tables):
+    """
+    Create the indexes the pushed-down queries use: ``(date, amount)`` so
+    monthly/weekday aggregates scan a covering index, ``(amount)`` for the
+    top-N query and ``(sender, amount)`` for per-sender counts.
+    """
+    for table in tables:
+        try:
+            columns = get_column_names(conn, table)
+            if not columns:
+                continue
+            amount = amount_column(columns)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_date_{amount} ON {table} (date, {amount})")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{amount} ON {table} ({amount})")
+            sender = _sender_column(columns)
+            if sender:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{sender} ON {table} ({sender}, {amount})")
+        except sqlite3.Error as e:
+            logging.warning(f"Could not create analytics indexes on {table}: {e}")
+    conn.commit()
+
+
+def get_totals(conn, table_name, amount):
+    query = f"""
+    SELECT COUNT(*) AS total_transactions, COALESCE(SUM({amount}), 0) AS total_amount
+    FROM {table_name}
+    """
+    return conn.execute(query).fetchone()
+
+
+def get_final_balance(conn, table_name, columns):
+    if 'new_balance' not in columns:
+        return None
+    row = conn.execute(f"SELECT new_balance FROM {table_name} ORDER BY rowid DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def get_day_groups(conn, table_name, amount):
+    """
+    Per-calendar-day count, amount and first/last timestamp, grouped
+    inside SQLite over the ``(date, amount)`` covering index.
+    """
+    query = f"""
+    SELECT substr(date, 1, 10) AS day, COUNT(*) AS count, COALESCE(SUM({amount}), 0) AS amount,
+           MIN(date) AS first_date, MAX(date) AS last_date
+    FROM {table_name}
+    WHERE date IS NOT NULL
+    GROUP BY day
+    """
+    return [tuple(row) for row in conn.execute(query)]
+
+
+def rollup_day_groups(day_groups):
+    """
+    Roll per-day groups up into the date range and the monthly and
+    weekday breakdowns. Days that are not valid calendar dates are
+    skipped. Work is proportional to the number of days, not rows.
+    """
+    monthly = {}
+    weekdays = {}
+    earliest = latest = None
+    for day, count, amount, first_date, last_date in sorted(day_groups):
+        try:
+            weekday = date.fromisoformat(day).weekday()
+        except ValueError:
+            continue
+        first_date = first_date.replace('T', ' ')
+        last_date = last_date.replace('T', ' ')
+        earliest = first_date if earliest is None else min(earliest, first_date)
+        latest = last_date if latest is None else max(latest, last_date)
+
+        month = monthly.setdefault(day[:7], {'count': 0, 'amount': 0})
+        month['count'] += count
+        month['amount'] += amount
+        weekday_totals = weekdays.setdefault(weekday, {'count': 0, 'amount': 0})
+        weekday_totals['count'] += count
+        weekday_totals['amount'] += amount
+
+    daily = {WEEKDAYS[i]: weekdays[i] for i in sorted(weekdays)}
+    return earliest, latest, monthly, daily
+
+
+def get_transactions_per_sender(conn, table_name, columns, limit=TOP_SENDERS):
+    """
+    Return ``(unique_senders, {sender: count})`` for the ``limit`` most
+    frequent senders; ties keep first-seen order.
+    """
+    sender = _sender_column(columns)
+    if sender is None:
+        total = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        return (1, {'Unknown': total}) if total else (0, {})
+
+    # Group on the bare column so SQLite can walk the (sender, amount) index
+    query = f"""
+    SELECT {sender} AS sender, COUNT(*) AS count, MIN(rowid) AS first_seen
+    FROM {table_name}
+    GROUP BY {sender}
+    ORDER BY count DESC, first_seen
+    LIMIT ?
+    """
+    top = {}
+    for name, count, _ in conn.execute(query, (limit + 1,)):
+        name = 'Unknown' if name is None else name
+        top[name] = top.get(name, 0) + count
+    top = dict(sorted(top.items(), key=lambda item: item[1], reverse=True)[:limit])
+
+    distinct, has_null = conn.execute(
+        f"SELECT COUNT(DISTINCT {sender}), COALESCE(MAX({sender} IS NULL), 0) FROM {table_name}").fetchone()
+    return distinct + has_null, top
+
+
+def get_largest_transactions(conn, table_name, amount, limit=TOP_TRANSACTIONS):
+    query = f"""
+    SELECT * FROM {table_name}
+    ORDER BY {amount} DESC, rowid
+    LIMIT ?
+    """
+    previous_factory = conn.row_factory
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute(query, (limit,))]
+    finally:
+        conn.row_factory = previous_factory
+
+
+def analyze_table_sql(conn, table_name):
+    """
+    Analyze a transaction table with aggregate queries; memory and time
+    scale with the number of groups rather than the number of rows.
+    """
+    columns = get_column_names(conn, table_name)
+    if not columns:
+        return {'error': f'No such table: {table_name}'}
+    amount = amount_column(columns)
+
+    totals = get_totals(conn, table_name, amount)
+    total_transactions = totals[0]
+    if not total_transactions:
+        return {'error': 'No data provided'}
+    total_amount = totals[1]
+    earliest, latest, monthly, daily = rollup_day_groups(get_day_groups(conn, table_name, amount))
+    unique_senders, per_sender = get_transactions_per_sender(conn, table_name, columns)
+
+    results = {
+        'total_transactions': total_transactions,
+        'total_amount_received': total_amount,
+        'average_amount': round(total_amount / total_transactions, 2) if total_transactions > 0 else 0,
+        'final_balance': get_final_balance(conn, table_name, columns),
+        'earliest_transaction_date': earliest,
+        'latest_transaction_date': latest,
+        'unique_senders': unique_senders,
+        'transactions_per_sender': per_sender,
+        'largest_transactions': get_largest_transactions(conn, table_name, amount),
+        'monthly_breakdown': monthly,
+        'daily_patterns': daily,
+        'analysis_timestamp': datetime.now().isoformat()
+    }
+    return results
@@ -0,0 +1,157 @@
+import sqlite3
+import logging
+
+from db import DATABASE_NAME
+from log_config import sampled
+
+TRANSACTION_TABLES = [
+    'airtime_payments',
+    'incoming_money',
+    'transfers_to_mobile_numbers',
+    'payments_to_code_holders',
+    'bank_transfers',
+    'bundle_purchases',
+    'cashpower_payments',
+    'third_party_transactions',
+    'withdrawals_from_agents'
+]
+
+
+def get_table_columns(conn, tables):
+    """
+    Return ``{table: [column, ...]}`` for the given tables that exist,
+    using a single query over ``pragma_table_info``.
+    """
+    placeholders = ', '.join(['?'] * len(tables))
+    query = f"""
+    SELECT m.name AS table_name, p.name AS column_name
+    FROM sqlite_master m
+    JOIN pragma_table_info(m.name) p
+    WHERE m.type = 'table' AND m.name IN ({placeholders})
+    ORDER BY m.name, p.cid
+    """
+    columns = {}
+    for row in conn.execute(query, list(tables)):
+        columns.setdefault(row[0], []).append(row[1])
+    return columns
+
+
+def _table_select(table_name, columns):
+    fee_expr = 'COALESCE(SUM(fee), 0)' if 'fee' in columns else 'NULL'
+    return f"""
+    SELECT
+        '{table_name}' AS table_name,
+        COUNT(*) AS total_transactions,
+        COALESCE(SUM(amount), 0) AS total_amount,
+        COALESCE(AVG(amount), 0) AS average_amount,
+        COALESCE(MIN(amount), 0) AS min_amount,
+        COALESCE(MAX(amount), 0) AS max_amount,
+        MIN(date) AS earliest_date,
+        MAX(date) AS latest_date,
+        {fee_expr} AS total_fees
+    FROM {table_name}"""
+
+
+def build_summary_query(table_columns):
+    """
+    Build one compound ``UNION ALL`` query that summarizes every table in
+    ``table_columns``.
+    """
+    return '\nUNION ALL'.join(
+        _table_select(table, columns) for table, columns in table_columns.items()
+    )
+
+
+def _row_to_summary(row, has_fee):
+    summary = {
+        'table_name': row['table_name'],
+        'total_transactions': row['total_transactions'],
+        'total_amount': row['total_amount'],
+        'average_amount': round(row['average_amount'], 2),
+        'min_amount': row['min_amount'],
+        'max_amount': row['max_amount'],
+        'earliest_date': row['earliest_date'],
+        'latest_date': row['latest_date']
+    }
+    if has_fee:
+        summary['total_fees'] = row['total_fees']
+    return summary
+
+
+def summarize_tables(tables=None, conn=None, db_path=DATABASE_NAME):
+    """
+    Summarize several transaction tables in one query on one connection.
+
+    Returns ``{table_name: summary}`` in the order of ``tables``; tables
+    that do not exist or cannot be read map to ``None``.
+    """
+    tables = list(tables or TRANSACTION_TABLES)
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+
+        table_columns = get_table_columns(conn, tables)
+        # Only tables that have the columns the summary needs can be combined
+        table_columns = {
+            table: table_columns[table] for table in tables
+            if table in table_columns
+            and {'amount', 'date'}.issubset(table_columns[table])
+        }
+
+        summaries = {table: None for table in tables}
+        if table_columns:
+            for row in conn.execute(build_summary_query(table_columns)):
+                table = row['table_name']
+                summaries[table] = _row_to_summary(row, 'fee' in table_columns[table])
+
+        count = sampled('summaries.summarize_tables')
+        if count:
+            logging.info(f"Generated summaries for {len(table_columns)} tables in one query ({count} so far)")
+        return summaries
+
+    except sqlite3.Error as e:
+        logging.error(f"Error summarizing tables {tables}: {e}")
+        return {table: None for table in tables}
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+
+
+def get_table_summary(table_name, conn=None, db_path=DATABASE_NAME):
+    """
+    Get summary statistics (count, sum, avg, min, max, fee total and date
+    range) for a single transaction table.
+    """
+    return summarize_tables([table_name], conn=conn, db_path=db_path)[table_name]
+
+
+def get_daily_totals(table_name, conn=None, db_path=DATABASE_NAME):
+    """
+    Return ``[{'date', 'count', 'amount'}, ...]`` per calendar day, oldest
+    first, aggregated inside SQLite.
+    """
+    query = f"""
+    SELECT
+        substr(date, 1, 10) AS day,
+        COUNT(*) AS count,
+        COALESCE(SUM(amount), 0) AS amount
+    FROM {table_name}
+    GROUP BY day
+    ORDER BY day
+    """
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = sqlite3.connect(db_path)
+        return [
+            {'date': day, 'count': count, 'amount': amount}
+            for day, count, amount in conn.execute(query)
+        ]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting daily totals for {table_name}: {e}")
+        return []
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
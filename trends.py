@@ -0,0 +1,231 @@
+"""
+Rolling-window trend engine for transaction tables
+
+Keeps hourly buckets (count and amount) per table in memory and derives
+daily, weekly and monthly series from them. The first refresh of a table
+aggregates it inside SQLite; later refreshes do nothing until the
+database's data version changes and then only read rows whose rowid is
+above the last one seen, so appending data never rescans history.
+"""
+
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from db import DATABASE_NAME
+from cache import DataVersion
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+DEFAULT_PERIODS = {'hour': 48, 'day': 30, 'week': 26, 'month': 12}
+DEFAULT_WINDOW = 7
+MAX_PERIODS = 5000
+
+HOUR_FORMAT = '%Y-%m-%d %H'
+
+
+def _bucket_start(moment, granularity):
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _label(start, granularity):
+    if granularity == 'hour':
+        return start.strftime('%Y-%m-%d %H:00')
+    if granularity == 'month':
+        return start.strftime('%Y-%m')
+    return start.strftime('%Y-%m-%d')
+
+
+class TableTrendState:
+    """Hourly buckets for one table plus the high-water mark of rows read."""
+
+    def __init__(self):
+        self.hours = {}
+        self.last_rowid = 0
+        # (date, amount) of the row at last_rowid, to notice a rewritten table
+        self.tail = None
+        # Data version of the database when the buckets were last brought up to date
+        self.version = None
+        # Day/week/month buckets rolled up from the hours, kept current by ``add``
+        self.rollups = {}
+
+    def add(self, hour_key, count, amount):
+        for granularity, buckets in [('hour', self.hours)] + list(self.rollups.items()):
+            key = hour_key if granularity == 'hour' else _bucket_start(hour_key, granularity)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [count, amount]
+            else:
+                bucket[0] += count
+                bucket[1] += amount
+
+
+class TrendEngine:
+    """
+    Produces hourly, daily, weekly and monthly series with rolling sums,
+    moving averages and period-over-period deltas, refreshed incrementally.
+    """
+
+    def __init__(self, db_path=DATABASE_NAME):
+        self.db_path = db_path
+        self._states = {}
+        self._lock = threading.Lock()
+        self._data_version = DataVersion(db_path)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _load(self, conn, table_name, state, after_rowid):
+        # Hour keys are built in SQL so only one row per hour comes back
+        query = f"""
+        SELECT substr(replace(date, 'T', ' '), 1, 13) AS hour,
+               COUNT(*) AS count,
+               COALESCE(SUM(amount), 0) AS amount,
+               MAX(rowid) AS last_rowid
+        FROM {table_name}
+        WHERE rowid > ? AND date IS NOT NULL
+        GROUP BY hour
+        """
+        loaded = 0
+        for hour, count, amount, last_rowid in conn.execute(query, (after_rowid,)):
+            try:
+                hour_key = datetime.strptime(hour, HOUR_FORMAT)
+            except (TypeError, ValueError):
+                continue
+            state.add(hour_key, count, amount)
+            state.last_rowid = max(state.last_rowid, last_rowid)
+            loaded += count
+        return loaded
+
+    def _tail(self, conn, table_name, rowid):
+        return conn.execute(f"SELECT date, amount FROM {table_name} WHERE rowid = ?", (rowid,)).fetchone()
+
+    def refresh(self, table_name, conn=None):
+        """
+        Bring the table's buckets up to date. Nothing is read while the
+        database's data version is unchanged; after a commit only rows
+        appended since the last refresh are read. A table whose last seen
+        row is gone or changed (truncated or reloaded) is rebuilt.
+        """
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            with self._lock:
+                version = self._data_version.current()
+                state = self._states.get(table_name)
+                if state is not None and state.version == version:
+                    return state
+
+                # Both lookups are single b-tree probes, not scans
+                max_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+                if (state is None or max_rowid < state.last_rowid
+                        or self._tail(conn, table_name, state.last_rowid) != state.tail):
+                    state = TableTrendState()
+                    self._load(conn, table_name, state, 0)
+                    self._states[table_name] = state
+                    logging.info(f"Built trend buckets for {table_name}: {len(state.hours)} hours")
+                elif max_rowid > state.last_rowid:
+                    self._load(conn, table_name, state, state.last_rowid)
+                state.last_rowid = max(state.last_rowid, max_rowid)
+                state.tail = self._tail(conn, table_name, state.last_rowid)
+                state.version = version
+                return state
+        finally:
+            if own_conn:
+                conn.close()
+
+    def _buckets(self, state, granularity):
+        if granularity == 'hour':
+            return state.hours
+        buckets = state.rollups.get(granularity)
+        if buckets is not None:
+            return buckets
+        buckets = {}
+        for hour, (count, amount) in state.hours.items():
+            start = _bucket_start(hour, granularity)
+            bucket = buckets.get(start)
+            if bucket is None:
+                buckets[start] = [count, amount]
+            else:
+                bucket[0] += count
+                bucket[1] += amount
+        state.rollups[granularity] = buckets
+        return buckets
+
+    def series(self, table_name, granularity='day', periods=None, window=DEFAULT_WINDOW, end=None, conn=None):
+        """
+        Return the last ``periods`` buckets of ``granularity`` ending at
+        ``end`` (default: the latest bucket with data), gap-filled with zeros.
+        Each point carries a rolling sum and moving average over ``window``
+        buckets and the change against the previous bucket.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        periods = max(1, min(int(periods or DEFAULT_PERIODS[granularity]), MAX_PERIODS))
+        window = max(1, int(window))
+
+        state = self.refresh(table_name, conn)
+        with self._lock:
+            # Buckets are shared with later refreshes, so only read them under the lock
+            buckets = self._buckets(state, granularity)
+            if not buckets:
+                return {'table_name': table_name, 'granularity': granularity, 'window': window, 'points': []}
+            last = _bucket_start(end, granularity) if end else max(buckets)
+        # Walk back far enough to fill the first point's rolling window
+        starts = [last]
+        while len(starts) < periods + window:
+            previous = _bucket_start(starts[-1] - timedelta(seconds=1), granularity)
+            starts.append(previous)
+        starts.reverse()
+
+        points = []
+        amounts = []
+        rolling_sum = 0
+        for start in starts:
+            count, amount = buckets.get(start, (0, 0))
+            amounts.append(amount)
+            rolling_sum += amount
+            if len(amounts) > window:
+                rolling_sum -= amounts[-window - 1]
+            previous_amount = amounts[-2] if len(amounts) > 1 else None
+            delta = amount - previous_amount if previous_amount is not None else None
+            points.append({
+                'period': _label(start, granularity),
+                'count': count,
+                'amount': amount,
+                'rolling_sum': rolling_sum,
+                'moving_average': round(rolling_sum / min(window, len(amounts)), 2),
+                'delta': delta,
+                'delta_percentage': round(delta / previous_amount * 100, 2) if previous_amount else None
+            })
+
+        return {
+            'table_name': table_name,
+            'granularity': granularity,
+            'window': window,
+            'points': points[-periods:]
+        }
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def trend_engine_for(db_path):
+    """The trend engine for one database; each shard keeps its own buckets."""
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = _engines[db_path] = TrendEngine(db_path)
+        return engine
+
+
+trend_engine = trend_engine_for(DATABASE_NAME)